@@ -0,0 +1,107 @@
+"""
+Pickup-date availability per local body.
+
+Booked counts for a date window come from one annotated query and are
+cached per local body under a version stamp. The stamp is bumped whenever
+a booking or calendar entry of that local body changes, so a booking is
+visible to the next request.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.dateparse import parse_date
+
+from .models import CustomerPickupDate
+from super_admin_dashboard.models import LocalBodyCalendar
+
+
+VERSION_KEY = "availability:{localbody_id}:version"
+DATA_KEY = "availability:{localbody_id}:{version}:{start}:{end}"
+CACHE_SECONDS = 300
+DEFAULT_WINDOW_DAYS = 62
+MAX_WINDOW_DAYS = 124
+
+
+def default_capacity():
+    """Bookings allowed per date when its PickupSlot sets no limit (None = unlimited)"""
+    return getattr(settings, "PICKUP_DATE_CAPACITY", None)
+
+
+def _parse_day(raw):
+    try:
+        return parse_date((raw or "")[:10])
+    except ValueError:
+        # Well-formed but impossible, e.g. 2025-02-30
+        return None
+
+
+def parse_window(start_raw, end_raw, today):
+    """FullCalendar sends ISO datetimes; only the date part matters. Invalid dates use the default window."""
+    start = _parse_day(start_raw) or today
+    end = _parse_day(end_raw) or start + timedelta(days=DEFAULT_WINDOW_DAYS)
+    if end < start:
+        start, end = end, start
+    return start, min(end, start + timedelta(days=MAX_WINDOW_DAYS))
+
+
+def _version(localbody_id):
+    key = VERSION_KEY.format(localbody_id=localbody_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex[:12], None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_availability(*localbody_ids):
+    for localbody_id in set(localbody_ids):
+        if localbody_id:
+            cache.set(VERSION_KEY.format(localbody_id=localbody_id), uuid.uuid4().hex[:12], None)
+
+
+def get_availability(localbody_id, start, end):
+    """[{id, date, booked, capacity, remaining}] for calendar entries in [start, end)"""
+    key = DATA_KEY.format(
+        localbody_id=localbody_id, version=_version(localbody_id), start=start.isoformat(), end=end.isoformat()
+    )
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    fallback = default_capacity()
+    rows = LocalBodyCalendar.objects.filter(
+        localbody_id=localbody_id, date__gte=start, date__lt=end
+    ).values("id", "date", "slot__capacity").annotate(booked=Count("customerpickupdate")).order_by("date")
+
+    data = []
+    for row in rows:
+        capacity = row["slot__capacity"] if row["slot__capacity"] is not None else fallback
+        data.append({
+            "id": row["id"],
+            "date": row["date"].isoformat(),
+            "booked": row["booked"],
+            "capacity": capacity,
+            "remaining": max(capacity - row["booked"], 0) if capacity is not None else None,
+        })
+    cache.set(key, data, CACHE_SECONDS)
+    return data
+
+
+@receiver(post_save, sender=CustomerPickupDate)
+@receiver(post_delete, sender=CustomerPickupDate)
+def invalidate_on_booking(sender, instance, **kwargs):
+    localbody_id = LocalBodyCalendar.objects.filter(
+        pk=instance.localbody_calendar_id
+    ).values_list("localbody_id", flat=True).first()
+    invalidate_availability(localbody_id)
+
+
+@receiver(post_save, sender=LocalBodyCalendar)
+@receiver(post_delete, sender=LocalBodyCalendar)
+def invalidate_on_calendar_change(sender, instance, **kwargs):
+    invalidate_availability(instance.localbody_id)
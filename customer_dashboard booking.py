@@ -0,0 +1,131 @@
+from django.db import transaction
+
+from .availability import invalidate_availability
+from .models import CustomerPickupDate, CustomerWasteInfo
+from super_admin_dashboard.capacity import join_waitlist, promote_waitlist, release, reserve, reserve_many
+from super_admin_dashboard.models import LocalBodyCalendar
+from waste_collector_dashboard.manifest import invalidate_manifests
+from waste_collector_dashboard.sync import record_profiles
+
+
+MAX_BOOKINGS = 4
+
+BOOKED = "booked"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+WAITLISTED = "waitlisted"
+
+
+def parse_date_ids(raw, limit=MAX_BOOKINGS):
+    """Turn a comma separated 'selected_date' value into a list of unique calendar ids"""
+    date_ids = []
+    for id_str in (raw or "").split(','):
+        id_str = id_str.strip()
+        if id_str.isdigit() and int(id_str) not in date_ids:
+            date_ids.append(int(id_str))
+    return date_ids[:limit]
+
+
+def book_pickup_dates(user, waste_info, date_ids, replace=False):
+    """
+    Book calendar dates for a waste profile.
+
+    Calendar ids are resolved with one query, compared against the user's
+    existing bookings as a set and written with a single bulk_create.
+    With replace=True the profile's current pickup dates are dropped first,
+    inside the same transaction, as long as at least one requested id exists.
+    New bookings take their places through capacity.reserve_many(), which
+    needs one conditional UPDATE per date (two when the ward is limited) on
+    top of those queries; dates that are full put the profile on that
+    date's waitlist instead.
+
+    Returns one result per requested id, in order:
+        {"id": 12, "date": "2025-01-31", "status": "booked" | "duplicate" | "invalid" | "waitlisted"}
+    """
+    date_ids = list(dict.fromkeys(date_ids))
+
+    with transaction.atomic():
+        calendars = LocalBodyCalendar.objects.in_bulk(date_ids) if date_ids else {}
+        if replace and calendars:
+            CustomerPickupDate.objects.filter(waste_info=waste_info).delete()
+
+        already_booked = set(
+            CustomerPickupDate.objects.filter(
+                user=user,
+                localbody_calendar_id__in=calendars.keys()
+            ).values_list("localbody_calendar_id", flat=True)
+        ) if calendars else set()
+
+        reserved = reserve_many(
+            [pk for pk in date_ids if pk in calendars and pk not in already_booked], waste_info.ward
+        )
+        results = []
+        to_create = []
+        for date_id in date_ids:
+            cal = calendars.get(date_id)
+            if cal is None:
+                results.append({"id": date_id, "date": None, "status": INVALID})
+                continue
+            if date_id in already_booked:
+                status = DUPLICATE
+            elif date_id not in reserved:
+                status = WAITLISTED
+                join_waitlist(user, waste_info, date_id)
+            else:
+                status = BOOKED
+                to_create.append(CustomerPickupDate(
+                    user=user,
+                    waste_info=waste_info,
+                    localbody_calendar=cal
+                ))
+            results.append({"id": date_id, "date": cal.date.isoformat(), "status": status})
+
+        if to_create:
+            CustomerPickupDate.objects.bulk_create(to_create)
+            # bulk_create skips save signals, so refresh availability explicitly
+            localbody_ids = {pickup.localbody_calendar.localbody_id for pickup in to_create}
+            transaction.on_commit(lambda: invalidate_availability(*localbody_ids))
+            invalidate_manifests(waste_info.assigned_collector_id)
+            record_profiles([waste_info.id])
+
+    return results
+
+
+def reschedule_pickup(user, calendar):
+    """
+    Move the user's pickup to another date (or book it if they have none).
+
+    The new date is reserved before the old one is released, all in one
+    transaction, so a full date leaves the current booking untouched.
+    Returns (pickup, status) where pickup is None unless status is BOOKED
+    or DUPLICATE.
+    """
+    with transaction.atomic():
+        pickup = CustomerPickupDate.objects.select_for_update().filter(user=user).order_by("id").first()
+        if pickup and pickup.localbody_calendar_id == calendar.pk:
+            return pickup, DUPLICATE
+
+        waste_info = pickup.waste_info if pickup else (
+            CustomerWasteInfo.objects.filter(user=user).order_by("-id").first()
+        )
+        ward = getattr(waste_info, "ward", None)
+        if not reserve(calendar.pk, ward):
+            join_waitlist(user, waste_info, calendar.pk)
+            return None, WAITLISTED
+
+        localbody_ids = {calendar.localbody_id}
+        if pickup:
+            old_calendar_id = pickup.localbody_calendar_id
+            localbody_ids.add(pickup.localbody_calendar.localbody_id)
+            pickup.localbody_calendar = calendar
+            pickup.save(update_fields=["localbody_calendar"])
+            release(old_calendar_id, ward)
+            transaction.on_commit(lambda: promote_waitlist(old_calendar_id))
+        else:
+            pickup = CustomerPickupDate.objects.create(user=user, waste_info=waste_info, localbody_calendar=calendar)
+        transaction.on_commit(lambda: invalidate_availability(*localbody_ids))
+    return pickup, BOOKED
+
+
+def count_status(results, status):
+    return sum(1 for r in results if r["status"] == status)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from customer_dashboard.location_history import BUCKETS, DEFAULT_KEEP_DAYS, compact_history
+
+
+class Command(BaseCommand):
+    help = "Thin CustomerLocationHistory older than --keep-days to one point per profile per bucket"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-days", type=int, default=DEFAULT_KEEP_DAYS, help="Full-resolution window")
+        parser.add_argument("--bucket", default="day", choices=sorted(BUCKETS), help="Resolution of older history")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the rows that would be deleted")
+
+    def handle(self, *args, **options):
+        if options["keep_days"] < 1:
+            raise CommandError("--keep-days must be at least 1")
+        deleted = compact_history(options["keep_days"], options["bucket"], dry_run=options["dry_run"])
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {deleted} location history rows"))
@@ -0,0 +1,190 @@
+"""
+Spatial index over CustomerWasteInfo locations.
+
+Every profile with coordinates gets a WasteInfoLocation row holding a
+geohash (indexed) and the coordinates as floats. Radius, bounding-box and
+k-nearest queries first select candidate rows by geohash prefix, so only
+the cells around the query are read, then filter them exactly in Python.
+"""
+from math import asin, cos, radians, sin, sqrt
+
+from django.db import models
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import CustomerWasteInfo
+
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_PRECISION = 8
+# Upper bound on geohash cells a single query may touch
+MAX_QUERY_CELLS = 32
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+class WasteInfoLocation(models.Model):
+    waste_info = models.OneToOneField(
+        CustomerWasteInfo, on_delete=models.CASCADE, primary_key=True, related_name="location_index"
+    )
+    geohash = models.CharField(max_length=GEOHASH_PRECISION, db_index=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    def __str__(self):
+        return f"{self.waste_info_id} @ {self.geohash}"
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell"""
+    bits = 5 * precision
+    lng_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def covering_cells(south, west, north, east):
+    """Geohash prefixes covering a bounding box, as fine as MAX_QUERY_CELLS allows"""
+    cells = set()
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = int((north - south) / height) + 2
+        cols = int((east - west) / width) + 2
+        if rows * cols > MAX_QUERY_CELLS and precision > 1:
+            continue
+        lat = south
+        while True:
+            lng = west
+            while True:
+                cells.add(geohash_encode(min(lat, 90.0), min(lng, 180.0), precision))
+                if lng >= east:
+                    break
+                lng = min(lng + width, east)
+            if lat >= north:
+                break
+            lat = min(lat + height, north)
+        return cells
+    return cells
+
+
+def bbox_around(latitude, longitude, radius_km):
+    lat_delta = radius_km / 111.32
+    lng_delta = radius_km / max(111.32 * cos(radians(float(latitude))), 1e-6)
+    return (
+        max(float(latitude) - lat_delta, -90.0),
+        max(float(longitude) - lng_delta, -180.0),
+        min(float(latitude) + lat_delta, 90.0),
+        min(float(longitude) + lng_delta, 180.0),
+    )
+
+
+def _candidates(south, west, north, east, queryset=None):
+    prefix_filter = Q()
+    for cell in covering_cells(south, west, north, east):
+        prefix_filter |= Q(geohash__startswith=cell)
+    locations = WasteInfoLocation.objects.filter(prefix_filter)
+    if queryset is not None:
+        locations = locations.filter(waste_info__in=queryset)
+    return locations.values_list("waste_info_id", "latitude", "longitude")
+
+
+def within_bbox(south, west, north, east, queryset=None):
+    """Ids of profiles inside the bounding box"""
+    return [
+        pk for pk, lat, lng in _candidates(south, west, north, east, queryset)
+        if south <= lat <= north and west <= lng <= east
+    ]
+
+
+def within_radius(latitude, longitude, radius_km, queryset=None):
+    """[(id, distance_km), ...] of profiles within radius_km, nearest first"""
+    results = []
+    for pk, lat, lng in _candidates(*bbox_around(latitude, longitude, radius_km), queryset=queryset):
+        distance = haversine_km(latitude, longitude, lat, lng)
+        if distance <= radius_km:
+            results.append((pk, distance))
+    results.sort(key=lambda r: r[1])
+    return results
+
+
+def nearest(latitude, longitude, k=10, max_radius_km=50.0, queryset=None):
+    """[(id, distance_km), ...] of the k nearest profiles, searching outward up to max_radius_km"""
+    radius = 0.5
+    while True:
+        results = within_radius(latitude, longitude, radius, queryset)
+        if len(results) >= k or radius >= max_radius_km:
+            return results[:k]
+        radius = min(radius * 4, max_radius_km)
+
+
+def index_waste_info(info):
+    if info.latitude is None or info.longitude is None:
+        WasteInfoLocation.objects.filter(waste_info_id=info.pk).delete()
+        return
+    WasteInfoLocation.objects.update_or_create(
+        waste_info_id=info.pk,
+        defaults={
+            "geohash": geohash_encode(info.latitude, info.longitude),
+            "latitude": float(info.latitude),
+            "longitude": float(info.longitude),
+        },
+    )
+
+
+def rebuild_location_index(chunk_size=2000):
+    """Rebuild the whole index, e.g. after bulk imports that bypass save signals"""
+    WasteInfoLocation.objects.all().delete()
+    batch = []
+    rows = CustomerWasteInfo.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).values_list("id", "latitude", "longitude").iterator(chunk_size=chunk_size)
+    total = 0
+    for pk, lat, lng in rows:
+        batch.append(WasteInfoLocation(
+            waste_info_id=pk, geohash=geohash_encode(lat, lng), latitude=float(lat), longitude=float(lng)
+        ))
+        if len(batch) >= chunk_size:
+            WasteInfoLocation.objects.bulk_create(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        WasteInfoLocation.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+@receiver(post_save, sender=CustomerWasteInfo)
+def update_location_index(sender, instance, **kwargs):
+    index_waste_info(instance)
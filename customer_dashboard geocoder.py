@@ -0,0 +1,335 @@
+"""
+Offline geocoding from a local gazetteer.
+
+The gazetteer is built from geotagged CustomerWasteInfo rows (address,
+landmark, pincode, ward and local body names) plus the importable
+PlaceCentroid table of pincode / locality centroids. Queries are matched
+through an inverted token index; tokens not found verbatim are resolved
+to similar vocabulary through a trigram index, so spelling variants and
+typos still match. Results are kept in an LRU cache keyed on the
+normalised address.
+
+The index is never built on the request path. publish_gazetteer() builds
+it from the database and stores it in the shared cache under a new
+version stamp; it runs in the geotag_profiles, import_place_centroids and
+rebuild_gazetteer commands. Web processes keep a copy in memory and load
+the published one when the stamp changes (checked at most every
+LOCAL_CHECK_SECONDS). Profile and place changes only mark the index
+stale, for `rebuild_gazetteer --if-stale` run from cron. Until an index
+has been published, geocode() finds nothing.
+
+The cache backend has to accept large values (Redis, database or file
+cache; memcached's default 1 MB item limit is too small).
+"""
+import math
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from super_admin_dashboard.hierarchy import get_hierarchy
+from super_admin_dashboard.wards import get_ward_registry
+from .models import CustomerWasteInfo
+
+
+VERSION_KEY = "geocoder:version"
+INDEX_KEY = "geocoder:index"
+STALE_KEY = "geocoder:stale"
+LOCAL_CHECK_SECONDS = 5
+LRU_SIZE = 5000
+MIN_TRIGRAM_SIMILARITY = 0.45
+MAX_SIMILAR_TOKENS = 5
+MIN_CONFIDENCE = 0.5
+BATCH_SIZE = 500
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_PINCODE_RE = re.compile(r"\b(\d{6})\b")
+# Common Kerala address abbreviations, so "MG Rd" and "M.G. Road" meet
+ABBREVIATIONS = {
+    "rd": "road", "st": "street", "jn": "junction", "jnc": "junction", "jct": "junction",
+    "nr": "near", "opp": "opposite", "ln": "lane",
+    "hsg": "housing", "clny": "colony", "temp": "temple", "ch": "church", "sch": "school",
+}
+STOPWORDS = {"near", "opposite", "house", "the", "and", "of", "post", "po", "via", "building", "bldg", "no"}
+
+_local = {"version": None, "checked_at": 0.0, "index": None}
+
+
+class PlaceCentroid(models.Model):
+    """Reference point for a pincode or locality, e.g. imported from India Post data"""
+    pincode = models.CharField(max_length=10, blank=True, db_index=True)
+    locality = models.CharField(max_length=200, blank=True)
+    district = models.CharField(max_length=100, blank=True)
+    state = models.CharField(max_length=100, blank=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+
+    class Meta:
+        unique_together = ("pincode", "locality")
+
+    def __str__(self):
+        return f"{self.pincode} {self.locality}"
+
+
+def normalise(text):
+    tokens = []
+    for token in _TOKEN_RE.findall((text or "").lower()):
+        token = ABBREVIATIONS.get(token, token)
+        if token not in STOPWORDS and (len(token) > 1 or token.isdigit()):
+            tokens.append(token)
+    return tokens
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Gazetteer:
+    """Token + trigram index over named points"""
+
+    def __init__(self, entries):
+        # entries: [(tokens, lat, lng, localbody_id, pincode, source)]
+        self.entries = []
+        self.postings = defaultdict(set)
+        self.by_pincode = defaultdict(list)
+        for tokens, lat, lng, localbody_id, pincode, source in entries:
+            idx = len(self.entries)
+            self.entries.append((lat, lng, localbody_id, source, " ".join(tokens)))
+            for token in set(tokens):
+                self.postings[token].add(idx)
+            if pincode:
+                self.by_pincode[pincode].append(idx)
+
+        total = max(len(self.entries), 1)
+        self.idf = {t: math.log(1 + total / len(ids)) for t, ids in self.postings.items()}
+        self.grams = defaultdict(set)
+        for token in self.postings:
+            if not token.isdigit():
+                for gram in trigrams(token):
+                    self.grams[gram].add(token)
+        self.version = None
+        self.lru = OrderedDict()
+        self._lru_lock = threading.Lock()
+
+    def __getstate__(self):
+        # The LRU and its lock stay with the process
+        state = self.__dict__.copy()
+        del state["lru"], state["_lru_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lru = OrderedDict()
+        self._lru_lock = threading.Lock()
+
+    def similar_tokens(self, token):
+        """[(vocab_token, similarity)] for a token, best first"""
+        if token in self.postings:
+            return [(token, 1.0)]
+        if token.isdigit():
+            return []
+        query = trigrams(token)
+        overlap = defaultdict(int)
+        for gram in query:
+            for candidate in self.grams.get(gram, ()):
+                overlap[candidate] += 1
+        scored = []
+        for candidate, shared in overlap.items():
+            similarity = shared / (len(query) + len(trigrams(candidate)) - shared)
+            if similarity >= MIN_TRIGRAM_SIMILARITY:
+                scored.append((candidate, similarity))
+        scored.sort(key=lambda s: -s[1])
+        return scored[:MAX_SIMILAR_TOKENS]
+
+    def _pincode_centroid(self, pincode):
+        ids = self.by_pincode.get(pincode)
+        if not ids:
+            return None
+        lat = sum(self.entries[i][0] for i in ids) / len(ids)
+        lng = sum(self.entries[i][1] for i in ids) / len(ids)
+        return {"latitude": lat, "longitude": lng, "confidence": 0.5, "source": "pincode", "match": pincode}
+
+    def lookup(self, address, pincode=None, localbody_id=None):
+        tokens = normalise(address)
+        if not pincode:
+            found = _PINCODE_RE.search(address or "")
+            pincode = found.group(1) if found else None
+        try:
+            localbody_id = int(localbody_id) if localbody_id else None
+        except (TypeError, ValueError):
+            localbody_id = None
+        key = (" ".join(tokens), pincode or "", localbody_id or "")
+        with self._lru_lock:
+            if key in self.lru:
+                self.lru.move_to_end(key)
+                return self.lru[key]
+        result = self._lookup(tokens, pincode, localbody_id)
+        with self._lru_lock:
+            self.lru[key] = result
+            if len(self.lru) > LRU_SIZE:
+                self.lru.popitem(last=False)
+        return result
+
+    def _lookup(self, tokens, pincode, localbody_id):
+        words = [t for t in tokens if not t.isdigit() or t == pincode]
+        scores = defaultdict(float)
+        possible = 0.0
+        for token in words:
+            matches = self.similar_tokens(token)
+            possible += max((self.idf[m] for m, _ in matches), default=1.0)
+            # An entry scores once per query token, through its best matching variant
+            token_scores = {}
+            for match, similarity in matches:
+                for idx in self.postings[match]:
+                    token_scores[idx] = max(token_scores.get(idx, 0), self.idf[match] * similarity)
+            for idx, score in token_scores.items():
+                scores[idx] += score
+        if localbody_id:
+            scores = {i: s for i, s in scores.items() if self.entries[i][2] in (None, localbody_id)}
+        pincode_ids = set(self.by_pincode.get(pincode, ())) if pincode else set()
+
+        if scores and possible:
+            best = max(scores, key=lambda i: (scores[i] + (1 if i in pincode_ids else 0), -i))
+            confidence = min(scores[best] / possible, 1.0)
+            if pincode_ids and best not in pincode_ids:
+                confidence *= 0.5
+            lat, lng, _, source, text = self.entries[best]
+            if confidence >= MIN_CONFIDENCE or not pincode_ids:
+                return {
+                    "latitude": lat, "longitude": lng, "confidence": round(confidence, 3),
+                    "source": source, "match": text,
+                }
+        if pincode_ids:
+            return self._pincode_centroid(pincode)
+        return None
+
+
+def mark_stale():
+    cache.set(STALE_KEY, True, None)
+
+
+def is_stale():
+    return bool(cache.get(STALE_KEY)) or cache.get(VERSION_KEY) is None
+
+
+def build_gazetteer(chunk_size=2000):
+    localbody_names = {
+        localbody["id"]: localbody["name"]
+        for localbodies in get_hierarchy()["localbodies_by_district"].values()
+        for localbody in localbodies
+    }
+
+    entries = []
+    rows = CustomerWasteInfo.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).values_list(
+        "pickup_address", "landmark", "pincode", "ward", "localbody_id", "latitude", "longitude"
+    ).iterator(chunk_size=chunk_size)
+    for address, landmark, pincode, ward, localbody_id, lat, lng in rows:
+        ward_name = get_ward_registry(localbody_id).name(ward) if ward else ""
+        text = " ".join(p for p in (address, landmark, ward_name, localbody_names.get(localbody_id), pincode) if p)
+        entries.append((normalise(text), float(lat), float(lng), localbody_id, (pincode or "").strip(), "profile"))
+
+    places = PlaceCentroid.objects.values_list(
+        "pincode", "locality", "district", "state", "latitude", "longitude"
+    ).iterator(chunk_size=chunk_size)
+    for pincode, locality, district, state, lat, lng in places:
+        text = " ".join(p for p in (locality, district, state, pincode) if p)
+        entries.append((normalise(text), float(lat), float(lng), None, (pincode or "").strip(), "place"))
+    return Gazetteer(entries)
+
+
+def publish_gazetteer():
+    """Build the index from the database and publish it to every process. Not for the request path."""
+    # Cleared first, so changes made during the build mark it stale again
+    cache.delete(STALE_KEY)
+    gazetteer = build_gazetteer()
+    gazetteer.version = uuid.uuid4().hex[:12]
+    cache.set(INDEX_KEY, gazetteer, None)
+    cache.set(VERSION_KEY, gazetteer.version, None)
+    _local.update(index=gazetteer, version=gazetteer.version, checked_at=time.monotonic())
+    return gazetteer
+
+
+def get_gazetteer():
+    """The published index (loaded from the cache when a new one appears), or None"""
+    now = time.monotonic()
+    if now - _local["checked_at"] >= LOCAL_CHECK_SECONDS:
+        version = cache.get(VERSION_KEY)
+        if version is not None and version != _local["version"]:
+            gazetteer = cache.get(INDEX_KEY)
+            if gazetteer is not None:
+                _local.update(index=gazetteer, version=gazetteer.version)
+        _local["checked_at"] = now
+    return _local["index"]
+
+
+def geocode(address, pincode=None, localbody_id=None):
+    """
+    {latitude, longitude, confidence, source, match} for an address, or None.
+    confidence is the share of the query's (idf-weighted) tokens that matched.
+    """
+    if not (address or pincode):
+        return None
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return None
+    return gazetteer.lookup(address or "", (pincode or "").strip() or None, localbody_id)
+
+
+def _coordinate(value):
+    return Decimal(str(round(value, 6)))
+
+
+def geotag_profiles(queryset=None, min_confidence=MIN_CONFIDENCE, dry_run=False):
+    """
+    Fill in coordinates for profiles without them. Each profile is saved
+    normally so the spatial, map and search indexes follow. Returns
+    (tagged, skipped).
+    """
+    if queryset is None:
+        queryset = CustomerWasteInfo.objects.all()
+    profiles = queryset.filter(latitude__isnull=True).only(
+        "id", "pickup_address", "landmark", "pincode", "localbody_id", "ward", "latitude", "longitude"
+    )
+    gazetteer = publish_gazetteer()
+    tagged = skipped = 0
+    batch = []
+    for info in profiles.iterator(chunk_size=BATCH_SIZE):
+        result = gazetteer.lookup(
+            " ".join(p for p in (info.pickup_address, info.landmark) if p), info.pincode, info.localbody_id
+        )
+        if not result or result["confidence"] < min_confidence:
+            skipped += 1
+            continue
+        info.latitude = _coordinate(result["latitude"])
+        info.longitude = _coordinate(result["longitude"])
+        batch.append(info)
+        tagged += 1
+    if not dry_run:
+        for start in range(0, len(batch), BATCH_SIZE):
+            with transaction.atomic():
+                for info in batch[start:start + BATCH_SIZE]:
+                    # ward too, since it is resolved from the new coordinates on save
+                    info.save(update_fields=["latitude", "longitude", "ward"])
+    return tagged, skipped
+
+
+@receiver(post_save, sender=CustomerWasteInfo)
+def invalidate_on_profile_change(sender, instance, raw=False, **kwargs):
+    if not raw and instance.latitude is not None:
+        mark_stale()
+
+
+@receiver(post_save, sender=PlaceCentroid)
+@receiver(post_delete, sender=PlaceCentroid)
+def invalidate_on_place_change(sender, **kwargs):
+    mark_stale()
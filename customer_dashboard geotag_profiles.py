@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from customer_dashboard.geocoder import MIN_CONFIDENCE, geotag_profiles
+from customer_dashboard.models import CustomerWasteInfo
+
+
+class Command(BaseCommand):
+    help = "Fill in coordinates for waste profiles without them, using the offline geocoder"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--localbody", type=int, help="Only profiles of this local body")
+        parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE)
+        parser.add_argument("--dry-run", action="store_true", help="Only report how many would be tagged")
+
+    def handle(self, *args, **options):
+        profiles = CustomerWasteInfo.objects.all()
+        if options["localbody"]:
+            profiles = profiles.filter(localbody_id=options["localbody"])
+        tagged, skipped = geotag_profiles(
+            profiles, min_confidence=options["min_confidence"], dry_run=options["dry_run"]
+        )
+        verb = "Would tag" if options["dry_run"] else "Tagged"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {tagged} profiles, {skipped} without a confident match"))
@@ -0,0 +1,54 @@
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from customer_dashboard.geocoder import PlaceCentroid, publish_gazetteer
+
+
+class Command(BaseCommand):
+    help = (
+        "Import pincode / locality centroids for the offline geocoder from a CSV "
+        "with columns pincode, locality, district, state, latitude, longitude"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file")
+        parser.add_argument("--replace", action="store_true", help="Delete existing centroids first")
+
+    def handle(self, *args, **options):
+        rows = []
+        skipped = 0
+        try:
+            with open(options["path"], newline="", encoding="utf-8-sig") as f:
+                for row in csv.DictReader(f):
+                    try:
+                        lat = Decimal(row["latitude"]).quantize(Decimal("0.000001"))
+                        lng = Decimal(row["longitude"]).quantize(Decimal("0.000001"))
+                    except (KeyError, TypeError, InvalidOperation):
+                        skipped += 1
+                        continue
+                    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                        skipped += 1
+                        continue
+                    rows.append(PlaceCentroid(
+                        pincode=(row.get("pincode") or "").strip(),
+                        locality=(row.get("locality") or "").strip()[:200],
+                        district=(row.get("district") or "").strip()[:100],
+                        state=(row.get("state") or "").strip()[:100],
+                        latitude=lat,
+                        longitude=lng,
+                    ))
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        with transaction.atomic():
+            if options["replace"]:
+                PlaceCentroid.objects.all().delete()
+            PlaceCentroid.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+        gazetteer = publish_gazetteer()
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(rows)} centroids, skipped {skipped} invalid rows; "
+            f"published a gazetteer of {len(gazetteer.entries)} entries"
+        ))
@@ -0,0 +1,110 @@
+"""
+Write-side filtering and compaction for CustomerLocationHistory.
+
+record_location() skips points closer than LOCATION_HISTORY_MIN_DISTANCE_M
+to the profile's last recorded point, so GPS jitter no longer adds rows.
+compact_history() keeps every point of the recent window and thins older
+ones to the last point per profile per bucket (day / week / month),
+dropping those that did not move more than the threshold either.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .geo import haversine_km
+from .models import CustomerLocationHistory
+
+
+DEFAULT_MIN_DISTANCE_M = 25
+DEFAULT_KEEP_DAYS = 90
+DELETE_BATCH_SIZE = 1000
+BUCKETS = {
+    "day": lambda dt: dt.date(),
+    "week": lambda dt: tuple(dt.isocalendar()[:2]),
+    "month": lambda dt: (dt.year, dt.month),
+}
+
+
+def min_distance_m():
+    return getattr(settings, "LOCATION_HISTORY_MIN_DISTANCE_M", DEFAULT_MIN_DISTANCE_M)
+
+
+def moved_m(lat1, lng1, lat2, lng2):
+    return haversine_km(lat1, lng1, lat2, lng2) * 1000
+
+
+def record_location(info, latitude, longitude, changed_by=None):
+    """Append a history point unless it is within the jitter threshold of the last one"""
+    last = CustomerLocationHistory.objects.filter(waste_info=info).order_by(
+        "-changed_at", "-id"
+    ).values_list("latitude", "longitude").first()
+    if last and moved_m(last[0], last[1], latitude, longitude) < min_distance_m():
+        return None
+    return CustomerLocationHistory.objects.create(
+        waste_info=info,
+        latitude=latitude,
+        longitude=longitude,
+        changed_by=changed_by,
+    )
+
+
+def compact_history(keep_days=DEFAULT_KEEP_DAYS, bucket="day", dry_run=False, chunk_size=5000):
+    """
+    Thin history older than keep_days. Per profile and bucket only the last
+    point survives, and only if it moved at least the jitter threshold from
+    the previous surviving point. The first point of each profile is always
+    kept. Returns the number of rows deleted (or that would be).
+    """
+    bucket_of = BUCKETS[bucket]
+    cutoff = timezone.now() - timedelta(days=keep_days)
+    threshold = min_distance_m()
+
+    rows = CustomerLocationHistory.objects.filter(changed_at__lt=cutoff).order_by(
+        "waste_info_id", "changed_at", "id"
+    ).values_list("id", "waste_info_id", "changed_at", "latitude", "longitude").iterator(chunk_size=chunk_size)
+
+    to_delete = []
+    profile = None
+    kept = None        # (lat, lng) of the last surviving point
+    pending = None     # last point seen in the current bucket, not yet decided
+    pending_bucket = None
+
+    def flush(point):
+        nonlocal kept
+        pk, lat, lng = point
+        if kept is None or moved_m(kept[0], kept[1], lat, lng) >= threshold:
+            kept = (lat, lng)
+        else:
+            to_delete.append(pk)
+
+    for pk, waste_info_id, changed_at, lat, lng in rows:
+        if waste_info_id != profile:
+            if pending:
+                flush(pending)
+            profile, kept, pending, pending_bucket = waste_info_id, None, None, None
+        key = bucket_of(timezone.localtime(changed_at) if timezone.is_aware(changed_at) else changed_at)
+        if kept is None and pending is None:
+            # First point of the profile
+            kept = (lat, lng)
+            pending_bucket = key
+            continue
+        if pending and key == pending_bucket:
+            to_delete.append(pending[0])
+        elif pending:
+            flush(pending)
+        pending, pending_bucket = (pk, lat, lng), key
+    if pending:
+        flush(pending)
+
+    if dry_run:
+        return len(to_delete)
+    # Deleted after the scan so the streaming cursor never sees its own deletes
+    deleted = 0
+    for start in range(0, len(to_delete), DELETE_BATCH_SIZE):
+        with transaction.atomic():
+            deleted += CustomerLocationHistory.objects.filter(
+                id__in=to_delete[start:start + DELETE_BATCH_SIZE]
+            ).delete()[0]
+    return deleted
@@ -0,0 +1,194 @@
+"""
+Pre-aggregated map clusters over CustomerWasteInfo locations.
+
+MapCell holds, for every geohash cell at precisions 1..MAX_CLUSTER_PRECISION
+and every waste type, the number of profiles, their bag total and the sum of
+their coordinates (for a weighted centroid). Rows are adjusted with F()
+deltas whenever a profile's location, bags or waste type changes, so a map
+request only reads the few hundred cells covering its viewport. Above
+POINT_ZOOM individual profiles are returned instead.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .geo import cell_size, covering_cells, geohash_encode, within_bbox
+from .models import CustomerWasteInfo
+from .snapshots import old_profile
+
+
+MAX_CLUSTER_PRECISION = 7
+POINT_ZOOM = 16
+MAX_POINTS = 2000
+BATCH_SIZE = 1000
+
+
+class MapCell(models.Model):
+    precision = models.PositiveSmallIntegerField()
+    cell = models.CharField(max_length=MAX_CLUSTER_PRECISION)
+    waste_type = models.CharField(max_length=50, blank=True)
+    count = models.IntegerField(default=0)
+    bags = models.IntegerField(default=0)
+    lat_sum = models.FloatField(default=0)
+    lng_sum = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ("precision", "cell", "waste_type")
+        indexes = [models.Index(fields=["precision", "cell"])]
+
+    def __str__(self):
+        return f"{self.cell} {self.waste_type}: {self.count}"
+
+
+def precision_for_zoom(zoom):
+    """
+    Geohash precision whose cells are roughly a quarter of a 256px map tile
+    wide at this zoom level, i.e. about 64px clusters.
+    """
+    target_bits = zoom + 2
+    precision = 1
+    for p in range(1, MAX_CLUSTER_PRECISION + 1):
+        if (5 * p + 1) // 2 <= target_bits:
+            precision = p
+    return precision
+
+
+def _snapshot(lat, lng, bags, waste_type):
+    if lat is None or lng is None:
+        return None
+    return (float(lat), float(lng), int(bags or 0), waste_type or "")
+
+
+def _apply(snapshot, sign):
+    lat, lng, bags, waste_type = snapshot
+    geohash = geohash_encode(lat, lng, MAX_CLUSTER_PRECISION)
+    for precision in range(1, MAX_CLUSTER_PRECISION + 1):
+        key = {"precision": precision, "cell": geohash[:precision], "waste_type": waste_type}
+        delta = {
+            "count": F("count") + sign,
+            "bags": F("bags") + sign * bags,
+            "lat_sum": F("lat_sum") + sign * lat,
+            "lng_sum": F("lng_sum") + sign * lng,
+        }
+        if MapCell.objects.filter(**key).update(**delta) or sign < 0:
+            continue
+        try:
+            with transaction.atomic():
+                MapCell.objects.create(**key, count=1, bags=bags, lat_sum=lat, lng_sum=lng)
+        except IntegrityError:
+            # Another request created the row first
+            MapCell.objects.filter(**key).update(**delta)
+
+
+def rebuild_map_cells(chunk_size=2000):
+    """Recompute every cell from scratch, e.g. after imports that bypass save signals"""
+    totals = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    rows = CustomerWasteInfo.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).values_list("latitude", "longitude", "number_of_bags", "waste_type").iterator(chunk_size=chunk_size)
+    for row in rows:
+        lat, lng, bags, waste_type = _snapshot(*row)
+        geohash = geohash_encode(lat, lng, MAX_CLUSTER_PRECISION)
+        for precision in range(1, MAX_CLUSTER_PRECISION + 1):
+            t = totals[(precision, geohash[:precision], waste_type)]
+            t[0] += 1
+            t[1] += bags
+            t[2] += lat
+            t[3] += lng
+
+    with transaction.atomic():
+        MapCell.objects.all().delete()
+        MapCell.objects.bulk_create(
+            [
+                MapCell(precision=p, cell=c, waste_type=w, count=n, bags=b, lat_sum=la, lng_sum=ln)
+                for (p, c, w), (n, b, la, ln) in totals.items()
+            ],
+            batch_size=BATCH_SIZE,
+        )
+    return len(totals)
+
+
+def _cells_in(south, west, north, east, precision):
+    """Q matching cells of `precision` that overlap the bounding box"""
+    match = Q()
+    for cover in covering_cells(south, west, north, east):
+        if len(cover) >= precision:
+            match |= Q(cell=cover[:precision])
+        else:
+            match |= Q(cell__startswith=cover)
+    return match
+
+
+def get_clusters(south, west, north, east, zoom):
+    """
+    [{cell, latitude, longitude, count, bags, waste_types: {type: count}}]
+    for the viewport, one entry per non-empty cell at the zoom's precision.
+    """
+    precision = precision_for_zoom(zoom)
+    rows = MapCell.objects.filter(
+        _cells_in(south, west, north, east, precision), precision=precision, count__gt=0
+    ).values_list("cell", "waste_type", "count", "bags", "lat_sum", "lng_sum")
+
+    cells = {}
+    for cell, waste_type, count, bags, lat_sum, lng_sum in rows:
+        c = cells.setdefault(cell, {"cell": cell, "count": 0, "bags": 0, "lat_sum": 0.0, "lng_sum": 0.0, "waste_types": {}})
+        c["count"] += count
+        c["bags"] += bags
+        c["lat_sum"] += lat_sum
+        c["lng_sum"] += lng_sum
+        c["waste_types"][waste_type or "unknown"] = c["waste_types"].get(waste_type or "unknown", 0) + count
+
+    height, width = cell_size(precision)
+    clusters = []
+    for c in cells.values():
+        lat = c.pop("lat_sum") / c["count"]
+        lng = c.pop("lng_sum") / c["count"]
+        # Cells only partly in view are kept if their centroid is near the viewport
+        if south - height <= lat <= north + height and west - width <= lng <= east + width:
+            clusters.append({**c, "latitude": round(lat, 6), "longitude": round(lng, 6)})
+    clusters.sort(key=lambda c: c["cell"])
+    return clusters
+
+
+def get_points(south, west, north, east, limit=MAX_POINTS):
+    ids = within_bbox(south, west, north, east)[:limit]
+    return list(CustomerWasteInfo.objects.filter(id__in=ids).values(
+        "id", "full_name", "pickup_address", "latitude", "longitude",
+        "waste_type", "status", "number_of_bags", "ward", "assigned_collector_id"
+    ))
+
+
+def map_data(south, west, north, east, zoom):
+    if zoom >= POINT_ZOOM:
+        return {"type": "points", "zoom": zoom, "points": get_points(south, west, north, east)}
+    return {
+        "type": "clusters",
+        "zoom": zoom,
+        "precision": precision_for_zoom(zoom),
+        "clusters": get_clusters(south, west, north, east, zoom),
+    }
+
+
+@receiver(post_save, sender=CustomerWasteInfo)
+def update_map_cells(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    row = old_profile(instance)
+    old = _snapshot(row["latitude"], row["longitude"], row["number_of_bags"], row["waste_type"]) if row else None
+    new = _snapshot(instance.latitude, instance.longitude, instance.number_of_bags, instance.waste_type)
+    if old == new:
+        return
+    if old:
+        _apply(old, -1)
+    if new:
+        _apply(new, 1)
+
+
+@receiver(post_delete, sender=CustomerWasteInfo)
+def remove_from_map_cells(sender, instance, **kwargs):
+    snapshot = _snapshot(instance.latitude, instance.longitude, instance.number_of_bags, instance.waste_type)
+    if snapshot:
+        _apply(snapshot, -1)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from customer_dashboard.geocoder import is_stale, publish_gazetteer
+
+
+class Command(BaseCommand):
+    help = "Build the offline geocoder's gazetteer and publish it to the web processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--if-stale", action="store_true",
+            help="Only rebuild when profiles or places changed since the last build (for cron)",
+        )
+
+    def handle(self, *args, **options):
+        if options["if_stale"] and not is_stale():
+            self.stdout.write("Gazetteer is up to date")
+            return
+        gazetteer = publish_gazetteer()
+        self.stdout.write(self.style.SUCCESS(
+            f"Published gazetteer {gazetteer.version} with {len(gazetteer.entries)} entries"
+        ))
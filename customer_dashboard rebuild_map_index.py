@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from customer_dashboard.geo import rebuild_location_index
+from customer_dashboard.map_clusters import rebuild_map_cells
+
+
+class Command(BaseCommand):
+    help = "Rebuild the geohash location index and the pre-aggregated map clusters"
+
+    def handle(self, *args, **options):
+        locations = rebuild_location_index()
+        cells = rebuild_map_cells()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {locations} locations into {cells} map cells"))
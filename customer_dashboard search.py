@@ -0,0 +1,220 @@
+"""
+Full-text search over waste profiles.
+
+Each CustomerWasteInfo has a denormalised WasteInfoSearchDocument (name,
+phones, address, landmark, pincode, ward name) kept in sync on save.
+Text queries go to SQLite FTS5 or a PostgreSQL tsvector GIN index
+depending on the database; phone queries use an indexed prefix match on
+the normalised numbers.
+"""
+import re
+
+from django.db import connection, models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authentication.models import CustomUser
+from super_admin_dashboard.wards import get_ward_registry
+from .models import CustomerWasteInfo
+
+
+FTS_TABLE = "customer_dashboard_waste_info_fts"
+PG_INDEX = "customer_dashboard_search_doc_gin"
+MIN_PHONE_DIGITS = 3
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# User fields that appear in the search document
+USER_FIELDS = {"first_name", "last_name", "contact_number"}
+
+_index_ready = {"done": False}
+
+
+class WasteInfoSearchDocument(models.Model):
+    waste_info = models.OneToOneField(
+        CustomerWasteInfo, on_delete=models.CASCADE, primary_key=True, related_name="search_document"
+    )
+    document = models.TextField()
+    phone = models.CharField(max_length=15, blank=True, db_index=True)
+    secondary_phone = models.CharField(max_length=15, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.waste_info_id}: {self.document[:50]}"
+
+
+def normalise_phone(value):
+    digits = re.sub(r"\D", "", str(value or ""))
+    # Drop country code / trunk prefix so +91 98470 12345 and 9847012345 match
+    return digits[-10:] if len(digits) > 10 else digits
+
+
+def build_document(info):
+    user = info.user
+    parts = [
+        info.full_name,
+        getattr(user, "first_name", ""),
+        getattr(user, "last_name", ""),
+        getattr(user, "contact_number", ""),
+        info.secondary_number,
+        info.pickup_address,
+        info.landmark,
+        info.pincode,
+        info.ward,
+        get_ward_registry(info.localbody_id).name(info.ward) if info.ward else "",
+    ]
+    return " ".join(str(p) for p in parts if p)
+
+
+def _is_sqlite():
+    return connection.vendor == "sqlite"
+
+
+def _is_postgres():
+    return connection.vendor == "postgresql"
+
+
+def ensure_search_index():
+    """Create the FTS5 table / GIN index if they do not exist yet"""
+    if _index_ready["done"]:
+        return
+    with connection.cursor() as cursor:
+        if _is_sqlite():
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(document, tokenize='unicode61 remove_diacritics 2')"
+            )
+        elif _is_postgres():
+            table = WasteInfoSearchDocument._meta.db_table
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON {table} "
+                f"USING gin (to_tsvector('simple', document))"
+            )
+    _index_ready["done"] = True
+
+
+def index_waste_info(info):
+    document = build_document(info)
+    WasteInfoSearchDocument.objects.update_or_create(
+        waste_info_id=info.pk,
+        defaults={
+            "document": document,
+            "phone": normalise_phone(getattr(info.user, "contact_number", "")),
+            "secondary_phone": normalise_phone(info.secondary_number),
+        },
+    )
+    if _is_sqlite():
+        ensure_search_index()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [info.pk])
+            cursor.execute(f"INSERT INTO {FTS_TABLE}(rowid, document) VALUES (%s, %s)", [info.pk, document])
+
+
+def remove_waste_info(pk):
+    if _is_sqlite():
+        ensure_search_index()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [pk])
+
+
+def rebuild_search_index(chunk_size=2000):
+    """Re-index every profile, e.g. after bulk imports or deletes that bypass save signals"""
+    ensure_search_index()
+    if _is_sqlite():
+        # Rows of deleted profiles would otherwise stay in the FTS table
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    count = 0
+    infos = CustomerWasteInfo.objects.select_related("user").iterator(chunk_size=chunk_size)
+    for info in infos:
+        index_waste_info(info)
+        count += 1
+    return count
+
+
+def _tokens(query):
+    return [t.lower() for t in _TOKEN_RE.findall(query or "")][:8]
+
+
+def search_waste_info_ids(query, limit=50):
+    """Ids of matching profiles, best match first"""
+    query = (query or "").strip()
+    if not query:
+        return []
+
+    digits = normalise_phone(query)
+    if len(digits) >= MIN_PHONE_DIGITS and re.fullmatch(r"[\d\s+()-]+", query):
+        return list(
+            WasteInfoSearchDocument.objects.filter(
+                models.Q(phone__startswith=digits) | models.Q(secondary_phone__startswith=digits)
+            ).order_by("-waste_info_id").values_list("waste_info_id", flat=True)[:limit]
+        )
+
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+    ensure_search_index()
+
+    if _is_sqlite():
+        match = " ".join('"{}"*'.format(t.replace('"', '')) for t in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY bm25({FTS_TABLE}) LIMIT %s",
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    if _is_postgres():
+        # The @@ operand must be exactly the indexed expression for the GIN index to be used;
+        # only the matched rows are ranked
+        table = WasteInfoSearchDocument._meta.db_table
+        ts_query = " & ".join(f"{t}:*" for t in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT waste_info_id FROM {table} "
+                f"WHERE to_tsvector('simple', document) @@ to_tsquery('simple', %s) "
+                f"ORDER BY ts_rank(to_tsvector('simple', document), to_tsquery('simple', %s)) DESC, "
+                f"waste_info_id DESC LIMIT %s",
+                [ts_query, ts_query, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    # Other backends: a single-column scan of the denormalised document
+    documents = WasteInfoSearchDocument.objects.all()
+    for token in tokens:
+        documents = documents.filter(document__icontains=token)
+    return list(documents.order_by("-waste_info_id").values_list("waste_info_id", flat=True)[:limit])
+
+
+def find_customer_by_phone(number):
+    """Customer (role 0) for a contact number, tolerant of formatting; None if not found or ambiguous"""
+    customer = CustomUser.objects.filter(contact_number=number, role=0).first()
+    if customer:
+        return customer
+    digits = normalise_phone(number)
+    if len(digits) < MIN_PHONE_DIGITS:
+        return None
+    user_ids = set(
+        WasteInfoSearchDocument.objects.filter(phone=digits).values_list("waste_info__user_id", flat=True)[:2]
+    )
+    if len(user_ids) != 1:
+        return None
+    return CustomUser.objects.filter(pk=user_ids.pop(), role=0).first()
+
+
+@receiver(post_save, sender=CustomerWasteInfo)
+def update_search_document(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_waste_info(instance)
+
+
+@receiver(post_delete, sender=CustomerWasteInfo)
+def delete_search_document(sender, instance, **kwargs):
+    remove_waste_info(instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+def update_user_search_documents(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Name and phone live on the user, so their profiles need re-indexing; other saves
+    # (e.g. last_login on every login) do not touch the document
+    if raw or instance.role != 0 or (update_fields is not None and not USER_FIELDS & set(update_fields)):
+        return
+    for info in CustomerWasteInfo.objects.filter(user=instance).select_related("user"):
+        index_waste_info(info)
@@ -0,0 +1,28 @@
+"""
+One pre-save snapshot of a waste profile's stored row, shared by the
+post_save receivers that need to know what changed (dashboard counters,
+map cells, collector manifests and sync). Without it each of them read
+the old row itself, one SELECT per receiver per save.
+
+SNAPSHOT_FIELDS is the union of what those receivers compare; add to it
+rather than querying the old row again.
+"""
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from .models import CustomerWasteInfo
+
+
+SNAPSHOT_FIELDS = ("status", "assigned_collector_id", "latitude", "longitude", "number_of_bags", "waste_type")
+
+
+@receiver(pre_save, sender=CustomerWasteInfo)
+def snapshot_profile(sender, instance, raw=False, **kwargs):
+    instance._old_profile = None
+    if not raw and instance.pk:
+        instance._old_profile = CustomerWasteInfo.objects.filter(pk=instance.pk).values(*SNAPSHOT_FIELDS).first()
+
+
+def old_profile(instance):
+    """{field: stored value} from before the current save, or None for new rows and fixture loads"""
+    return getattr(instance, "_old_profile", None)
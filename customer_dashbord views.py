@@ -3,14 +3,25 @@
 
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.views.decorators.http import require_GET
+from django.views.decorators.http import require_GET, etag
 from django.contrib import messages
+from django.utils import timezone
 from decimal import Decimal, InvalidOperation
 from .models import CustomerWasteInfo, CustomerPickupDate, CustomerLocationHistory
 from super_admin_dashboard.models import State, District, LocalBody, LocalBodyCalendar
+from super_admin_dashboard.hierarchy import get_districts, get_hierarchy, get_localbodies, get_states, hierarchy_etag
+from super_admin_dashboard.wards import get_ward_options, get_ward_registry
+from super_admin_dashboard.pagination import paginate
 from .utils import is_customer
+from .geo import within_bbox
+from .location_history import record_location
+from .geocoder import geocode
+from .availability import get_availability, parse_window
+from .booking import (
+    BOOKED, DUPLICATE, INVALID, WAITLISTED, book_pickup_dates, count_status, parse_date_ids, reschedule_pickup
+)
 
 
 # Role checking
@@ -50,94 +61,20 @@ def waste_profile_detail(request, pk):
 
 
 
-def get_ward_names():
-    """Return a dictionary mapping ward numbers to ward names"""
-    return {
-        1: "Fort Kochi",
-        2: "Kalvathy",
-        3: "Earavely",
-        4: "Karippalam",
-        5: "Cheralayi",
-        6: "Mattanchery",
-        7: "Chakkamadam",
-        8: "Karuvelippady",
-        9: "Island North",
-        10: "Ravipuram",
-        11: "Ernakulam South",
-        12: "Gandhi Nagar",
-        13: "Kathrikadavu",
-        14: "Ernakulam Central",
-        15: "Ernakulam North",
-        16: "Kaloor South",
-        17: "Kaloor North",
-        18: "Thrikkanarvattom",
-        19: "Ayyappankavu",
-        20: "Pottakuzhy",
-        21: "Elamakkara South",
-        22: "Pachalam",
-        23: "Thattazham",
-        24: "Vaduthala West",
-        25: "Vaduthala East",
-        26: "Elamakkara North",
-        27: "Puthukkalavattam",
-        28: "Kunnumpuram",
-        29: "Ponekkara",
-        30: "Edappally",
-        31: "Changampuzha",
-        32: "Dhevankulangara",
-        33: "Palarivattom",
-        34: "Stadium",
-        35: "Karanakkodam",
-        36: "Puthiyaroad",
-        37: "Padivattam",
-        38: "Vennala",
-        39: "Chakkaraparambu",
-        40: "Chalikkavattam",
-        41: "Thammanam",
-        42: "Elamkulam",
-        43: "Girinagar",
-        44: "Ponnurunni",
-        45: "Ponnurunni East",
-        46: "Vyttila",
-        47: "Poonithura",
-        48: "Vyttila Janatha",
-        49: "Kadavanthra",
-        50: "Panampilly Nagar",
-        51: "Perumanoor",
-        52: "Konthuruthy",
-        53: "Thevara",
-        54: "Island South",
-        55: "Kadebhagam",
-        56: "Palluruthy East",
-        57: "Thazhuppu",
-        58: "Eadakochi North",
-        59: "Edakochi South",
-        60: "Perumbadappu",
-        61: "Konam",
-        62: "Palluruthy Kacheripady",
-        63: "Nambyapuram",
-        64: "Palluruthy",
-        65: "Pullardesam",
-        66: "Tharebhagam",
-        67: "Thoppumpady",
-        68: "Mundamvely East",
-        69: "Mundamvely",
-        70: "Manassery",
-        71: "Moolamkuzhy",
-        72: "Chullickal",
-        73: "Nasrathu",
-        74: "Panayappilly",
-        75: "Amaravathy",
-        76: "Fortkochi Veli"
-    }
-
-def get_ward_options():
-    """Return a list of tuples (number, name) for ward options"""
-    ward_names = get_ward_names()
-    return [(i, ward_names.get(i, f'Ward {i}')) for i in range(1, 74)]
 
 
 
+def booking_messages(request, results):
+    """Flash a message for every pickup date that could not be booked"""
+    for result in results:
+        if result["status"] == INVALID:
+            messages.error(request, f"Selected pickup date {result['id']} is invalid.")
+        elif result["status"] == DUPLICATE:
+            messages.info(request, f"Pickup date {result['date']} is already booked.")
+        elif result["status"] == WAITLISTED:
+            messages.warning(request, f"Pickup date {result['date']} is full. You have been added to its waitlist.")
+
+
 def validate_coordinates(latitude, longitude):
     """Validate latitude and longitude values"""
     try:
@@ -157,10 +94,10 @@ def validate_coordinates(latitude, longitude):
 @login_required
 @user_passes_test(lambda u: u.role == 0)
 def waste_profile_create(request):
-    states = State.objects.all()
-    ward_range = range(1, 75)
+    states = get_states()
     bag_range = range(1, 11)
     ward_options = get_ward_options()
+    ward_range = [number for number, _ in ward_options]
 
     if request.method == "POST":
         # Get and validate coordinates
@@ -189,12 +126,7 @@ def waste_profile_create(request):
 
         # Save location history if coordinates provided
         if latitude and longitude:
-            CustomerLocationHistory.objects.create(
-                waste_info=info,
-                latitude=latitude,
-                longitude=longitude,
-                changed_by=request.user
-            )
+            record_location(info, latitude, longitude, changed_by=request.user)
             messages.success(request, "Waste profile created with location tracking!")
         else:
             messages.warning(request, "Waste profile created without location data. Please update location later.")
@@ -202,26 +134,9 @@ def waste_profile_create(request):
         # Handle pickup dates (multiple selection)
         selected_date_ids = request.POST.get("selected_date", "")
         if selected_date_ids:
-            date_ids = [int(id_str) for id_str in selected_date_ids.split(',') if id_str.isdigit()]
-            # Limit to 4 bookings
-            date_ids = date_ids[:4]
-
-            for date_id in date_ids:
-                try:
-                    cal = LocalBodyCalendar.objects.get(pk=date_id)
-                    # Check if this date is already booked by this user
-                    if not CustomerPickupDate.objects.filter(
-                        user=request.user,
-                        localbody_calendar=cal
-                    ).exists():
-                        CustomerPickupDate.objects.create(
-                            user=request.user,
-                            waste_info=info,
-                            localbody_calendar=cal
-                        )
-                except LocalBodyCalendar.DoesNotExist:
-                    messages.error(request, f"Selected pickup date {date_id} is invalid.")
-            messages.success(request, f"Successfully booked {len(date_ids)} pickup date(s).")
+            results = book_pickup_dates(request.user, info, parse_date_ids(selected_date_ids))
+            booking_messages(request, results)
+            messages.success(request, f"Successfully booked {count_status(results, BOOKED)} pickup date(s).")
 
         return render(request, "waste_success.html", {"info": info})
 
@@ -241,14 +156,14 @@ def waste_profile_create(request):
 @user_passes_test(lambda u: u.role == 0)
 def waste_profile_update(request, pk):
     info = get_object_or_404(CustomerWasteInfo, pk=pk, user=request.user)
-    states = State.objects.all()
-    ward_range = range(1, 75)
+    states = get_states()
     bag_range = range(1, 11)
-    ward_options = get_ward_options()
+    ward_options = get_ward_options(info.localbody_id)
+    ward_range = [number for number, _ in ward_options]
 
     # Preload districts & localbodies for the selected state/district
-    districts = District.objects.filter(state=info.state) if info.state else []
-    localbodies = LocalBody.objects.filter(district=info.district) if info.district else []
+    districts = get_districts(info.state_id)
+    localbodies = get_localbodies(info.district_id)
 
     # Preload existing selected dates
     selected_dates = CustomerPickupDate.objects.filter(waste_info=info)
@@ -282,13 +197,10 @@ def waste_profile_update(request, pk):
 
         # Track location change if coordinates changed
         if new_latitude and new_longitude:
-            if old_latitude != new_latitude or old_longitude != new_longitude:
-                CustomerLocationHistory.objects.create(
-                    waste_info=info,
-                    latitude=new_latitude,
-                    longitude=new_longitude,
-                    changed_by=request.user
-                )
+            # Moves within the jitter threshold are not recorded
+            if (old_latitude != new_latitude or old_longitude != new_longitude) and record_location(
+                info, new_latitude, new_longitude, changed_by=request.user
+            ):
                 messages.success(request, "Waste profile and location updated successfully!")
             else:
                 messages.success(request, "Waste profile updated successfully!")
@@ -298,30 +210,10 @@ def waste_profile_update(request, pk):
         # Handle pickup date update (replace old ones with new ones if given)
         selected_date_ids = request.POST.get("selected_date", "")
         if selected_date_ids:
-            # Remove old pickup dates for this profile
-            CustomerPickupDate.objects.filter(waste_info=info).delete()
-
-            # Process new pickup dates (multiple selection)
-            date_ids = [int(id_str) for id_str in selected_date_ids.split(',') if id_str.isdigit()]
-            # Limit to 4 bookings
-            date_ids = date_ids[:4]
-
-            for date_id in date_ids:
-                try:
-                    cal = LocalBodyCalendar.objects.get(pk=date_id)
-                    # Check if this date is already booked by this user
-                    if not CustomerPickupDate.objects.filter(
-                        user=request.user,
-                        localbody_calendar=cal
-                    ).exists():
-                        CustomerPickupDate.objects.create(
-                            user=request.user,
-                            waste_info=info,
-                            localbody_calendar=cal
-                        )
-                except LocalBodyCalendar.DoesNotExist:
-                    messages.error(request, f"Selected pickup date {date_id} is invalid.")
-            messages.success(request, f"Successfully updated to {len(date_ids)} pickup date(s).")
+            # Old pickup dates for this profile are replaced in the same transaction
+            results = book_pickup_dates(request.user, info, parse_date_ids(selected_date_ids), replace=True)
+            booking_messages(request, results)
+            messages.success(request, f"Successfully updated to {count_status(results, BOOKED)} pickup date(s).")
 
         return redirect("customer:waste_profile_detail", pk=info.id)
 
@@ -352,25 +244,31 @@ def waste_profile_delete(request, pk):
 @user_passes_test(is_customer)
 @require_GET
 def get_available_dates(request, localbody_id):
-    """Get available pickup dates for a local body"""
-    # Get all dates for this local body
-    all_dates = LocalBodyCalendar.objects.filter(localbody_id=localbody_id)
+    """
+    Get pickup dates for a local body within FullCalendar's ?start=&end= window
+    (defaults to the next two months), with booked count and remaining capacity
+    """
+    start, end = parse_window(request.GET.get("start"), request.GET.get("end"), timezone.localdate())
+    dates = get_availability(localbody_id, start, end)
 
-    # Get dates already booked by this user
-    booked_dates = CustomerPickupDate.objects.filter(
+    # Dates already booked by this user, within the same window
+    booked_dates = set(CustomerPickupDate.objects.filter(
         user=request.user,
-        localbody_calendar__localbody_id=localbody_id
-    ).values_list('localbody_calendar_id', flat=True)
+        localbody_calendar__localbody_id=localbody_id,
+        localbody_calendar__date__gte=start,
+        localbody_calendar__date__lt=end,
+    ).values_list('localbody_calendar_id', flat=True))
 
     data = []
-    for d in all_dates:
+    for d in dates:
         # Mark as "Picked" if already booked by this user
-        picked = d.id in booked_dates
+        picked = d["id"] in booked_dates
+        full = d["remaining"] == 0 and not picked
         data.append({
-            "id": d.id,
-            "date": d.date.isoformat(),
-            "title": "Picked" if picked else "Available",
-            "picked": picked
+            **d,
+            "title": "Picked" if picked else ("Full" if full else "Available"),
+            "picked": picked,
+            "full": full,
         })
     return JsonResponse(data, safe=False)
 
@@ -378,19 +276,37 @@ def get_available_dates(request, localbody_id):
 @login_required
 @user_passes_test(is_customer)
 @require_GET
+@etag(hierarchy_etag)
 def load_districts_customer(request, state_id):
     """Load districts based on selected state"""
-    districts = District.objects.filter(state_id=state_id).values('id', 'name')
-    return JsonResponse(list(districts), safe=False)
+    return JsonResponse(get_districts(state_id), safe=False)
 
 
 @login_required
 @user_passes_test(is_customer)
 @require_GET
+@etag(hierarchy_etag)
 def load_localbodies_customer(request, district_id):
     """Load local bodies based on selected district"""
-    localbodies = LocalBody.objects.filter(district_id=district_id).values('id', 'name', 'body_type')
-    return JsonResponse(list(localbodies), safe=False)
+    return JsonResponse(get_localbodies(district_id), safe=False)
+
+
+@login_required
+@user_passes_test(is_customer)
+@require_GET
+def load_wards_customer(request, localbody_id):
+    """Load ward options for a local body"""
+    options = get_ward_registry(localbody_id).options
+    return JsonResponse([{"number": number, "name": name} for number, name in options], safe=False)
+
+
+@login_required
+@user_passes_test(is_customer)
+@require_GET
+@etag(hierarchy_etag)
+def load_hierarchy_customer(request):
+    """Load the whole State -> District -> LocalBody tree in one request"""
+    return HttpResponse(get_hierarchy()["compact_json"], content_type="application/json")
 
 
 @login_required
@@ -402,12 +318,14 @@ def save_pickup_date(request):
         date_id = request.POST.get("pickup_date")
         localbody_calendar = get_object_or_404(LocalBodyCalendar, pk=date_id)
 
-        # Create or update
-        pickup_date, created = CustomerPickupDate.objects.update_or_create(
-            user=user,
-            defaults={"localbody_calendar": localbody_calendar}
-        )
+        # Create or update, only if the date still has room
+        had_pickup = CustomerPickupDate.objects.filter(user=user).exists()
+        pickup_date, status = reschedule_pickup(user, localbody_calendar)
+        created = status == BOOKED and not had_pickup
 
+        if status == WAITLISTED:
+            messages.warning(request, "That pickup date is full. You have been added to its waitlist.")
+            return JsonResponse({"status": "waitlisted", "created": False}, status=409)
         if created:
             messages.success(request, "Pickup date saved successfully!")
         else:
@@ -452,11 +370,37 @@ def location_history(request, pk):
     View location change history for a waste profile
     """
     info = get_object_or_404(CustomerWasteInfo, pk=pk, user=request.user)
-    history = CustomerLocationHistory.objects.filter(waste_info=info).order_by('-changed_at')
+    history = CustomerLocationHistory.objects.filter(waste_info=info)
+    page, _ = paginate(request, history, ordering='-changed_at', page_size=50, with_total=False)
 
     return render(request, "location_history.html", {
         "info": info,
-        "history": history
+        "history": page,
+        "page": page,
+    })
+
+
+@login_required
+@user_passes_test(is_customer)
+@require_GET
+def location_history_api(request, pk):
+    """
+    Location history for a waste profile, newest first, as JSON.
+    ?cursor= from the previous response's next/prev, optional ?page_size=
+    """
+    info = get_object_or_404(CustomerWasteInfo, pk=pk, user=request.user)
+    rows = CustomerLocationHistory.objects.filter(waste_info=info).values(
+        'id', 'latitude', 'longitude', 'changed_at', 'changed_by__username'
+    )
+    page, _ = paginate(request, rows, ordering='-changed_at', page_size=50, with_total=False)
+
+    return JsonResponse({
+        'results': [
+            {**row, 'latitude': str(row['latitude']), 'longitude': str(row['longitude'])}
+            for row in page
+        ],
+        'next': page.next_token,
+        'prev': page.prev_token,
     })
 
 
@@ -466,19 +410,26 @@ def location_history(request, pk):
 def get_location_by_address(request):
     """
     API endpoint for geocoding - convert address to coordinates
-    This would typically call Google Geocoding API from backend
-    For now, returns a placeholder response
+    Answered from the local gazetteer (no external API call).
+    Usage: GET /location-by-address/?address=...&pincode=682024&localbody=3
     """
     address = request.GET.get('address')
 
     if not address:
         return JsonResponse({"error": "Address parameter is required"}, status=400)
+    if request.GET.get('localbody') and not request.GET['localbody'].isdigit():
+        return JsonResponse({"error": "localbody must be a local body id"}, status=400)
+
+    result = geocode(address, pincode=request.GET.get('pincode'), localbody_id=request.GET.get('localbody') or None)
+    if result is None:
+        return JsonResponse({"success": False, "message": "No match found for this address"})
 
-    # TODO: Implement actual Google Geocoding API call here
-    # For now, return placeholder
     return JsonResponse({
-        "success": False,
-        "message": "Geocoding should be done on frontend using Google Maps JavaScript API"
+        "success": True,
+        "latitude": f"{result['latitude']:.6f}",
+        "longitude": f"{result['longitude']:.6f}",
+        "confidence": result["confidence"],
+        "source": result["source"],
     })
 
 
@@ -487,12 +438,23 @@ def get_location_by_address(request):
 def export_locations(request):
     """
     Export all customer locations as JSON for mapping/analytics
+    Optional map viewport: ?bbox=south,west,north,east
     """
     profiles = CustomerWasteInfo.objects.filter(
         user=request.user,
         latitude__isnull=False,
         longitude__isnull=False
-    ).values(
+    )
+
+    bbox = request.GET.get('bbox')
+    if bbox:
+        try:
+            south, west, north, east = (float(v) for v in bbox.split(','))
+        except ValueError:
+            return JsonResponse({"error": "bbox must be south,west,north,east"}, status=400)
+        profiles = profiles.filter(id__in=within_bbox(south, west, north, east, queryset=profiles))
+
+    profiles = profiles.values(
         'id',
         'full_name',
         'pickup_address',
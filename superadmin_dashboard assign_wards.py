@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from customer_dashboard.models import CustomerWasteInfo
+from super_admin_dashboard.wards import Ward, assign_wards
+
+
+class Command(BaseCommand):
+    help = "Re-resolve the ward of geotagged waste profiles from the registered ward boundaries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--localbody", type=int, help="Only profiles of this local body")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="Only report how many would change")
+
+    def handle(self, *args, **options):
+        # Only local bodies with boundaries can resolve anything
+        localbodies = Ward.objects.filter(boundary__isnull=False).values_list("localbody_id", flat=True).distinct()
+        if options["localbody"]:
+            localbodies = localbodies.filter(localbody_id=options["localbody"])
+        profiles = CustomerWasteInfo.objects.filter(
+            localbody_id__in=list(localbodies), latitude__isnull=False, longitude__isnull=False
+        ).only("id", "localbody_id", "ward", "latitude", "longitude").order_by("pk")
+
+        batch_size = options["batch_size"]
+        checked = changed = 0
+        batch = []
+        for info in profiles.iterator(chunk_size=batch_size):
+            batch.append(info)
+            if len(batch) == batch_size:
+                changed += self.assign(batch, options["dry_run"])
+                checked += len(batch)
+                batch = []
+        if batch:
+            changed += self.assign(batch, options["dry_run"])
+            checked += len(batch)
+
+        verb = "Would change" if options["dry_run"] else "Changed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} the ward of {changed} of {checked} profiles"))
+
+    def assign(self, batch, dry_run):
+        changed = assign_wards(batch)
+        if not dry_run:
+            with transaction.atomic():
+                for info in changed:
+                    # Saved normally so the manifest, search and sync indexes follow
+                    info.save(update_fields=["ward"])
+        return len(changed)
@@ -0,0 +1,180 @@
+"""
+Automatic, capacity-balanced collector assignment.
+
+Unassigned profiles booked for a day are clustered by local body and ward,
+oversized clusters are split along geohash order so each piece stays
+geographically compact, and the clusters are handed out largest first to
+the least-loaded active collector that still has room. Collectors start
+from the stops and bags already assigned to them for that day, so the
+limits hold across runs.
+
+A previewed plan is kept in the cache for PLAN_SECONDS under its plan_id,
+so the admin applies exactly the plan they saw.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+from authentication.models import CustomUser
+from customer_dashboard.geo import geohash_encode
+from customer_dashboard.models import CustomerWasteInfo
+from waste_collector_dashboard.manifest import invalidate_manifests
+from waste_collector_dashboard.sync import record_profiles
+
+
+PLAN_KEY = "assignment-plan:{plan_id}"
+PLAN_SECONDS = 60 * 30
+
+
+def _bags(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def unassigned_profiles(day, localbody_id=None):
+    profiles = CustomerWasteInfo.objects.filter(
+        assigned_collector__isnull=True,
+        customerpickupdate__localbody_calendar__date=day,
+    )
+    if localbody_id:
+        profiles = profiles.filter(localbody_id=localbody_id)
+    return list(
+        profiles.distinct().values("id", "localbody_id", "ward", "latitude", "longitude", "number_of_bags")
+    )
+
+
+def assigned_loads(day, collector_ids):
+    """{collector_id: (stops, bags)} already assigned for a day, in every local body"""
+    profiles = CustomerWasteInfo.objects.filter(
+        assigned_collector_id__in=collector_ids,
+        customerpickupdate__localbody_calendar__date=day,
+    )
+    loads = {}
+    for collector_id, bags in profiles.distinct().values_list("assigned_collector_id", "number_of_bags"):
+        stops, total = loads.get(collector_id, (0, 0))
+        loads[collector_id] = (stops + 1, total + _bags(bags))
+    return loads
+
+
+def build_clusters(profiles, max_stops=None):
+    """Group profiles by (local body, ward), splitting groups larger than max_stops along geohash order"""
+    groups = {}
+    for p in profiles:
+        p["bags"] = _bags(p["number_of_bags"])
+        p["geohash"] = (
+            geohash_encode(p["latitude"], p["longitude"])
+            if p["latitude"] is not None and p["longitude"] is not None else "~"
+        )
+        groups.setdefault((p["localbody_id"], str(p["ward"] or "")), []).append(p)
+
+    clusters = []
+    for key, members in groups.items():
+        members.sort(key=lambda p: (p["geohash"], p["id"]))
+        size = max_stops or len(members)
+        for i in range(0, len(members), size):
+            clusters.append({"key": key, "members": members[i:i + size]})
+    return clusters
+
+
+def plan_assignment(day, localbody_id=None, max_stops=None, max_bags=None):
+    collectors = list(
+        CustomUser.objects.filter(role=1, is_active=True).order_by("id").values("id", "first_name", "last_name", "username")
+    )
+    # A collector's day spans local bodies, so per-local-body runs share one budget
+    existing = assigned_loads(day, [c["id"] for c in collectors])
+    loads = {}
+    for c in collectors:
+        stops, bags = existing.get(c["id"], (0, 0))
+        loads[c["id"]] = {
+            "collector": c, "stops": stops, "bags": bags,
+            "existing_stops": stops, "existing_bags": bags, "waste_info_ids": [],
+        }
+
+    def room(load):
+        stops_left = (max_stops - load["stops"]) if max_stops else float("inf")
+        bags_left = (max_bags - load["bags"]) if max_bags else float("inf")
+        return stops_left, bags_left
+
+    clusters = build_clusters(unassigned_profiles(day, localbody_id), max_stops)
+    clusters.sort(key=lambda c: (-len(c["members"]), c["key"]))
+
+    overflow = []
+    for cluster in clusters:
+        pending = list(cluster["members"])
+        while pending:
+            # Least loaded collector that can still take the next stop
+            candidates = [
+                load for load in loads.values()
+                if room(load)[0] >= 1 and room(load)[1] >= pending[0]["bags"]
+            ]
+            if not candidates:
+                overflow.append(pending.pop(0)["id"])
+                continue
+            load = min(candidates, key=lambda l: (l["stops"], l["bags"], l["collector"]["id"]))
+            while pending:
+                stops_left, bags_left = room(load)
+                if stops_left < 1 or bags_left < pending[0]["bags"]:
+                    break
+                p = pending.pop(0)
+                load["stops"] += 1
+                load["bags"] += p["bags"]
+                load["waste_info_ids"].append(p["id"])
+
+    return {
+        "date": day.isoformat(),
+        "localbody_id": localbody_id,
+        "collectors": [
+            {
+                "collector_id": load["collector"]["id"],
+                "name": f'{load["collector"]["first_name"]} {load["collector"]["last_name"]}'.strip()
+                        or load["collector"]["username"],
+                "stops": load["stops"],
+                "bags": load["bags"],
+                "existing_stops": load["existing_stops"],
+                "existing_bags": load["existing_bags"],
+                "waste_info_ids": load["waste_info_ids"],
+            }
+            for load in loads.values()
+        ],
+        "unassigned": overflow,
+    }
+
+
+def store_plan(plan):
+    """Keep a previewed plan so it can be applied unchanged; returns its plan_id"""
+    plan_id = uuid.uuid4().hex
+    cache.set(PLAN_KEY.format(plan_id=plan_id), plan, PLAN_SECONDS)
+    return plan_id
+
+
+def get_plan(plan_id):
+    return cache.get(PLAN_KEY.format(plan_id=plan_id)) if plan_id else None
+
+
+def discard_plan(plan_id):
+    cache.delete(PLAN_KEY.format(plan_id=plan_id))
+
+
+def apply_assignment(plan):
+    """Write a plan in one transaction; rows assigned meanwhile by someone else are left alone"""
+    collector_for = {
+        pk: entry["collector_id"]
+        for entry in plan["collectors"]
+        for pk in entry["waste_info_ids"]
+    }
+    with transaction.atomic():
+        infos = list(
+            CustomerWasteInfo.objects.select_for_update().filter(
+                id__in=collector_for.keys(), assigned_collector__isnull=True
+            )
+        )
+        for info in infos:
+            info.assigned_collector_id = collector_for[info.id]
+        CustomerWasteInfo.objects.bulk_update(infos, ["assigned_collector"], batch_size=500)
+        # bulk_update sends no save signals
+        invalidate_manifests(*{info.assigned_collector_id for info in infos})
+        record_profiles([info.id for info in infos])
+    return len(infos)
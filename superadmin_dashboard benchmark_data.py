@@ -0,0 +1,326 @@
+"""
+Deterministic synthetic data for benchmarks.
+
+generate_dataset(scale, seed) always produces the same rows for the same
+arguments, so timings from different runs and machines compare like for
+like. Rows are written with batched bulk_create, which skips save
+signals; the derived tables (rollups, search/location/map indexes,
+counters, slot counters) are rebuilt afterwards by rebuild_derived().
+
+Every generated user's username starts with PREFIX, so flush_dataset()
+removes exactly what was generated (profiles, pickups, history and
+collections cascade from the users; the reference rows are removed by name).
+It deletes in batches with the model signals muted, so Django can issue
+plain DELETEs instead of loading every row to run the per-row handlers,
+and then rebuilds the derived tables once.
+"""
+import random
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.utils import timezone
+
+from authentication.models import CustomUser
+from customer_dashboard.models import CustomerLocationHistory, CustomerPickupDate, CustomerWasteInfo
+from waste_collector_dashboard.models import WasteCollection
+from .models import District, LocalBody, LocalBodyCalendar, State
+
+
+PREFIX = "bench-"
+ADMIN_USERNAME = f"{PREFIX}admin"
+BATCH_SIZE = 5000
+# Fixed unusable password hash, so creating users does not run the hasher
+UNUSABLE_PASSWORD = "!benchmark"
+
+SCALES = {
+    "tiny": {"profiles": 2_000, "collections": 8_000, "calendars": 1_200, "collectors": 20, "history_per_profile": 2},
+    "small": {"profiles": 20_000, "collections": 80_000, "calendars": 5_000, "collectors": 100, "history_per_profile": 3},
+    "medium": {"profiles": 100_000, "collections": 400_000, "calendars": 20_000, "collectors": 400, "history_per_profile": 3},
+    "large": {"profiles": 500_000, "collections": 2_000_000, "calendars": 50_000, "collectors": 1_500, "history_per_profile": 4},
+}
+STATES = 3
+DISTRICTS_PER_STATE = 5
+LOCALBODIES_PER_DISTRICT = 8
+BODY_TYPES = ["Panchayat", "Municipality", "Corporation"]
+WASTE_TYPES = ["plastic", "organic", "e-waste", "mixed", "paper"]
+STATUSES = ["", "pending", "confirmed", "completed"]
+STREETS = ["MG Road", "Temple Road", "Church Street", "Market Road", "School Lane", "Bypass", "Beach Road"]
+LANDMARKS = ["Near Bus Stand", "Opp. Temple", "Near Church", "Behind School", "Near Junction", "Near Market"]
+# Rough Kerala bounding box
+LAT_RANGE = (8.3, 12.6)
+LNG_RANGE = (74.9, 77.3)
+
+
+def _model_kwargs(model, **values):
+    """Keep only values for fields the model actually has"""
+    kwargs = {}
+    for name, value in values.items():
+        try:
+            model._meta.get_field(name[:-3] if name.endswith("_id") else name)
+        except FieldDoesNotExist:
+            continue
+        kwargs[name] = value
+    return kwargs
+
+
+@contextmanager
+def _explicit_timestamps(model, *field_names):
+    """Let bulk_create store the generated created_at values instead of now()"""
+    fields = []
+    for name in field_names:
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        fields.append((field, field.auto_now_add, field.auto_now))
+        field.auto_now_add = field.auto_now = False
+    try:
+        yield
+    finally:
+        for field, auto_now_add, auto_now in fields:
+            field.auto_now_add, field.auto_now = auto_now_add, auto_now
+
+
+def _batched(model, rows, log=None, label=None):
+    batch = []
+    total = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            total += len(batch)
+            batch = []
+            if log:
+                log(f"  {label}: {total}")
+    if batch:
+        with transaction.atomic():
+            model.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+@contextmanager
+def _signals_muted(*signals):
+    """Disconnect every receiver of these signals for the duration (management commands only)"""
+    saved = []
+    for signal in signals:
+        with signal.lock:
+            saved.append((signal, signal.receivers))
+            signal.receivers = []
+            signal.sender_receivers_cache.clear()
+    try:
+        yield
+    finally:
+        for signal, receivers in saved:
+            with signal.lock:
+                signal.receivers = receivers
+                signal.sender_receivers_cache.clear()
+
+
+def _delete_batched(queryset, log=None, label=None):
+    """Delete a queryset's rows BATCH_SIZE at a time, each batch in its own transaction"""
+    total = 0
+    while True:
+        ids = list(queryset.order_by().values_list("pk", flat=True)[:BATCH_SIZE])
+        if not ids:
+            return total
+        with transaction.atomic():
+            total += queryset.model.objects.filter(pk__in=ids).delete()[0]
+        if log:
+            log(f"  {label}: {total} rows deleted")
+
+
+def _aware(value):
+    return timezone.make_aware(value) if settings.USE_TZ else value
+
+
+def generate_dataset(scale="small", seed=42, log=None):
+    """Create the dataset for a scale preset. Returns {table: rows created}."""
+    spec = SCALES[scale]
+    rng = random.Random(seed)
+    today = date(2025, 1, 1)
+    counts = {}
+
+    # Reference data
+    localbodies = []
+    for s in range(STATES):
+        state = State.objects.create(name=f"{PREFIX}state-{s}")
+        for d in range(DISTRICTS_PER_STATE):
+            district = District.objects.create(name=f"{PREFIX}district-{s}-{d}", state=state)
+            for l in range(LOCALBODIES_PER_DISTRICT):
+                lb = LocalBody.objects.create(**_model_kwargs(
+                    LocalBody, name=f"{PREFIX}lb-{s}-{d}-{l}", district=district,
+                    body_type=BODY_TYPES[l % len(BODY_TYPES)],
+                ))
+                # Each local body gets its own small area inside the bounding box
+                centre = (rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE))
+                localbodies.append((lb.id, district.id, state.id, centre))
+    counts["localbodies"] = len(localbodies)
+
+    # Calendar: consecutive collection days per local body
+    per_lb = max(1, spec["calendars"] // len(localbodies))
+    counts["calendars"] = _batched(LocalBodyCalendar, (
+        LocalBodyCalendar(localbody_id=lb_id, date=today + timedelta(days=i * 2))
+        for lb_id, _, _, _ in localbodies for i in range(per_lb)
+    ), log, "calendars")
+    calendar_ids = {}
+    for pk, lb_id in LocalBodyCalendar.objects.filter(
+        localbody_id__in=[lb[0] for lb in localbodies]
+    ).values_list("id", "localbody_id").iterator(chunk_size=BATCH_SIZE):
+        calendar_ids.setdefault(lb_id, []).append(pk)
+
+    # Users: the admin the scenarios log in as, collectors, then one customer per profile
+    joined = _aware(datetime(2024, 1, 1))
+    CustomUser.objects.create(**_model_kwargs(
+        CustomUser, username=ADMIN_USERNAME, password=UNUSABLE_PASSWORD, role=2,
+        is_staff=True, is_superuser=True, date_joined=joined,
+    ))
+    counts["collectors"] = _batched(CustomUser, (
+        CustomUser(**_model_kwargs(
+            CustomUser, username=f"{PREFIX}collector-{i}", password=UNUSABLE_PASSWORD, role=1,
+            first_name=f"Collector{i}", contact_number=f"8{i:09d}", date_joined=joined,
+        ))
+        for i in range(spec["collectors"])
+    ), log, "collectors")
+    counts["customers"] = _batched(CustomUser, (
+        CustomUser(**_model_kwargs(
+            CustomUser, username=f"{PREFIX}customer-{i}", password=UNUSABLE_PASSWORD, role=0,
+            first_name=f"Customer{i}", last_name=STREETS[i % len(STREETS)].split()[0],
+            contact_number=f"9{i:09d}", date_joined=joined,
+        ))
+        for i in range(spec["profiles"])
+    ), log, "customers")
+    collector_ids = list(CustomUser.objects.filter(
+        username__startswith=f"{PREFIX}collector-"
+    ).order_by("id").values_list("id", flat=True))
+    customer_ids = list(CustomUser.objects.filter(
+        username__startswith=f"{PREFIX}customer-"
+    ).order_by("id").values_list("id", flat=True))
+
+    # Waste profiles
+    def profiles():
+        for i, user_id in enumerate(customer_ids):
+            lb_id, district_id, state_id, (clat, clng) = localbodies[i % len(localbodies)]
+            created = joined + timedelta(minutes=i)
+            yield CustomerWasteInfo(**_model_kwargs(
+                CustomerWasteInfo,
+                user_id=user_id, full_name=f"Customer {i}", secondary_number=f"7{i:09d}",
+                pickup_address=f"House {i % 500}, {rng.choice(STREETS)}",
+                landmark=rng.choice(LANDMARKS), pincode=f"6{80000 + (i % len(localbodies)) * 7:05d}",
+                latitude=Decimal(f"{clat + rng.uniform(-0.05, 0.05):.6f}"),
+                longitude=Decimal(f"{clng + rng.uniform(-0.05, 0.05):.6f}"),
+                state_id=state_id, district_id=district_id, localbody_id=lb_id,
+                ward=str(rng.randint(1, 40)), number_of_bags=rng.randint(1, 6),
+                waste_type=rng.choice(WASTE_TYPES), status=rng.choice(STATUSES),
+                assigned_collector_id=rng.choice(collector_ids) if rng.random() < 0.6 else None,
+                created_at=created,
+            ))
+
+    with _explicit_timestamps(CustomerWasteInfo, "created_at"):
+        counts["profiles"] = _batched(CustomerWasteInfo, profiles(), log, "profiles")
+    profile_rows = list(CustomerWasteInfo.objects.filter(user_id__in=customer_ids).order_by("id").values_list(
+        "id", "user_id", "localbody_id", "latitude", "longitude"
+    ).iterator(chunk_size=BATCH_SIZE))
+
+    # Pickups: 1-3 dates per profile from its local body's calendar
+    def pickups():
+        for pk, user_id, lb_id, _, _ in profile_rows:
+            dates = calendar_ids.get(lb_id) or []
+            for cal_id in rng.sample(dates, min(len(dates), rng.randint(1, 3))):
+                yield CustomerPickupDate(user_id=user_id, waste_info_id=pk, localbody_calendar_id=cal_id)
+
+    counts["pickups"] = _batched(CustomerPickupDate, pickups(), log, "pickups")
+
+    # Location history: a few moves per profile
+    def history():
+        for pk, user_id, _, lat, lng in profile_rows:
+            for h in range(rng.randint(1, spec["history_per_profile"])):
+                yield CustomerLocationHistory(**_model_kwargs(
+                    CustomerLocationHistory, waste_info_id=pk, changed_by_id=user_id,
+                    latitude=Decimal(f"{float(lat) + rng.uniform(-0.002, 0.002):.6f}"),
+                    longitude=Decimal(f"{float(lng) + rng.uniform(-0.002, 0.002):.6f}"),
+                    changed_at=joined + timedelta(days=h * 30, minutes=pk % 1440),
+                ))
+
+    with _explicit_timestamps(CustomerLocationHistory, "changed_at"):
+        counts["history"] = _batched(CustomerLocationHistory, history(), log, "history")
+
+    # Collections spread over the year before `today`
+    def collections():
+        for i in range(spec["collections"]):
+            pk, user_id, lb_id, _, _ = profile_rows[rng.randrange(len(profile_rows))]
+            kg = Decimal(f"{rng.uniform(0.5, 25):.2f}")
+            created = _aware(datetime.combine(today - timedelta(days=rng.randint(0, 364)), time(rng.randint(6, 18))))
+            yield WasteCollection(**_model_kwargs(
+                WasteCollection,
+                customer_id=user_id, collector_id=rng.choice(collector_ids), localbody_id=lb_id,
+                ward=str(rng.randint(1, 40)), location=rng.choice(STREETS), number_of_bags=rng.randint(1, 6),
+                building_no=str(rng.randint(1, 999)), street_name=rng.choice(STREETS),
+                kg=kg, total_amount=kg * 50, booking_date=created.date(), scheduled_date=created.date(),
+                collection_time=created.time(), payment_method=rng.choice(["cash", "upi", "wallet"]),
+                created_at=created,
+            ))
+
+    with _explicit_timestamps(WasteCollection, "created_at"):
+        counts["collections"] = _batched(WasteCollection, collections(), log, "collections")
+    return counts
+
+
+def rebuild_derived(log=None):
+    """Rebuild the tables normally maintained by save signals"""
+    from customer_dashboard.geo import rebuild_location_index
+    from customer_dashboard.geocoder import publish_gazetteer
+    from customer_dashboard.map_clusters import rebuild_map_cells
+    from customer_dashboard.search import rebuild_search_index
+    from .capacity import ensure_slots
+    from .counters import reconcile_counters
+    from .hierarchy import bump_version
+    from .reporting import rebuild_rollups
+
+    steps = [
+        ("hierarchy", bump_version),
+        ("rollups", lambda: rebuild_rollups(date(2000, 1, 1), date(2100, 1, 1))),
+        ("location index", rebuild_location_index),
+        ("map cells", rebuild_map_cells),
+        ("search index", rebuild_search_index),
+        ("gazetteer", publish_gazetteer),
+        ("pickup slots", lambda: ensure_slots(
+            LocalBodyCalendar.objects.filter(localbody__name__startswith=PREFIX).values_list("id", flat=True)
+        )),
+        ("counters", reconcile_counters),
+    ]
+    for name, step in steps:
+        if log:
+            log(f"  rebuilding {name}")
+        step()
+
+
+def flush_dataset(log=None, rebuild=True):
+    """
+    Delete everything generate_dataset created. The signals that maintain
+    derived tables are muted meanwhile, so with rebuild=False the caller
+    must run rebuild_derived() itself (e.g. after generating a new dataset).
+    """
+    users = CustomUser.objects.filter(username__startswith=PREFIX)
+    deleted = 0
+    with _signals_muted(pre_save, post_save, pre_delete, post_delete):
+        # Largest tables first, so the user and reference deletes cascade over little
+        deleted += _delete_batched(WasteCollection.objects.filter(customer__in=users), log, "collections")
+        deleted += _delete_batched(CustomerLocationHistory.objects.filter(waste_info__user__in=users), log, "history")
+        deleted += _delete_batched(CustomerPickupDate.objects.filter(user__in=users), log, "pickups")
+        deleted += _delete_batched(CustomerWasteInfo.objects.filter(user__in=users), log, "profiles")
+        deleted += _delete_batched(users, log, "users")
+        deleted += _delete_batched(LocalBodyCalendar.objects.filter(localbody__name__startswith=PREFIX), log, "calendars")
+        with transaction.atomic():
+            deleted += State.objects.filter(name__startswith=PREFIX).delete()[0]
+    if log:
+        log(f"  deleted {deleted} rows")
+    if rebuild:
+        rebuild_derived(log)
+    return deleted
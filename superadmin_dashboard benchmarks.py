@@ -0,0 +1,330 @@
+"""
+Benchmark scenarios for the dashboard views and JSON endpoints.
+
+Each scenario is one request made through django.test.Client as the
+generated admin, customer or collector (see benchmark_data). Scenarios that
+write (POST) run each request inside a transaction that is rolled back, so
+the dataset is the same for every run and every repeat; work deferred with
+transaction.on_commit is therefore not part of their numbers. A scenario is
+run once to warm caches, then `repeat` times to time it, and once more
+under tracemalloc for peak Python memory, so the tracing overhead never
+shows up in the timings. Per scenario the results hold:
+
+    wall_ms      median, min and max of the timed runs
+    queries      SQL queries in one request (deterministic for a dataset)
+    peak_kb      peak memory allocated while handling one request
+    bytes        response size, status
+
+compare() checks results against a baseline file: more queries is always
+a regression; wall time and memory are regressions when they grow by more
+than `threshold` percent (and, for time, by more than MIN_REGRESSION_MS so
+that sub-millisecond noise does not fail a run). Results are only
+comparable for the same database vendor, scale and seed.
+"""
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+
+from authentication.models import CustomUser
+from customer_dashboard.models import CustomerLocationHistory, CustomerWasteInfo
+from .benchmark_data import ADMIN_USERNAME, PREFIX
+from .models import LocalBody, LocalBodyCalendar
+
+
+MIN_REGRESSION_MS = 5.0
+DEFAULT_THRESHOLD = 20.0
+
+
+class Scenario:
+    def __init__(self, name, url_name, user="admin", args=None, params=None, method="get", content_type=None):
+        self.name = name
+        self.url_name = url_name
+        self.user = user
+        # args / params: callables taking the context, so ids come from the dataset.
+        # For POST, params is the form data, or the JSON body with content_type="application/json".
+        self.args = args or (lambda ctx: [])
+        self.params = params or (lambda ctx: {})
+        self.method = method
+        self.content_type = content_type
+
+
+def _profile_form(ctx):
+    """The waste profile form as the customer would submit it for their own profile"""
+    return {
+        "full_name": "Benchmark Customer", "pickup_address": "House 12, Temple Road", "landmark": "Temple",
+        "latitude": ctx["centre"][0], "longitude": ctx["centre"][1],
+        "state": ctx["state_id"], "district": ctx["district_id"], "localbody": ctx["localbody_id"],
+        "ward": ctx["ward"], "number_of_bags": 2, "waste_type": "mixed", "pincode": "682001",
+        "selected_date": ctx["calendar_id"] or "",
+    }
+
+
+def _bbox(ctx, span):
+    lat, lng = ctx["centre"]
+    return f"{lat - span},{lng - span},{lat + span},{lng + span}"
+
+
+SCENARIOS = [
+    # Super admin pages
+    Scenario("admin_home", "super_admin_dashboard:super_admin_dashboard"),
+    Scenario("users_list", "super_admin_dashboard:users_list"),
+    Scenario("view_customers", "super_admin_dashboard:view_customers"),
+    Scenario("view_collectors", "super_admin_dashboard:view_collectors"),
+    Scenario("view_customer_waste_info", "super_admin_dashboard:view_customer_waste_info"),
+    Scenario("view_collected_data", "super_admin_dashboard:view_collected_data"),
+    Scenario("waste_info_list", "super_admin_dashboard:waste_info_list"),
+    Scenario("waste_info_list_search", "super_admin_dashboard:waste_info_list", params=lambda ctx: {"q": "Temple"}),
+    Scenario("calendar", "super_admin_dashboard:calendar"),
+    Scenario("generate_reports_month", "super_admin_dashboard:generate_reports", params=lambda ctx: {
+        "start_date": (ctx["today"] - timedelta(days=30)).isoformat(), "end_date": ctx["today"].isoformat(),
+    }),
+    Scenario("generate_reports_year_localbody", "super_admin_dashboard:generate_reports", params=lambda ctx: {
+        "start_date": (ctx["today"] - timedelta(days=365)).isoformat(), "end_date": ctx["today"].isoformat(),
+        "localbody": ctx["localbody_id"],
+    }),
+    # Super admin JSON endpoints
+    Scenario("dashboard_counters", "super_admin_dashboard:dashboard_counters"),
+    Scenario("user_directory_api", "super_admin_dashboard:user_directory_api", params=lambda ctx: {"role": "customers"}),
+    Scenario("waste_info_api", "super_admin_dashboard:waste_info_api"),
+    Scenario("waste_info_autocomplete", "super_admin_dashboard:waste_info_autocomplete", params=lambda ctx: {"q": "Cust"}),
+    Scenario("load_hierarchy", "super_admin_dashboard:load_hierarchy"),
+    Scenario("load_districts", "super_admin_dashboard:load_districts", args=lambda ctx: [ctx["state_id"]]),
+    Scenario("load_localbodies", "super_admin_dashboard:load_localbodies", args=lambda ctx: [ctx["district_id"]]),
+    Scenario("load_wards", "super_admin_dashboard:load_wards", args=lambda ctx: [ctx["localbody_id"]]),
+    Scenario("load_districts_for_reports", "super_admin_dashboard:load_districts_for_reports",
+             params=lambda ctx: {"state_id": ctx["state_id"]}),
+    Scenario("load_localbodies_for_reports", "super_admin_dashboard:load_localbodies_for_reports",
+             params=lambda ctx: {"district_id": ctx["district_id"]}),
+    Scenario("view_waste_profile", "super_admin_dashboard:view_waste_profile", args=lambda ctx: [ctx["profile_id"]]),
+    Scenario("get_calendar_dates", "super_admin_dashboard:get_calendar_dates", args=lambda ctx: [ctx["localbody_id"]]),
+    Scenario("search_locations_radius", "super_admin_dashboard:search_locations", params=lambda ctx: {
+        "lat": ctx["centre"][0], "lng": ctx["centre"][1], "radius_km": 2,
+    }),
+    Scenario("search_locations_nearest", "super_admin_dashboard:search_locations", params=lambda ctx: {
+        "lat": ctx["centre"][0], "lng": ctx["centre"][1], "k": 50,
+    }),
+    Scenario("map_clusters_state", "super_admin_dashboard:map_clusters", params=lambda ctx: {
+        "zoom": 8, "bbox": "8.0,74.5,13.0,77.5",
+    }),
+    Scenario("map_clusters_street", "super_admin_dashboard:map_clusters", params=lambda ctx: {
+        "zoom": 17, "bbox": _bbox(ctx, 0.005),
+    }),
+    Scenario("collector_route", "super_admin_dashboard:collector_route", args=lambda ctx: [ctx["collector_id"]]),
+    Scenario("export_collections_csv", "super_admin_dashboard:export_data", args=lambda ctx: ["collections"],
+             params=lambda ctx: {"start_date": (ctx["today"] - timedelta(days=30)).isoformat(),
+                                 "end_date": ctx["today"].isoformat()}),
+    Scenario("export_collectors_csv", "super_admin_dashboard:export_collectors_csv"),
+    Scenario("collector_manifest_admin", "waste_collector:collector_manifest",
+             params=lambda ctx: {"collector": ctx["collector_id"], "date": ctx["today"].isoformat()}),
+    # Super admin writes (rolled back)
+    Scenario("generate_calendar_dates_month", "super_admin_dashboard:generate_calendar_dates", method="post",
+             content_type="application/json", params=lambda ctx: {
+                 "district_ids": [ctx["district_id"]], "weekdays": ["tue", "fri"],
+                 "start": ctx["today"].isoformat(), "end": (ctx["today"] + timedelta(days=30)).isoformat(),
+             }),
+    Scenario("auto_assign_collectors_preview", "super_admin_dashboard:auto_assign_collectors", method="post",
+             params=lambda ctx: {"date": ctx["today"].isoformat(), "localbody": ctx["localbody_id"]}),
+    Scenario("auto_assign_collectors_apply", "super_admin_dashboard:auto_assign_collectors", method="post",
+             params=lambda ctx: {"date": ctx["today"].isoformat(), "localbody": ctx["localbody_id"], "preview": "0"}),
+    # Customer pages and endpoints
+    Scenario("customer_dashboard", "customer:customer_dashboard", user="customer"),
+    Scenario("waste_profile_list", "customer:waste_profile_list", user="customer"),
+    Scenario("waste_profile_detail", "customer:waste_profile_detail", user="customer",
+             args=lambda ctx: [ctx["profile_id"]]),
+    Scenario("waste_profile_form", "customer:waste_profile_create", user="customer"),
+    Scenario("load_wards_customer", "customer:load_wards_customer", user="customer",
+             args=lambda ctx: [ctx["localbody_id"]]),
+    Scenario("get_available_dates", "customer:get_available_dates", user="customer",
+             args=lambda ctx: [ctx["localbody_id"]]),
+    Scenario("location_history", "customer:location_history", user="customer", args=lambda ctx: [ctx["profile_id"]]),
+    Scenario("location_history_api", "customer:location_history_api", user="customer",
+             args=lambda ctx: [ctx["profile_id"]]),
+    Scenario("get_location_by_address", "customer:get_location_by_address", user="customer",
+             params=lambda ctx: {"address": "House 12, Temple Road"}),
+    Scenario("export_locations", "customer:export_locations", user="customer",
+             params=lambda ctx: {"bbox": _bbox(ctx, 0.05)}),
+    # Customer writes (rolled back)
+    Scenario("waste_profile_create", "customer:waste_profile_create", user="customer", method="post",
+             params=_profile_form),
+    Scenario("waste_profile_update", "customer:waste_profile_update", user="customer", method="post",
+             args=lambda ctx: [ctx["profile_id"]], params=_profile_form),
+    Scenario("save_pickup_date", "customer:save_pickup_date", user="customer", method="post",
+             params=lambda ctx: {"pickup_date": ctx["calendar_id"]}),
+    # Collector pages and endpoints
+    Scenario("collector_dashboard", "waste_collector:waste_collector_dashboard", user="collector"),
+    Scenario("assigned_customers", "waste_collector:assigned_customers", user="collector"),
+    Scenario("waste_collect_list", "waste_collector:waste_collect_list", user="collector"),
+    Scenario("collector_manifest", "waste_collector:collector_manifest", user="collector",
+             params=lambda ctx: {"date": ctx["today"].isoformat()}),
+    Scenario("sync_changes_full", "waste_collector:sync_changes", user="collector"),
+    # Collector writes (rolled back, so the same key is new on every run)
+    Scenario("sync_upload", "waste_collector:sync_upload", user="collector", method="post",
+             content_type="application/json", params=lambda ctx: {"collections": [
+                 {"key": f"bench-{ctx['collector_profile_id']}-{i}", "customer_waste_info_id": ctx["collector_profile_id"],
+                  "kg": "4.5", "number_of_bags": 2, "total_amount": "90", "payment_method": "cash",
+                  "collected_at": timezone.now().isoformat()}
+                 for i in range(20)
+             ]}),
+]
+
+
+def build_context():
+    """Ids and coordinates the scenarios need, taken from the generated dataset"""
+    admin = CustomUser.objects.filter(username=ADMIN_USERNAME).first()
+    if admin is None:
+        return None
+    # A profile with location history, so the history views have rows to page through
+    profile = (
+        CustomerLocationHistory.objects.filter(waste_info__user__username__startswith=PREFIX)
+        .values("waste_info_id").order_by("waste_info_id").first()
+    )
+    profile = CustomerWasteInfo.objects.select_related("user").get(pk=profile["waste_info_id"]) if profile else (
+        CustomerWasteInfo.objects.filter(user__username__startswith=PREFIX).select_related("user").order_by("id").first()
+    )
+    localbody = LocalBody.objects.select_related("district").get(pk=profile.localbody_id)
+    first_date = (
+        LocalBodyCalendar.objects.filter(localbody=localbody).order_by("date").values_list("date", flat=True).first()
+    )
+    # A date other than the booked ones, so rescheduling to it does some work
+    calendar_id = (
+        LocalBodyCalendar.objects.filter(localbody=localbody).exclude(customerpickupdate__user=profile.user)
+        .order_by("-date").values_list("id", flat=True).first()
+    )
+    collector = profile.assigned_collector or CustomUser.objects.filter(
+        username__startswith=f"{PREFIX}collector-"
+    ).order_by("id").first()
+    collector_profile_id = (
+        CustomerWasteInfo.objects.filter(assigned_collector=collector).order_by("id").values_list("id", flat=True).first()
+    )
+    return {
+        "users": {"admin": admin, "customer": profile.user, "collector": collector},
+        "profile_id": profile.pk,
+        "localbody_id": localbody.pk,
+        "district_id": localbody.district_id,
+        "state_id": localbody.district.state_id,
+        "collector_id": collector.pk,
+        "collector_profile_id": collector_profile_id,
+        "calendar_id": calendar_id,
+        "ward": profile.ward or "",
+        "centre": (float(profile.latitude), float(profile.longitude)),
+        "today": first_date or timezone.localdate(),
+    }
+
+
+def _consume(response):
+    """Response size in bytes; streaming responses are read to the end, as a browser would"""
+    if getattr(response, "streaming", False):
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def run_scenario(scenario, ctx, clients, repeat=5):
+    try:
+        url = reverse(scenario.url_name, args=scenario.args(ctx))
+    except NoReverseMatch:
+        return {"skipped": f"no URL named {scenario.url_name}"}
+    client = clients[scenario.user]
+    params = scenario.params(ctx)
+
+    def request():
+        if scenario.method == "get":
+            response = client.get(url, params)
+            return response, _consume(response)
+        with transaction.atomic():
+            if scenario.content_type:
+                response = client.post(url, params, content_type=scenario.content_type)
+            else:
+                response = client.post(url, params)
+            size = _consume(response)
+            transaction.set_rollback(True)
+        return response, size
+
+    request()  # warm caches, as in a running process
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        request()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    with CaptureQueriesContext(connection) as queries:
+        response, size = request()
+
+    tracemalloc.start()
+    try:
+        request()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "url": url,
+        "status": response.status_code,
+        "bytes": size,
+        "queries": len(queries.captured_queries),
+        "wall_ms": {
+            "median": round(statistics.median(timings), 2),
+            "min": round(min(timings), 2),
+            "max": round(max(timings), 2),
+        },
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(names=None, repeat=5, log=None):
+    ctx = build_context()
+    if ctx is None:
+        raise LookupError("No benchmark dataset; run seed_benchmark_data first")
+
+    results = {}
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+        clients = {}
+        for role, user in ctx["users"].items():
+            clients[role] = Client()
+            if user is not None:
+                clients[role].force_login(user)
+        for scenario in SCENARIOS:
+            if names and scenario.name not in names:
+                continue
+            results[scenario.name] = run_scenario(scenario, ctx, clients, repeat=repeat)
+            if log:
+                log(scenario.name, results[scenario.name])
+    return {
+        "meta": {
+            "vendor": connection.vendor,
+            "profiles": CustomerWasteInfo.objects.filter(user__username__startswith=PREFIX).count(),
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "timestamp": timezone.now().isoformat(),
+        },
+        "scenarios": results,
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """[(scenario, metric, baseline value, current value)] for every regression"""
+    regressions = []
+    factor = 1 + threshold / 100
+    for name, current in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before or "skipped" in before or "skipped" in current:
+            continue
+        if current["queries"] > before["queries"]:
+            regressions.append((name, "queries", before["queries"], current["queries"]))
+        now_ms, then_ms = current["wall_ms"]["median"], before["wall_ms"]["median"]
+        if now_ms > then_ms * factor and now_ms - then_ms > MIN_REGRESSION_MS:
+            regressions.append((name, "wall_ms", then_ms, now_ms))
+        if current["peak_kb"] > before["peak_kb"] * factor:
+            regressions.append((name, "peak_kb", before["peak_kb"], current["peak_kb"]))
+    return regressions
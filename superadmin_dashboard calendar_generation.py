@@ -0,0 +1,122 @@
+from datetime import timedelta
+
+from django.db import transaction
+
+from customer_dashboard.availability import invalidate_availability
+from waste_collector_dashboard.sync import record_calendar_changes
+from .models import LocalBodyCalendar
+
+
+BATCH_SIZE = 500
+MAX_RANGE_DAYS = 366 * 3
+
+WEEKDAY_NAMES = {
+    "mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6,
+}
+
+
+class CalendarRuleError(ValueError):
+    pass
+
+
+def parse_weekdays(values):
+    """Accept weekday numbers (0 = Monday) or names like 'tue' / 'Tuesday'"""
+    weekdays = set()
+    for value in values or []:
+        if isinstance(value, int) or str(value).isdigit():
+            day = int(value)
+        else:
+            day = WEEKDAY_NAMES.get(str(value).strip().lower()[:3])
+        if day is None or not 0 <= day <= 6:
+            raise CalendarRuleError(f"Invalid weekday: {value}")
+        weekdays.add(day)
+    return weekdays
+
+
+def parse_month_days(values):
+    month_days = set()
+    for value in values or []:
+        try:
+            day = int(value)
+        except (TypeError, ValueError):
+            raise CalendarRuleError(f"Invalid day of month: {value}")
+        if not 1 <= day <= 31:
+            raise CalendarRuleError(f"Invalid day of month: {value}")
+        month_days.add(day)
+    return month_days
+
+
+def expand_dates(start, end, weekdays=None, month_days=None, exclude=None):
+    """
+    Yield every date in [start, end] matching the recurrence rule.
+
+    A date matches when its weekday is in `weekdays` or its day of month is in
+    `month_days`; with neither given every day matches. Dates in `exclude`
+    are always skipped.
+    """
+    if start > end:
+        raise CalendarRuleError("Start date must be before end date")
+    if (end - start).days > MAX_RANGE_DAYS:
+        raise CalendarRuleError(f"Range cannot be longer than {MAX_RANGE_DAYS} days")
+
+    weekdays = weekdays or set()
+    month_days = month_days or set()
+    exclude = exclude or set()
+    every_day = not weekdays and not month_days
+
+    cur = start
+    while cur <= end:
+        if cur not in exclude and (every_day or cur.weekday() in weekdays or cur.day in month_days):
+            yield cur
+        cur += timedelta(days=1)
+
+
+def generate_calendar(localbody_ids, dates, dry_run=False):
+    """
+    Create LocalBodyCalendar rows for every (local body, date) pair.
+
+    Existing pairs are read with one query and skipped, the rest are inserted
+    with batched bulk_create(ignore_conflicts=True) and their ids are read back
+    with one more query, then logged for collector sync. In dry-run mode
+    nothing is written.
+    """
+    dates = sorted(set(dates))
+    localbody_ids = sorted(set(localbody_ids))
+    if not dates or not localbody_ids:
+        return {"to_create": 0, "existing": 0, "created": []}
+
+    existing = set(
+        LocalBodyCalendar.objects.filter(
+            localbody_id__in=localbody_ids,
+            date__range=(dates[0], dates[-1])
+        ).values_list("localbody_id", "date")
+    )
+    wanted = {(lb_id, d) for lb_id in localbody_ids for d in dates}
+    new_pairs = wanted - existing
+
+    result = {
+        "to_create": len(new_pairs),
+        "existing": len(wanted & existing),
+        "created": [],
+    }
+    if dry_run or not new_pairs:
+        return result
+
+    with transaction.atomic():
+        LocalBodyCalendar.objects.bulk_create(
+            [LocalBodyCalendar(localbody_id=lb_id, date=d) for lb_id, d in sorted(new_pairs)],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        rows = LocalBodyCalendar.objects.filter(
+            localbody_id__in=localbody_ids,
+            date__range=(dates[0], dates[-1])
+        ).values_list("id", "localbody_id", "date")
+        result["created"] = [
+            {"id": pk, "localbody_id": lb_id, "date": d.isoformat()}
+            for pk, lb_id, d in rows if (lb_id, d) in new_pairs
+        ]
+        # bulk_create sends no post_save, so the collectors' delta sync is told here
+        record_calendar_changes([(c["id"], c["localbody_id"]) for c in result["created"]])
+        transaction.on_commit(lambda: invalidate_availability(*localbody_ids))
+    return result
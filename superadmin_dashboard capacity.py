@@ -0,0 +1,261 @@
+"""
+Per-date (and optional per-ward) pickup capacity.
+
+Every LocalBodyCalendar entry gets a PickupSlot holding its capacity and a
+running `booked` counter. A reservation is a single conditional UPDATE
+
+    UPDATE ... SET booked = booked + 1 WHERE calendar_id = %s AND booked < capacity
+
+so the database row lock serialises concurrent bookings and a date can never
+be oversold, without holding locks across Python code. Ward limits work the
+same way on WardSlot rows and are taken in the same savepoint. Bookings that
+do not fit go to PickupWaitlist and are promoted, oldest first, when a
+booking on that date is released.
+"""
+from django.db import models, transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authentication.models import CustomUser
+from customer_dashboard.availability import default_capacity, invalidate_availability
+from customer_dashboard.models import CustomerPickupDate, CustomerWasteInfo
+from .models import LocalBodyCalendar
+
+
+class PickupSlot(models.Model):
+    calendar = models.OneToOneField(
+        LocalBodyCalendar, on_delete=models.CASCADE, primary_key=True, related_name="slot"
+    )
+    # None falls back to settings.PICKUP_DATE_CAPACITY (unlimited when that is unset too)
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    booked = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.calendar_id}: {self.booked}/{self.capacity}"
+
+
+class WardSlot(models.Model):
+    calendar = models.ForeignKey(LocalBodyCalendar, on_delete=models.CASCADE, related_name="ward_slots")
+    ward = models.CharField(max_length=50)
+    capacity = models.PositiveIntegerField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("calendar", "ward")
+
+    def __str__(self):
+        return f"{self.calendar_id} ward {self.ward}: {self.booked}/{self.capacity}"
+
+
+class PickupWaitlist(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    waste_info = models.ForeignKey(CustomerWasteInfo, on_delete=models.CASCADE, null=True, blank=True)
+    calendar = models.ForeignKey(LocalBodyCalendar, on_delete=models.CASCADE, related_name="waitlist")
+    ward = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("user", "calendar")
+        ordering = ["created_at", "id"]
+
+    def __str__(self):
+        return f"{self.user_id} waiting for {self.calendar_id}"
+
+
+DATE_FULL = "date"
+WARD_FULL = "ward"
+
+
+class _Full(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def ensure_slots(calendar_ids):
+    """Create missing PickupSlot rows, seeding `booked` from existing bookings"""
+    calendar_ids = set(calendar_ids)
+    if not calendar_ids:
+        return
+    existing = set(PickupSlot.objects.filter(calendar_id__in=calendar_ids).values_list("calendar_id", flat=True))
+    missing = calendar_ids - existing
+    if not missing:
+        return
+    counts = dict(
+        CustomerPickupDate.objects.filter(localbody_calendar_id__in=missing)
+        .values_list("localbody_calendar_id").annotate(n=Count("id"))
+    )
+    PickupSlot.objects.bulk_create(
+        [PickupSlot(calendar_id=pk, booked=counts.get(pk, 0)) for pk in missing],
+        ignore_conflicts=True,
+    )
+
+
+def _has_room():
+    capacity = default_capacity()
+    if capacity is None:
+        return Q(capacity__isnull=True) | Q(booked__lt=F("capacity"))
+    return Q(capacity__isnull=True, booked__lt=capacity) | Q(booked__lt=F("capacity"))
+
+
+def _take(calendar_id, ward, ward_limited):
+    """None when a place was taken, otherwise DATE_FULL or WARD_FULL. Slots must exist."""
+    try:
+        with transaction.atomic():
+            if ward_limited and not WardSlot.objects.filter(
+                calendar_id=calendar_id, ward=ward, booked__lt=F("capacity")
+            ).update(booked=F("booked") + 1):
+                raise _Full(WARD_FULL)
+            if not PickupSlot.objects.filter(_has_room(), calendar_id=calendar_id).update(booked=F("booked") + 1):
+                raise _Full(DATE_FULL)
+    except _Full as full:
+        return full.reason
+    return None
+
+
+def _ward_limited(calendar_ids, ward):
+    """Ids among calendar_ids that limit this ward"""
+    if not ward:
+        return set()
+    return set(WardSlot.objects.filter(calendar_id__in=calendar_ids, ward=ward).values_list("calendar_id", flat=True))
+
+
+def reserve(calendar_id, ward=None):
+    """
+    Take one place on a date (and in its ward, if that ward has a limit).
+    Returns False when the date or ward is full. Call inside a transaction.
+    """
+    return bool(reserve_many([calendar_id], ward))
+
+
+def reserve_many(calendar_ids, ward=None):
+    """
+    reserve() for several dates of one profile: slots and ward limits are
+    looked up once, then each date costs one conditional UPDATE (two when
+    its ward is limited). Returns the set of ids that got a place.
+    """
+    calendar_ids = list(calendar_ids)
+    ensure_slots(calendar_ids)
+    limited = _ward_limited(calendar_ids, ward)
+    return {pk for pk in calendar_ids if _take(pk, ward, pk in limited) is None}
+
+
+def release(calendar_id, ward=None):
+    """Give back a place taken by reserve()"""
+    PickupSlot.objects.filter(calendar_id=calendar_id, booked__gt=0).update(booked=F("booked") - 1)
+    if ward:
+        WardSlot.objects.filter(calendar_id=calendar_id, ward=ward, booked__gt=0).update(booked=F("booked") - 1)
+
+
+def join_waitlist(user, waste_info, calendar_id):
+    PickupWaitlist.objects.get_or_create(
+        user=user,
+        calendar_id=calendar_id,
+        defaults={"waste_info": waste_info, "ward": getattr(waste_info, "ward", "") or ""},
+    )
+
+
+def promote_waitlist(calendar_id):
+    """
+    Book waitlisted customers onto a date while it has room, oldest first.
+    Entries whose ward is full are skipped, so later entries for other
+    wards still get the place.
+    """
+    promoted = 0
+    full_wards = set()
+    ensure_slots([calendar_id])
+    while True:
+        with transaction.atomic():
+            entry = (
+                PickupWaitlist.objects.select_for_update(skip_locked=True)
+                .filter(calendar_id=calendar_id).exclude(ward__in=full_wards)
+                .order_by("created_at", "id").first()
+            )
+            if entry is None:
+                return promoted
+            already = CustomerPickupDate.objects.filter(user_id=entry.user_id, localbody_calendar_id=calendar_id)
+            if not already.exists():
+                full = _take(calendar_id, entry.ward, bool(_ward_limited([calendar_id], entry.ward)))
+                if full == DATE_FULL:
+                    return promoted
+                if full == WARD_FULL:
+                    full_wards.add(entry.ward)
+                    continue
+                CustomerPickupDate.objects.bulk_create([CustomerPickupDate(
+                    user_id=entry.user_id, waste_info_id=entry.waste_info_id, localbody_calendar_id=calendar_id
+                )])
+                promoted += 1
+            entry.delete()
+        invalidate_availability(
+            LocalBodyCalendar.objects.filter(pk=calendar_id).values_list("localbody_id", flat=True).first()
+        )
+
+
+def set_capacity(calendar_ids, capacity, ward=None):
+    """Set the limit on dates (capacity=None clears it); returns the number of slots changed"""
+    calendar_ids = list(calendar_ids)
+    ensure_slots(calendar_ids)
+    if ward:
+        if capacity is None:
+            return WardSlot.objects.filter(calendar_id__in=calendar_ids, ward=ward).delete()[0]
+        ensure_ward_slots(calendar_ids, ward)
+        changed = WardSlot.objects.filter(calendar_id__in=calendar_ids, ward=ward).update(capacity=capacity)
+    else:
+        changed = PickupSlot.objects.filter(calendar_id__in=calendar_ids).update(capacity=capacity)
+    invalidate_availability(*LocalBodyCalendar.objects.filter(pk__in=calendar_ids).values_list("localbody_id", flat=True))
+    for calendar_id in calendar_ids:
+        transaction.on_commit(lambda calendar_id=calendar_id: promote_waitlist(calendar_id))
+    return changed
+
+
+def ensure_ward_slots(calendar_ids, ward):
+    existing = set(
+        WardSlot.objects.filter(calendar_id__in=calendar_ids, ward=ward).values_list("calendar_id", flat=True)
+    )
+    missing = set(calendar_ids) - existing
+    if not missing:
+        return
+    counts = dict(
+        CustomerPickupDate.objects.filter(localbody_calendar_id__in=missing, waste_info__ward=ward)
+        .values_list("localbody_calendar_id").annotate(n=Count("id"))
+    )
+    WardSlot.objects.bulk_create(
+        [WardSlot(calendar_id=pk, ward=ward, capacity=0, booked=counts.get(pk, 0)) for pk in missing],
+        ignore_conflicts=True,
+    )
+
+
+def recount_slots(calendar_ids=None):
+    """Reset `booked` counters from the bookings table, e.g. after imports that bypass reserve()"""
+    slots = PickupSlot.objects.all()
+    if calendar_ids is not None:
+        slots = slots.filter(calendar_id__in=calendar_ids)
+    counts = dict(
+        CustomerPickupDate.objects.filter(localbody_calendar_id__in=slots.values("calendar_id"))
+        .values_list("localbody_calendar_id").annotate(n=Count("id"))
+    )
+    changed = []
+    for slot in slots:
+        booked = counts.get(slot.calendar_id, 0)
+        if slot.booked != booked:
+            slot.booked = booked
+            changed.append(slot)
+    PickupSlot.objects.bulk_update(changed, ["booked"], batch_size=500)
+    return len(changed)
+
+
+@receiver(post_delete, sender=CustomerPickupDate)
+def release_on_cancel(sender, instance, **kwargs):
+    ward = CustomerWasteInfo.objects.filter(pk=instance.waste_info_id).values_list("ward", flat=True).first()
+    release(instance.localbody_calendar_id, ward)
+    calendar_id = instance.localbody_calendar_id
+    transaction.on_commit(lambda: promote_waitlist(calendar_id))
+
+
+@receiver(post_save, sender=PickupSlot)
+@receiver(post_save, sender=WardSlot)
+def invalidate_on_capacity_change(sender, instance, **kwargs):
+    invalidate_availability(
+        LocalBodyCalendar.objects.filter(pk=instance.calendar_id).values_list("localbody_id", flat=True).first()
+    )
@@ -0,0 +1,232 @@
+"""
+Precomputed super-admin dashboard figures.
+
+DashboardCounter holds one row per figure. Save/delete signals on
+CustomUser, CustomerWasteInfo and WasteCollection adjust the rows with F()
+deltas inside the writing transaction, so a rolled back write never shows
+up in the counts. Collections are counted per calendar month
+("collections:2025-01"), which gives monthly_collections without a date
+range scan. reconcile_counters() recomputes everything exactly and is run
+periodically by the reconcile_dashboard_counters command.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from authentication.models import CustomUser
+from customer_dashboard.models import CustomerWasteInfo
+from customer_dashboard.snapshots import old_profile
+from waste_collector_dashboard.models import WasteCollection
+from .reporting import _day, _decimal
+
+
+ROLE_COUNTERS = {0: "customers", 1: "collectors"}
+ORDER_STATUSES = ("pending", "confirmed", "completed")
+WASTE_KG = "waste_kg"
+
+
+class DashboardCounter(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+def month_key(day):
+    return f"collections:{day:%Y-%m}"
+
+
+def order_counter(status):
+    """Counter name for a waste profile status; blank counts as pending, unknown statuses are not counted"""
+    status = (status or "pending").strip().lower()
+    return f"orders:{status}" if status in ORDER_STATUSES else None
+
+
+def add(name, delta):
+    if not name or not delta:
+        return
+    delta = Decimal(str(delta))
+    if DashboardCounter.objects.filter(name=name).update(value=F("value") + delta, updated_at=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            DashboardCounter.objects.create(name=name, value=delta)
+    except IntegrityError:
+        DashboardCounter.objects.filter(name=name).update(value=F("value") + delta, updated_at=timezone.now())
+
+
+def get_counters():
+    """The dashboard template's figures, read from one small indexed query"""
+    this_month = month_key(timezone.localdate())
+    names = [*ROLE_COUNTERS.values(), "orders", *(f"orders:{s}" for s in ORDER_STATUSES), this_month, WASTE_KG]
+    rows = dict(DashboardCounter.objects.filter(name__in=names).values_list("name", "value"))
+    if "orders" not in rows:
+        # Never reconciled yet (fresh install)
+        reconcile_counters()
+        rows = dict(DashboardCounter.objects.filter(name__in=names).values_list("name", "value"))
+
+    def count(name):
+        return int(rows.get(name) or 0)
+
+    return {
+        "total_customers": count("customers"),
+        "total_collectors": count("collectors"),
+        "total_orders": count("orders"),
+        "pending_orders": count("orders:pending"),
+        "confirmed_orders": count("orders:confirmed"),
+        "completed_orders": count("orders:completed"),
+        "monthly_collections": count(this_month),
+        "total_waste_collected": float(rows.get(WASTE_KG) or 0),
+    }
+
+
+def counters_version():
+    """
+    Changes whenever any counter changes, and at month rollover, when
+    monthly_collections switches to another row; used for ETags
+    """
+    latest = DashboardCounter.objects.order_by("-updated_at").values_list("updated_at", flat=True).first()
+    return f'{month_key(timezone.localdate())}:{latest.isoformat() if latest else ""}'
+
+
+def exact_counts():
+    values = {}
+    for role, count in CustomUser.objects.filter(role__in=ROLE_COUNTERS).values_list("role").annotate(n=Count("id")):
+        values[ROLE_COUNTERS[role]] = count
+
+    pending = Q(status__isnull=True) | Q(status="") | Q(status__iexact="pending")
+    orders = CustomerWasteInfo.objects.aggregate(
+        total=Count("id"),
+        pending=Count("id", filter=pending),
+        confirmed=Count("id", filter=Q(status__iexact="confirmed")),
+        completed=Count("id", filter=Q(status__iexact="completed")),
+    )
+    values["orders"] = orders["total"]
+    for status in ORDER_STATUSES:
+        values[f"orders:{status}"] = orders[status]
+
+    months = WasteCollection.objects.annotate(month=TruncMonth("created_at")).values("month").annotate(n=Count("id"))
+    for row in months:
+        if row["month"]:
+            values[month_key(row["month"])] = row["n"]
+    values[WASTE_KG] = WasteCollection.objects.aggregate(kg=Sum("kg"))["kg"] or 0
+    return values
+
+
+def reconcile_counters():
+    """Overwrite every counter with an exact recount. Returns {name: (old, new)} for those that drifted."""
+    with transaction.atomic():
+        exact = exact_counts()
+        current = {c.name: c for c in DashboardCounter.objects.select_for_update()}
+        drift = {}
+        for name, value in exact.items():
+            value = _decimal(value)
+            counter = current.pop(name, None)
+            if counter is None:
+                DashboardCounter.objects.create(name=name, value=value)
+                drift[name] = (None, value)
+            elif counter.value != value:
+                drift[name] = (counter.value, value)
+                DashboardCounter.objects.filter(name=name).update(value=value, updated_at=timezone.now())
+        for name, counter in current.items():
+            # e.g. a month whose collections were all deleted
+            if counter.value:
+                drift[name] = (counter.value, Decimal("0"))
+                DashboardCounter.objects.filter(name=name).update(value=0, updated_at=timezone.now())
+    return drift
+
+
+# CustomUser
+
+@receiver(pre_save, sender=CustomUser)
+def remember_old_role(sender, instance, raw=False, **kwargs):
+    instance._counter_role = None
+    if not raw and instance.pk:
+        instance._counter_role = CustomUser.objects.filter(pk=instance.pk).values_list("role", flat=True).first()
+
+
+@receiver(post_save, sender=CustomUser)
+def count_user(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else getattr(instance, "_counter_role", None)
+    if old != instance.role:
+        add(ROLE_COUNTERS.get(old), -1)
+        add(ROLE_COUNTERS.get(instance.role), 1)
+
+
+@receiver(post_delete, sender=CustomUser)
+def uncount_user(sender, instance, **kwargs):
+    add(ROLE_COUNTERS.get(instance.role), -1)
+
+
+# CustomerWasteInfo (orders)
+
+@receiver(post_save, sender=CustomerWasteInfo)
+def count_order(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        add("orders", 1)
+        add(order_counter(instance.status), 1)
+        return
+    old = old_profile(instance)
+    if old is None:
+        return
+    before, after = order_counter(old["status"]), order_counter(instance.status)
+    if before != after:
+        add(before, -1)
+        add(after, 1)
+
+
+@receiver(post_delete, sender=CustomerWasteInfo)
+def uncount_order(sender, instance, **kwargs):
+    add("orders", -1)
+    add(order_counter(instance.status), -1)
+
+
+# WasteCollection
+
+def _collection(collection):
+    return month_key(_day(collection.created_at)), _decimal(collection.kg)
+
+
+@receiver(pre_save, sender=WasteCollection)
+def remember_old_collection(sender, instance, raw=False, **kwargs):
+    instance._counter_old = None
+    if not raw and instance.pk:
+        old = WasteCollection.objects.filter(pk=instance.pk).values_list("created_at", "kg").first()
+        if old:
+            instance._counter_old = (month_key(_day(old[0])), _decimal(old[1]))
+
+
+@receiver(post_save, sender=WasteCollection)
+def count_collection(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    month, kg = _collection(instance)
+    old = None if created else getattr(instance, "_counter_old", None)
+    if old is None and not created:
+        return
+    if old:
+        if old[0] != month:
+            add(old[0], -1)
+            add(month, 1)
+        add(WASTE_KG, kg - old[1])
+    else:
+        add(month, 1)
+        add(WASTE_KG, kg)
+
+
+@receiver(post_delete, sender=WasteCollection)
+def uncount_collection(sender, instance, **kwargs):
+    month, kg = _collection(instance)
+    add(month, -1)
+    add(WASTE_KG, -kg)
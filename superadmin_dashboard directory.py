@@ -0,0 +1,98 @@
+"""
+Role-grouped user directory.
+
+Listing pages read only DIRECTORY_FIELDS (never the password hash or
+other unused columns). The first page of every role comes from a single
+query that numbers rows per role with ROW_NUMBER() OVER (PARTITION BY
+role); later pages of one role are keyset pages. Role counts are one
+GROUP BY, cached until a user is added, removed or saved with a new role.
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from authentication.models import CustomUser
+from .pagination import InvalidCursor, KeysetPaginator
+
+
+DIRECTORY_FIELDS = (
+    "id", "username", "first_name", "last_name", "email",
+    "contact_number", "role", "is_active", "date_joined",
+)
+ROLES = {"customers": 0, "collectors": 1, "super_admins": 2, "admins": 3}
+COUNTS_KEY = "user_directory:role_counts"
+COUNTS_CACHE_SECONDS = 600
+DEFAULT_PAGE_SIZE = 50
+
+
+def role_counts():
+    """{"customers": n, "collectors": n, "super_admins": n, "admins": n}"""
+    counts = cache.get(COUNTS_KEY)
+    if counts is None:
+        by_role = dict(CustomUser.objects.order_by().values_list("role").annotate(n=Count("id")))
+        counts = {name: by_role.get(role, 0) for name, role in ROLES.items()}
+        cache.set(COUNTS_KEY, counts, COUNTS_CACHE_SECONDS)
+    return counts
+
+
+def directory_users(role=None):
+    users = CustomUser.objects.only(*DIRECTORY_FIELDS)
+    return users if role is None else users.filter(role=role)
+
+
+def _paginator(role, page_size, count=None):
+    return KeysetPaginator(directory_users(role), ordering="-id", page_size=page_size, count=count)
+
+
+def first_pages(page_size=DEFAULT_PAGE_SIZE):
+    """{role name: KeysetPage} with the first page of every role, from one query"""
+    counts = role_counts()
+    paginators = {name: _paginator(role, page_size, counts[name]) for name, role in ROLES.items()}
+    page_size = next(iter(paginators.values())).page_size
+    numbered = CustomUser.objects.only(*DIRECTORY_FIELDS).annotate(
+        row_number=Window(RowNumber(), partition_by=[F("role")], order_by=F("id").desc())
+    ).filter(row_number__lte=page_size + 1).order_by("role", "-id")
+
+    rows = {role: [] for role in ROLES.values()}
+    for user in numbered:
+        if user.role in rows:
+            rows[user.role].append(user)
+    return {name: paginators[name].first_page(rows[role]) for name, role in ROLES.items()}
+
+
+def role_page(role, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """One keyset page (cursor token or page number) of a role's users; an invalid cursor falls back to the first page"""
+    name = next(name for name, value in ROLES.items() if value == role)
+    paginator = _paginator(role, page_size, role_counts()[name])
+    try:
+        return paginator.get_page(cursor)
+    except InvalidCursor:
+        return paginator.get_page(None)
+
+
+def serialise(user):
+    return {
+        "id": user.id,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "email": user.email,
+        "contact_number": user.contact_number,
+        "role": user.role,
+        "is_active": user.is_active,
+        "date_joined": user.date_joined.isoformat() if user.date_joined else None,
+    }
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_counts_on_save(sender, instance, created, update_fields=None, **kwargs):
+    # Saves that cannot change the role (e.g. last_login on every login) keep the cache
+    if created or update_fields is None or "role" in update_fields:
+        cache.delete(COUNTS_KEY)
+
+
+@receiver(post_delete, sender=CustomUser)
+def invalidate_counts_on_delete(sender, instance, **kwargs):
+    cache.delete(COUNTS_KEY)
@@ -0,0 +1,230 @@
+"""
+Streaming CSV / XLSX exports.
+
+Rows are read with .iterator(chunk_size=...) and written out as they come,
+so memory stays flat however many rows are exported. CSV is streamed
+straight into the response; XLSX uses openpyxl's write-only mode spooled
+to a temporary file, which is then streamed back.
+
+Both formats write datetimes in local time, and text cells that a
+spreadsheet would read as a formula (=, +, -, @) are prefixed with a
+quote, since names and addresses are entered by customers.
+"""
+import csv
+import tempfile
+from datetime import datetime
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from authentication.models import CustomUser
+from customer_dashboard.models import CustomerWasteInfo
+from waste_collector_dashboard.models import WasteCollection
+from .reporting import rollup_report
+
+
+CHUNK_SIZE = 2000
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+class Echo:
+    """File-like object whose write() just returns the line, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def _parse_day(params, name):
+    value = params.get(name)
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}")
+
+
+def report_filters(params):
+    """The filters generate_reports accepts; raises ValueError for an invalid date"""
+    return {
+        "start_date": _parse_day(params, "start_date"),
+        "end_date": _parse_day(params, "end_date"),
+        "state_id": params.get("state") or None,
+        "district_id": params.get("district") or None,
+        "localbody_id": params.get("localbody") or None,
+    }
+
+
+def _profiles_in(filters):
+    profiles = CustomerWasteInfo.objects.all()
+    if filters["state_id"]:
+        profiles = profiles.filter(state_id=filters["state_id"])
+    if filters["district_id"]:
+        profiles = profiles.filter(district_id=filters["district_id"])
+    if filters["localbody_id"]:
+        profiles = profiles.filter(localbody_id=filters["localbody_id"])
+    return profiles
+
+
+def _has_location(filters):
+    return any(filters[key] for key in ("state_id", "district_id", "localbody_id"))
+
+
+def collection_rows(filters):
+    columns = [
+        ("ID", "id"), ("Customer", "customer__username"), ("Collector", "collector__username"),
+        ("Local Body", "localbody"), ("Ward", "ward"), ("Location", "location"),
+        ("Building No", "building_no"), ("Street", "street_name"), ("Bags", "number_of_bags"),
+        ("Kg", "kg"), ("Amount", "total_amount"), ("Booking Date", "booking_date"),
+        ("Collection Time", "collection_time"), ("Created At", "created_at"),
+    ]
+    collections = WasteCollection.objects.all()
+    if filters["start_date"]:
+        collections = collections.filter(created_at__date__gte=filters["start_date"])
+    if filters["end_date"]:
+        collections = collections.filter(created_at__date__lte=filters["end_date"])
+    if _has_location(filters):
+        collections = collections.filter(customer_id__in=_profiles_in(filters).values("user_id"))
+    return columns, collections.order_by("id")
+
+
+def waste_profile_rows(filters):
+    columns = [
+        ("ID", "id"), ("Customer", "user__username"), ("Full Name", "full_name"),
+        ("Contact", "user__contact_number"), ("Secondary Number", "secondary_number"),
+        ("Address", "pickup_address"), ("Landmark", "landmark"), ("Pincode", "pincode"),
+        ("State", "state__name"), ("District", "district__name"), ("Local Body", "localbody__name"),
+        ("Ward", "ward"), ("Bags", "number_of_bags"), ("Waste Type", "waste_type"),
+        ("Status", "status"), ("Latitude", "latitude"), ("Longitude", "longitude"),
+        ("Collector", "assigned_collector__username"), ("Created At", "created_at"),
+    ]
+    profiles = _profiles_in(filters)
+    if filters["start_date"]:
+        profiles = profiles.filter(created_at__date__gte=filters["start_date"])
+    if filters["end_date"]:
+        profiles = profiles.filter(created_at__date__lte=filters["end_date"])
+    return columns, profiles.order_by("id")
+
+
+def user_rows(filters, role=None):
+    columns = [
+        ("ID", "id"), ("Username", "username"), ("First Name", "first_name"), ("Last Name", "last_name"),
+        ("Email", "email"), ("Contact", "contact_number"), ("Role", "role"),
+        ("Active", "is_active"), ("Date Joined", "date_joined"),
+    ]
+    users = CustomUser.objects.all()
+    if role is not None:
+        users = users.filter(role=role)
+    if filters["start_date"]:
+        users = users.filter(date_joined__date__gte=filters["start_date"])
+    if filters["end_date"]:
+        users = users.filter(date_joined__date__lte=filters["end_date"])
+    return columns, users.order_by("id")
+
+
+REPORT_COLUMNS = [
+    ("State", "customer__customer_info__state__name"),
+    ("District", "customer__customer_info__district__name"),
+    ("Local Body", "customer__customer_info__localbody__name"),
+    ("Date", "created_at__date"),
+    ("Total Kg", "total_weight"),
+    ("Orders", "order_count"),
+    ("Amount", "total_amount"),
+]
+
+
+def iter_rows(columns, source):
+    """Yield value tuples from a queryset (streamed in chunks) or a list of dicts"""
+    fields = [field for _, field in columns]
+    if isinstance(source, list):
+        for row in source:
+            yield [row.get(field) for field in fields]
+    else:
+        yield from source.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+
+
+def dataset_rows(dataset, filters, role=None):
+    """(columns, source) for an export name, or None if the name is unknown"""
+    if dataset == "collections":
+        return collection_rows(filters)
+    if dataset == "waste_profiles":
+        return waste_profile_rows(filters)
+    if dataset == "users":
+        return user_rows(filters, role)
+    if dataset == "reports":
+        return REPORT_COLUMNS, rollup_report(**filters)["report_data"]
+    return None
+
+
+def _cell(value):
+    """A value as written to either format: local naive datetimes, neutralised formulas"""
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _format(value):
+    value = _cell(value)
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    return value
+
+
+def csv_response(columns, source, filename):
+    writer = csv.writer(Echo())
+
+    def stream():
+        yield writer.writerow([header for header, _ in columns])
+        for row in iter_rows(columns, source):
+            yield writer.writerow([_format(v) for v in row])
+
+    response = StreamingHttpResponse(stream(), content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def write_csv(columns, source, fileobj, progress=None):
+    """
+    Write an export as CSV to a text file object, e.g. for background jobs.
+    progress(rows written) is called every CHUNK_SIZE rows.
+    """
+    writer = csv.writer(fileobj)
+    writer.writerow([header for header, _ in columns])
+    count = 0
+    for row in iter_rows(columns, source):
+        writer.writerow([_format(v) for v in row])
+        count += 1
+        if progress and count % CHUNK_SIZE == 0:
+            progress(count)
+    return count
+
+
+def write_xlsx(columns, source, fileobj, title="Export", progress=None):
+    """Write an export as XLSX to a binary file object"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title[:31])
+    sheet.append([header for header, _ in columns])
+    count = 0
+    for row in iter_rows(columns, source):
+        sheet.append([_cell(value) for value in row])
+        count += 1
+        if progress and count % CHUNK_SIZE == 0:
+            progress(count)
+    workbook.save(fileobj)
+    return count
+
+
+def xlsx_response(columns, source, filename):
+    spool = tempfile.TemporaryFile()
+    write_xlsx(columns, source, spool, title=filename)
+    spool.seek(0)
+    return FileResponse(
+        spool,
+        as_attachment=True,
+        filename=f"{filename}.xlsx",
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
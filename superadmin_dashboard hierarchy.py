@@ -0,0 +1,129 @@
+"""
+State -> District -> LocalBody reference data, built once and shared.
+
+The tree is kept in process memory and in the shared cache under a version
+stamp. Saving or deleting any State, District or LocalBody bumps the stamp,
+so every process rebuilds (or re-reads from the cache) on its next access.
+"""
+import json
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import State, District, LocalBody
+
+
+VERSION_KEY = "geo_hierarchy:version"
+TREE_KEY = "geo_hierarchy:tree:{version}"
+# How long a process trusts its in-memory copy before re-checking the version
+LOCAL_CHECK_SECONDS = 5
+
+_local = {"version": None, "tree": None, "checked_at": 0.0}
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex[:12], None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    cache.set(VERSION_KEY, uuid.uuid4().hex[:12], None)
+    _local.update(version=None, tree=None, checked_at=0.0)
+
+
+def build_tree(version):
+    states = list(State.objects.order_by("name").values("id", "name"))
+    districts = list(District.objects.order_by("name").values("id", "name", "state_id"))
+    localbodies = list(LocalBody.objects.order_by("name").values("id", "name", "body_type", "district_id"))
+
+    districts_by_state = {}
+    for d in districts:
+        districts_by_state.setdefault(d["state_id"], []).append({"id": d["id"], "name": d["name"]})
+
+    localbodies_by_district = {}
+    for lb in localbodies:
+        localbodies_by_district.setdefault(lb["district_id"], []).append(
+            {"id": lb["id"], "name": lb["name"], "body_type": lb["body_type"]}
+        )
+
+    # Compact document for forms: [state_id, name, [[district_id, name, [[lb_id, name, body_type]]]]]
+    compact = {
+        "v": version,
+        "states": [
+            [s["id"], s["name"], [
+                [d["id"], d["name"], [
+                    [lb["id"], lb["name"], lb["body_type"]]
+                    for lb in localbodies_by_district.get(d["id"], [])
+                ]]
+                for d in districts_by_state.get(s["id"], [])
+            ]]
+            for s in states
+        ],
+    }
+
+    return {
+        "version": version,
+        "states": states,
+        "districts_by_state": districts_by_state,
+        "localbodies_by_district": localbodies_by_district,
+        "compact_json": json.dumps(compact, separators=(",", ":")),
+    }
+
+
+def get_hierarchy():
+    now = time.monotonic()
+    if _local["tree"] is not None and now - _local["checked_at"] < LOCAL_CHECK_SECONDS:
+        return _local["tree"]
+
+    version = get_version()
+    if _local["tree"] is None or _local["version"] != version:
+        tree = cache.get(TREE_KEY.format(version=version))
+        if tree is None:
+            tree = build_tree(version)
+            cache.set(TREE_KEY.format(version=version), tree, None)
+        _local.update(version=version, tree=tree)
+    _local["checked_at"] = now
+    return _local["tree"]
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_states():
+    return [{"id": s["id"], "name": s["name"]} for s in get_hierarchy()["states"]]
+
+
+def get_districts(state_id):
+    return get_hierarchy()["districts_by_state"].get(_to_int(state_id), [])
+
+
+def get_localbodies(district_id, with_body_type=True):
+    localbodies = get_hierarchy()["localbodies_by_district"].get(_to_int(district_id), [])
+    if with_body_type:
+        return localbodies
+    return [{"id": lb["id"], "name": lb["name"]} for lb in localbodies]
+
+
+def hierarchy_etag(request, *args, **kwargs):
+    """ETag function for django.views.decorators.http.etag"""
+    return get_hierarchy()["version"]
+
+
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+@receiver(post_save, sender=District)
+@receiver(post_delete, sender=District)
+@receiver(post_save, sender=LocalBody)
+@receiver(post_delete, sender=LocalBody)
+def invalidate_hierarchy(sender, **kwargs):
+    bump_version()
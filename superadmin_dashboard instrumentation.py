@@ -0,0 +1,236 @@
+"""
+Per-view request and SQL instrumentation.
+
+RequestMetricsMiddleware wraps every request in connection.execute_wrapper
+to count queries and their time, and records per URL name:
+
+    http_requests_total{view,method,status}
+    http_request_duration_seconds (histogram)
+    db_queries_per_request (histogram)
+    db_query_duration_seconds_total
+    db_duplicate_queries_total{view,callsite}
+
+Queries are fingerprinted (literals stripped); a fingerprint repeated
+N_PLUS_ONE_THRESHOLD times within one request is reported as a likely N+1
+together with the first application frame that issued it. Requests over
+SLOW_REQUEST_MS or SLOW_REQUEST_QUERIES are logged to the
+"waste.slow_requests" logger.
+
+Metrics are kept in process memory and served in Prometheus text format
+by metrics_view; each worker process exposes its own numbers. The
+per-query cost is a perf_counter pair, two regex substitutions over the
+SQL for its fingerprint and a dict increment; stacks are only inspected
+once per duplicated fingerprint.
+
+The metrics name queries and source lines, so metrics_view answers only
+super admins and scrapers sending "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_ALLOWED_IPS is off by default: behind a reverse proxy every
+request comes from the proxy's address.
+
+Settings (all optional):
+    METRICS_ENABLED = True
+    METRICS_TOKEN = None
+    METRICS_ALLOWED_IPS = []
+    SLOW_REQUEST_MS = 1000
+    SLOW_REQUEST_QUERIES = 100
+    N_PLUS_ONE_THRESHOLD = 10
+"""
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .utils import is_super_admin
+
+
+logger = logging.getLogger("waste.slow_requests")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+MAX_CALLSITES_PER_VIEW = 20
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)")
+_DJANGO_DIR = os.sep + "django" + os.sep
+_SITE_DIRS = ("site-packages", "dist-packages")
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def fingerprint(sql):
+    """SQL with literals and IN lists collapsed, so N+1 variants compare equal"""
+    return _IN_LIST_RE.sub("(...)", _LITERAL_RE.sub("?", sql))
+
+
+def callsite():
+    """First stack frame outside Django, site-packages and this module, as 'file:line in func'"""
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = frame.filename
+        if filename == __file__ or _DJANGO_DIR in filename or any(d in filename for d in _SITE_DIRS):
+            continue
+        return f"{os.path.basename(filename)}:{frame.lineno} in {frame.name}"
+    return "unknown"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)                     # (view, method, status) -> n
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.sql_seconds = defaultdict(float)
+        self.duplicates = defaultdict(int)                   # (view, callsite) -> n
+
+    def record(self, view, method, status, seconds, recorder):
+        with self.lock:
+            self.requests[(view, method, status)] += 1
+            self.latency[view].observe(seconds)
+            self.queries[view].observe(recorder.count)
+            self.sql_seconds[view] += recorder.seconds
+            for site in recorder.duplicate_sites.values():
+                key = (view, site)
+                if key in self.duplicates or sum(1 for v, _ in self.duplicates if v == view) < MAX_CALLSITES_PER_VIEW:
+                    self.duplicates[key] += 1
+
+    def render(self):
+        lines = []
+
+        def label(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+        def histogram(name, help_text, data):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for view, h in sorted(data.items()):
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{view="{label(view)}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{view="{label(view)}",le="+Inf"}} {h.count}')
+                lines.append(f'{name}_sum{{view="{label(view)}"}} {h.total:.6f}')
+                lines.append(f'{name}_count{{view="{label(view)}"}} {h.count}')
+
+        with self.lock:
+            lines.append("# HELP http_requests_total Requests by view, method and status")
+            lines.append("# TYPE http_requests_total counter")
+            for (view, method, status), n in sorted(self.requests.items()):
+                lines.append(
+                    f'http_requests_total{{view="{label(view)}",method="{method}",status="{status}"}} {n}'
+                )
+            histogram("http_request_duration_seconds", "Request latency", self.latency)
+            histogram("db_queries_per_request", "SQL queries per request", self.queries)
+            lines.append("# HELP db_query_duration_seconds_total Time spent in SQL")
+            lines.append("# TYPE db_query_duration_seconds_total counter")
+            for view, seconds in sorted(self.sql_seconds.items()):
+                lines.append(f'db_query_duration_seconds_total{{view="{label(view)}"}} {seconds:.6f}')
+            lines.append("# HELP db_duplicate_queries_total Requests with a repeated query (likely N+1), by call site")
+            lines.append("# TYPE db_duplicate_queries_total counter")
+            for (view, site), n in sorted(self.duplicates.items()):
+                lines.append(f'db_duplicate_queries_total{{view="{label(view)}",callsite="{label(site)}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """connection.execute_wrapper callable counting queries, their time and repeats"""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.count = 0
+        self.seconds = 0.0
+        self.seen = defaultdict(int)
+        self.duplicate_sites = {}     # fingerprint -> call site
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            key = fingerprint(sql)
+            self.seen[key] += 1
+            if self.seen[key] == self.threshold:
+                self.duplicate_sites[key] = callsite()
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = _setting("METRICS_ENABLED", True)
+        self.threshold = _setting("N_PLUS_ONE_THRESHOLD", 10)
+        self.slow_ms = _setting("SLOW_REQUEST_MS", 1000)
+        self.slow_queries = _setting("SLOW_REQUEST_QUERIES", 100)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        recorder = QueryRecorder(self.threshold)
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name or match._func_path) if match else "unresolved"
+        registry.record(view, request.method, response.status_code, seconds, recorder)
+
+        if seconds * 1000 >= self.slow_ms or recorder.count >= self.slow_queries:
+            logger.warning(
+                "Slow request %s %s (%s): %.0f ms, %d queries, %.0f ms SQL%s",
+                request.method, request.path, view, seconds * 1000, recorder.count, recorder.seconds * 1000,
+                "".join(
+                    f"; {recorder.seen[key]}x at {site}: {key[:200]}"
+                    for key, site in recorder.duplicate_sites.items()
+                ),
+            )
+        return response
+
+
+def _may_scrape(request):
+    token = _setting("METRICS_TOKEN", None)
+    if token and hmac.compare_digest(
+        request.META.get("HTTP_AUTHORIZATION", "").encode(), f"Bearer {token}".encode()
+    ):
+        return True
+    if request.META.get("REMOTE_ADDR") in _setting("METRICS_ALLOWED_IPS", []):
+        return True
+    user = getattr(request, "user", None)
+    return bool(user and user.is_authenticated and is_super_admin(user))
+
+
+def metrics_view(request):
+    """Prometheus text exposition, for super admins, METRICS_TOKEN bearers and METRICS_ALLOWED_IPS"""
+    if not _may_scrape(request):
+        return HttpResponseForbidden("Forbidden")
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,369 @@
+"""
+Database-backed background jobs for heavy admin operations.
+
+Views enqueue a BackgroundJob row and answer 202 with its status URL; the
+run_jobs command claims queued rows and executes them in a process pool,
+so long reports, exports and calendar ranges never hold a web worker.
+No broker is involved: claiming is a conditional UPDATE (status still
+"queued"), which is safe with any number of runners on SQLite or
+PostgreSQL.
+
+A running job reports progress through the callback it is given. Its
+heartbeat is refreshed every JOB_HEARTBEAT_SECONDS by a thread in the
+worker, so a job that reports rarely is not mistaken for a dead one. Jobs
+that raise are retried with exponential backoff up to max_attempts. Jobs
+whose heartbeat stops (a killed worker) are queued again by
+requeue_stale(). Every write that ends a run is conditional on the job
+still being in the attempt that was claimed, so a run that was given up
+on cannot overwrite the outcome of its retry. Results are stored
+on the row (JSON) and, for files, in default storage under
+job_results/<id>/; both are removed by purge_expired() once expires_at
+has passed.
+
+Settings (all optional):
+    JOB_RESULT_SECONDS = 86400
+    JOB_STALE_SECONDS = 600
+    JOB_HEARTBEAT_SECONDS = 60
+    JOB_MAX_ATTEMPTS = 3
+"""
+import io
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, models
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from authentication.models import CustomUser
+
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+RETRY_BASE_SECONDS = 30
+RESULT_ROOT = "job_results"
+REPORT_PREVIEW_ROWS = 500
+
+REPORT_PERIODS = {
+    "daily_collection": ("Daily Collection Report", 0),
+    "weekly_collection": ("Weekly Collection Report", 6),
+    "monthly_collection": ("Monthly Collection Report", 29),
+    "collection": ("Collection Report", None),
+}
+
+JOB_TYPES = {}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class BackgroundJob(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=30)
+    params = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, default=QUEUED, db_index=True)
+    progress = models.PositiveSmallIntegerField(default=0)
+    message = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now, db_index=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    result_file = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(CustomUser, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.kind} {self.id} ({self.status})"
+
+
+def job_type(name):
+    """Register a job function: fn(params, progress) -> (result dict, None or (filename, bytes or binary file))"""
+    def register(fn):
+        JOB_TYPES[name] = fn
+        return fn
+    return register
+
+
+def enqueue(kind, params, user=None, max_attempts=None):
+    if kind not in JOB_TYPES:
+        raise ValueError(f"Unknown job type: {kind}")
+    return BackgroundJob.objects.create(
+        kind=kind, params=params, created_by=user,
+        max_attempts=max_attempts or _setting("JOB_MAX_ATTEMPTS", 3),
+    )
+
+
+def claim_next():
+    """Mark the oldest due job as running and return (id, attempt number), or None"""
+    now = timezone.now()
+    candidates = BackgroundJob.objects.filter(status=QUEUED, run_after__lte=now).order_by(
+        "run_after", "created_at"
+    ).values_list("id", "attempts")[:10]
+    for job_id, attempts in candidates:
+        claimed = BackgroundJob.objects.filter(pk=job_id, status=QUEUED, attempts=attempts).update(
+            status=RUNNING, attempts=attempts + 1, started_at=now, heartbeat_at=now,
+            progress=0, message="Started",
+        )
+        if claimed:
+            return job_id, attempts + 1
+    return None
+
+
+def report_progress(job_id, percent, message=""):
+    BackgroundJob.objects.filter(pk=job_id, status=RUNNING).update(
+        progress=max(0, min(int(percent), 100)), message=message[:255], heartbeat_at=timezone.now()
+    )
+
+
+class _Heartbeat(threading.Thread):
+    """Refreshes a running job's heartbeat until stopped, however long the job goes without reporting"""
+
+    def __init__(self, job_id, attempts):
+        super().__init__(name=f"heartbeat-{job_id}", daemon=True)
+        self.job_id = job_id
+        self.attempts = attempts
+        self.stopped = threading.Event()
+
+    def run(self):
+        interval = _setting("JOB_HEARTBEAT_SECONDS", 60)
+        try:
+            while not self.stopped.wait(interval):
+                BackgroundJob.objects.filter(pk=self.job_id, status=RUNNING, attempts=self.attempts).update(
+                    heartbeat_at=timezone.now()
+                )
+        except Exception:
+            logger.exception("Heartbeat of job %s stopped", self.job_id)
+        finally:
+            # This thread's own connection
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def _store_result_file(job_id, filename, content):
+    """content is bytes or an open binary file, which is closed once stored"""
+    path = f"{RESULT_ROOT}/{job_id}/{filename}"
+    if isinstance(content, bytes):
+        return default_storage.save(path, ContentFile(content))
+    try:
+        content.seek(0)
+        return default_storage.save(path, File(content, name=filename))
+    finally:
+        content.close()
+
+
+def fail_or_retry(job_id, error, attempts=None):
+    """
+    Queue a failed attempt again with backoff, or mark the job failed for good.
+    With attempts, only if the job is still running that attempt.
+    """
+    job = BackgroundJob.objects.filter(pk=job_id, status=RUNNING).only("attempts", "max_attempts").first()
+    if job is None or (attempts is not None and job.attempts != attempts):
+        return
+    current = BackgroundJob.objects.filter(pk=job_id, status=RUNNING, attempts=job.attempts)
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        current.update(
+            status=QUEUED, error=error, message=f"Retrying (attempt {job.attempts} failed)",
+            run_after=now + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1)),
+        )
+    else:
+        current.update(
+            status=FAILED, error=error, message="Failed", finished_at=now,
+            expires_at=now + timedelta(seconds=_setting("JOB_RESULT_SECONDS", 86400)),
+        )
+
+
+def execute_job(job_id, attempts):
+    """
+    Run attempt `attempts` of a claimed job; called in a worker process.
+    Returns the final status, or None if the attempt was given up on meanwhile.
+    """
+    job = BackgroundJob.objects.filter(pk=job_id, status=RUNNING, attempts=attempts).first()
+    if job is None:
+        return None
+    heartbeat = _Heartbeat(job_id, attempts)
+    heartbeat.start()
+    try:
+        result, attachment = JOB_TYPES[job.kind](job.params, lambda p, m="": report_progress(job_id, p, m))
+        result_file = _store_result_file(job_id, *attachment) if attachment else ""
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job_id, job.kind)
+        fail_or_retry(job_id, f"{type(e).__name__}: {e}", attempts)
+        status = FAILED
+    else:
+        now = timezone.now()
+        finished = BackgroundJob.objects.filter(pk=job_id, status=RUNNING, attempts=attempts).update(
+            status=SUCCEEDED, progress=100, message="Done", result=result, result_file=result_file,
+            error="", finished_at=now, expires_at=now + timedelta(seconds=_setting("JOB_RESULT_SECONDS", 86400)),
+        )
+        status = SUCCEEDED
+        if not finished:
+            # Requeued as stale while running; the retry owns the job now
+            logger.warning("Job %s attempt %s finished after it was given up on", job_id, attempts)
+            if result_file:
+                default_storage.delete(result_file)
+            status = None
+    finally:
+        # Its updates are conditional on the job running, so stopping it last is harmless
+        heartbeat.stop()
+        # Worker processes are long-lived; do not keep a connection open between jobs
+        connections.close_all()
+    return status
+
+
+def requeue_stale():
+    """Jobs whose worker died mid-run (no heartbeat for JOB_STALE_SECONDS) count as a failed attempt"""
+    cutoff = timezone.now() - timedelta(seconds=_setting("JOB_STALE_SECONDS", 600))
+    stale = list(BackgroundJob.objects.filter(status=RUNNING, heartbeat_at__lt=cutoff).values_list("id", flat=True))
+    for job_id in stale:
+        fail_or_retry(job_id, "Worker stopped responding")
+    return len(stale)
+
+
+def purge_expired():
+    expired = BackgroundJob.objects.filter(expires_at__lt=timezone.now())
+    for path in expired.exclude(result_file="").values_list("result_file", flat=True):
+        try:
+            default_storage.delete(path)
+        except OSError:
+            logger.warning("Could not delete job result %s", path)
+    return expired.delete()[0]
+
+
+def serialise(job, download_url=None):
+    return {
+        "id": str(job.id),
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.message,
+        "attempts": job.attempts,
+        "result": job.result,
+        "download_url": download_url if job.result_file else None,
+        "error": job.error if job.status == FAILED else "",
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "expires_at": job.expires_at.isoformat() if job.expires_at else None,
+    }
+
+
+def result_filename(job):
+    return os.path.basename(job.result_file)
+
+
+# Job types
+
+def report_params(report_type, params, today=None):
+    """Filters for a dashboard report type; REPORT_PERIODS types fix the date range"""
+    if report_type not in REPORT_PERIODS:
+        raise ValueError(f"Unknown report type: {report_type}")
+    name, days = REPORT_PERIODS[report_type]
+    today = today or timezone.localdate()
+    filters = {key: params.get(key) or None for key in ("start_date", "end_date", "state", "district", "localbody")}
+    if days is not None:
+        filters["start_date"] = (today - timedelta(days=days)).isoformat()
+        filters["end_date"] = today.isoformat()
+    return {"report_type": report_type, "report_name": name, **filters}
+
+
+@job_type("report")
+def run_report(params, progress):
+    from .exports import REPORT_COLUMNS, report_filters, write_csv
+    from .reporting import rollup_report
+
+    progress(10, "Aggregating")
+    report = rollup_report(**report_filters(params))
+    progress(70, "Writing CSV")
+    buffer = io.StringIO()
+    write_csv(REPORT_COLUMNS, report["report_data"], buffer)
+    result = {
+        "report_type": params["report_type"],
+        "report_name": params["report_name"],
+        "start_date": params.get("start_date"),
+        "end_date": params.get("end_date"),
+        "rows": len(report["report_data"]),
+        "total_weight": report["total_weight"],
+        "total_orders": report["total_orders"],
+        "total_amount": report["total_amount"],
+        # The full data is in the CSV; the JSON result only carries a preview
+        "report_data": report["report_data"][:REPORT_PREVIEW_ROWS],
+    }
+    filename = f'{params["report_type"]}_{params.get("end_date") or timezone.localdate().isoformat()}.csv'
+    return result, (filename, buffer.getvalue().encode())
+
+
+@job_type("export")
+def run_export(params, progress):
+    from .exports import dataset_rows, report_filters, write_csv, write_xlsx
+
+    role = params.get("role")
+    rows = dataset_rows(params["dataset"], report_filters(params), role=int(role) if str(role or "").isdigit() else None)
+    if rows is None:
+        raise ValueError(f'Unknown export: {params["dataset"]}')
+    columns, source = rows
+    total = len(source) if isinstance(source, list) else source.count()
+    progress(5, f"Exporting {total} rows")
+
+    def written(count):
+        # Also the heartbeat for long exports
+        progress(5 + 90 * count // max(total, 1), f"{count}/{total} rows")
+
+    # Spooled to disk and handed over as a file, so large exports are never held in memory
+    spool = tempfile.TemporaryFile()
+    if params.get("format") == "xlsx":
+        count = write_xlsx(columns, source, spool, title=params["dataset"], progress=written)
+        extension = "xlsx"
+    else:
+        text = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+        count = write_csv(columns, source, text, progress=written)
+        text.flush()
+        text.detach()
+        extension = "csv"
+    filename = f'{params["dataset"]}_{timezone.localdate().isoformat()}.{extension}'
+    return {"dataset": params["dataset"], "rows": count, "format": extension}, (filename, spool)
+
+
+@job_type("calendar")
+def run_calendar(params, progress, chunk_size=20):
+    from .calendar_generation import generate_calendar
+    from .capacity import set_capacity
+
+    localbody_ids = sorted(set(params["localbody_ids"]))
+    dates = [parse_date(d) for d in params["dates"]]
+    capacity = params.get("capacity")
+    totals = {"to_create": 0, "existing": 0, "created": 0}
+    for start in range(0, len(localbody_ids), chunk_size):
+        chunk = localbody_ids[start:start + chunk_size]
+        result = generate_calendar(chunk, dates)
+        if capacity is not None and result["created"]:
+            set_capacity([c["id"] for c in result["created"]], capacity)
+        totals["to_create"] += result["to_create"]
+        totals["existing"] += result["existing"]
+        totals["created"] += len(result["created"])
+        done = min(start + chunk_size, len(localbody_ids))
+        progress(100 * done // len(localbody_ids), f"{done}/{len(localbody_ids)} local bodies")
+    return {"localbodies": len(localbody_ids), "dates": len(dates), **totals}, None
@@ -0,0 +1,246 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are addressed by opaque tokens encoding the sort value and id of the
+row at the page edge, so every page is an indexed range scan of page_size
+rows no matter how deep it is. Ordering is always on one field plus id as
+a tiebreaker, in the same direction.
+
+Totals are optional and approximate: estimated_count() reads the planner's
+row estimate for unfiltered PostgreSQL tables and otherwise caches an exact
+count for a few minutes, so list pages never COUNT(*) on every request.
+
+KeysetPage has the shape of a Django Page, so templates written for
+Paginator keep working: tokens carry the page number, next_page_number()
+and previous_page_number() return tokens, and paginator.count/num_pages
+come from the (estimated) total. A plain number (?page=3) is served with
+an OFFSET query, the only case that is not a range scan.
+"""
+import base64
+import hashlib
+import json
+import math
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+from django.db.models import Q
+
+
+COUNT_CACHE_SECONDS = 300
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk, direction, number=None):
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    elif isinstance(value, Decimal):
+        value = str(value)
+    raw = json.dumps([value, pk, direction] + ([number] if number else []), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """(value, pk, direction, page number or None)"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        value, pk, direction, *rest = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid page token")
+    number = rest[0] if rest else None
+    if direction not in ("n", "p") or not isinstance(pk, int) or not isinstance(number, (int, type(None))):
+        raise InvalidCursor("Invalid page token")
+    return value, pk, direction, number
+
+
+def _get(item, field):
+    return item[field] if isinstance(item, dict) else getattr(item, field)
+
+
+class KeysetPage:
+    def __init__(self, items, next_token, prev_token, number=None, paginator=None):
+        self.object_list = items
+        self.next_token = next_token
+        self.prev_token = prev_token
+        self.number = number
+        self.paginator = paginator
+
+    def has_next(self):
+        return self.next_token is not None
+
+    def has_previous(self):
+        return self.prev_token is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.next_token
+
+    def previous_page_number(self):
+        return self.prev_token
+
+    def start_index(self):
+        if not self.object_list or not self.number:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        start = self.start_index()
+        return start + len(self.object_list) - 1 if start else 0
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class KeysetPaginator:
+    """
+    paginator = KeysetPaginator(queryset, ordering="-id", page_size=25)
+    page = paginator.get_page(request.GET.get("cursor"))
+
+    `ordering` is a field (or annotation) name, optionally prefixed with "-".
+    The queryset may be a values() queryset as long as it includes that
+    field and "id". The field must not be NULL (Coalesce nullable columns),
+    since a NULL cannot be compared against in the next page's filter.
+    """
+
+    def __init__(self, queryset, ordering="-id", page_size=25, max_page_size=200, count=None):
+        self.queryset = queryset
+        self.descending = ordering.startswith("-")
+        self.field = ordering.lstrip("-")
+        self.page_size = max(1, min(int(page_size), max_page_size))
+        # Total rows when known (e.g. estimated_count()); only used for Page-style page counts
+        self.count = count
+
+    @property
+    def per_page(self):
+        return self.page_size
+
+    @property
+    def num_pages(self):
+        if not self.count:
+            return 1
+        return math.ceil(self.count / self.page_size)
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def _order(self, reverse=False):
+        descending = self.descending != reverse
+        prefix = "-" if descending else ""
+        if self.field == "id":
+            return [f"{prefix}id"]
+        return [f"{prefix}{self.field}", f"{prefix}id"]
+
+    def _after(self, value, pk, reverse=False):
+        """Rows strictly after (value, pk) in the chosen direction"""
+        descending = self.descending != reverse
+        op = "lt" if descending else "gt"
+        if self.field == "id":
+            return Q(**{f"id__{op}": pk})
+        return Q(**{f"{self.field}__{op}": value}) | Q(**{self.field: value, f"id__{op}": pk})
+
+    def _token(self, item, direction, number=None):
+        """Token of the page next to (n) or before (p) the page numbered `number`"""
+        target = number and (number + 1 if direction == "n" else number - 1)
+        return encode_cursor(_get(item, self.field), _get(item, "id"), direction, target)
+
+    def _page(self, items, has_next, has_previous, number):
+        next_token = self._token(items[-1], "n", number) if has_next and items else None
+        prev_token = self._token(items[0], "p", number) if has_previous and items else None
+        return KeysetPage(items, next_token, prev_token, number, self)
+
+    def first_page(self, rows):
+        """First page built from up to page_size + 1 rows already fetched in this order"""
+        return self._page(rows[:self.page_size], len(rows) > self.page_size, False, 1)
+
+    def numbered_page(self, number):
+        """Page by number with OFFSET, for Paginator-style ?page=N links"""
+        number = max(int(number), 1)
+        start = (number - 1) * self.page_size
+        rows = list(self.queryset.order_by(*self._order())[start:start + self.page_size + 1])
+        if not rows and number > 1:
+            return self.first_page(list(self.queryset.order_by(*self._order())[:self.page_size + 1]))
+        return self._page(rows[:self.page_size], len(rows) > self.page_size, number > 1, number)
+
+    def get_page(self, token=None):
+        """Page for a cursor token, a page number ("3") or None for the first page"""
+        if not token:
+            return self.first_page(list(self.queryset.order_by(*self._order())[:self.page_size + 1]))
+        if str(token).isdigit():
+            return self.numbered_page(token)
+
+        value, pk, direction, number = decode_cursor(token)
+        if direction == "n":
+            rows = list(
+                self.queryset.filter(self._after(value, pk)).order_by(*self._order())[:self.page_size + 1]
+            )
+            return self._page(rows[:self.page_size], len(rows) > self.page_size, True, number)
+
+        rows = list(
+            self.queryset.filter(self._after(value, pk, reverse=True)).order_by(*self._order(reverse=True))[:self.page_size + 1]
+        )
+        items = list(reversed(rows[:self.page_size]))
+        return self._page(items, True, len(rows) > self.page_size, number)
+
+
+def estimated_count(queryset, timeout=COUNT_CACHE_SECONDS):
+    """Approximate row count for a queryset, cached"""
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return 0
+    key = "count:" + hashlib.md5(sql.encode()).hexdigest()
+    count = cache.get(key)
+    if count is not None:
+        return count
+
+    count = None
+    if connection.vendor == "postgresql" and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+            if row and row[0] >= 0:
+                count = row[0]
+    if count is None:
+        count = queryset.count()
+    cache.set(key, count, timeout)
+    return count
+
+
+def page_token(request):
+    """The page asked for: ?cursor=, or ?page= as used by Paginator-style templates"""
+    return request.GET.get("cursor") or request.GET.get("page")
+
+
+def paginate(request, queryset, ordering="-id", page_size=25, with_total=True):
+    """
+    Keyset page for a list view, driven by ?cursor= or ?page= (and optional ?page_size=).
+    Returns (page, total) where total is estimated_count() or None.
+    """
+    try:
+        page_size = int(request.GET.get("page_size") or page_size)
+    except ValueError:
+        pass
+    total = estimated_count(queryset) if with_total else None
+    paginator = KeysetPaginator(queryset, ordering=ordering, page_size=page_size, count=total)
+    try:
+        page = paginator.get_page(page_token(request))
+    except InvalidCursor:
+        page = paginator.get_page(None)
+    return page, total
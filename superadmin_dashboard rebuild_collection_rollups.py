@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from super_admin_dashboard.reporting import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Backfill or rebuild DailyCollectionRollup rows for a date range"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day (YYYY-MM-DD), defaults to 30 days ago")
+        parser.add_argument("--end", help="Last day (YYYY-MM-DD), defaults to today")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        start = parse_date(options["start"]) if options["start"] else today - timedelta(days=30)
+        end = parse_date(options["end"]) if options["end"] else today
+        if not start or not end or start > end:
+            raise CommandError("Provide a valid --start/--end range")
+
+        rows = rebuild_rollups(start, end)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup rows for {start} to {end}"))
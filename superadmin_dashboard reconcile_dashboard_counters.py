@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from super_admin_dashboard.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Recount the dashboard counters exactly and fix any drift (run periodically, e.g. hourly from cron)"
+
+    def handle(self, *args, **options):
+        drift = reconcile_counters()
+        for name, (old, new) in sorted(drift.items()):
+            self.stdout.write(f"{name}: {old} -> {new}")
+        self.stdout.write(self.style.SUCCESS(f"Reconciled dashboard counters, {len(drift)} corrected"))
@@ -0,0 +1,209 @@
+"""
+Daily collection rollups for reports.
+
+DailyCollectionRollup holds total kg, order count and amount per
+(date, state, district, localbody). It is kept up to date from
+WasteCollection save/delete signals and can be rebuilt for a date range
+with the rebuild_collection_rollups management command.
+
+A collection is attributed to its own local body (WasteCollection.localbody)
+with that local body's district and state, so the row it was added to
+does not depend on the customer's profiles and an edit or delete reverses
+exactly what was added. Collections without a local body go to the
+unassigned row (state, district and local body all NULL, one per day by
+a partial unique constraint), so the totals still cover every collection.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import F, Q, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from waste_collector_dashboard.models import WasteCollection
+from .models import State, District, LocalBody
+
+
+UNASSIGNED = "Unassigned"
+UNASSIGNED_LOCATION = (None, None, None)
+
+
+class DailyCollectionRollup(models.Model):
+    date = models.DateField()
+    state = models.ForeignKey(State, null=True, blank=True, on_delete=models.CASCADE)
+    district = models.ForeignKey(District, null=True, blank=True, on_delete=models.CASCADE)
+    localbody = models.ForeignKey(LocalBody, null=True, blank=True, on_delete=models.CASCADE)
+    total_kg = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ("date", "state", "district", "localbody")
+        constraints = [
+            # NULLs never conflict in unique_together, so the unassigned row needs its own
+            # constraint; with it, concurrent get_or_create calls fall back to the existing row
+            models.UniqueConstraint(
+                fields=["date"],
+                condition=Q(state__isnull=True, district__isnull=True, localbody__isnull=True),
+                name="daily_rollup_unassigned_unique",
+            ),
+        ]
+        indexes = [models.Index(fields=["date", "localbody"])]
+
+    def __str__(self):
+        return f"{self.date} {self.localbody_id}: {self.total_kg} kg"
+
+
+def _decimal(value):
+    try:
+        return Decimal(str(value)) if value is not None else Decimal("0")
+    except ArithmeticError:
+        return Decimal("0")
+
+
+def _day(created_at):
+    if created_at is None:
+        return timezone.localdate()
+    if timezone.is_aware(created_at):
+        return timezone.localtime(created_at).date()
+    return created_at.date()
+
+
+def localbody_locations(localbody_ids):
+    """Map local body id -> (state_id, district_id, localbody_id)"""
+    rows = LocalBody.objects.filter(pk__in={pk for pk in localbody_ids if pk}).values_list(
+        "id", "district__state_id", "district_id"
+    )
+    return {pk: (state_id, district_id, pk) for pk, state_id, district_id in rows}
+
+
+def _contribution(collection):
+    return {
+        "day": _day(collection.created_at),
+        "localbody_id": collection.localbody_id,
+        "kg": _decimal(collection.kg),
+        "amount": _decimal(getattr(collection, "total_amount", None)),
+    }
+
+
+def _apply(contribution, sign):
+    if not contribution:
+        return
+    localbody_id = contribution["localbody_id"]
+    location = localbody_locations([localbody_id]).get(localbody_id, UNASSIGNED_LOCATION)
+    state_id, district_id, localbody_id = location
+    rollup, _ = DailyCollectionRollup.objects.get_or_create(
+        date=contribution["day"], state_id=state_id, district_id=district_id, localbody_id=localbody_id
+    )
+    DailyCollectionRollup.objects.filter(pk=rollup.pk).update(
+        total_kg=F("total_kg") + sign * contribution["kg"],
+        order_count=F("order_count") + sign,
+        total_amount=F("total_amount") + sign * contribution["amount"],
+    )
+
+
+@receiver(pre_save, sender=WasteCollection)
+def remember_old_collection(sender, instance, **kwargs):
+    instance._rollup_old = None
+    if instance.pk:
+        old = WasteCollection.objects.filter(pk=instance.pk).only(
+            "created_at", "localbody_id", "kg", "total_amount"
+        ).first()
+        instance._rollup_old = _contribution(old) if old else None
+
+
+@receiver(post_save, sender=WasteCollection)
+def update_rollup_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    with transaction.atomic():
+        _apply(getattr(instance, "_rollup_old", None), -1)
+        _apply(_contribution(instance), 1)
+
+
+@receiver(post_delete, sender=WasteCollection)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    with transaction.atomic():
+        _apply(_contribution(instance), -1)
+
+
+def rebuild_rollups(start, end, chunk_size=5000):
+    """Recompute rollups for [start, end] from WasteCollection. Returns the number of rows written."""
+    totals = defaultdict(lambda: [Decimal("0"), 0, Decimal("0")])
+    collections = WasteCollection.objects.filter(
+        created_at__date__gte=start, created_at__date__lte=end
+    ).values_list("localbody_id", "created_at", "kg", "total_amount").iterator(chunk_size=chunk_size)
+
+    batch = []
+
+    def flush():
+        locations = localbody_locations({row[0] for row in batch})
+        for localbody_id, created_at, kg, amount in batch:
+            entry = totals[(_day(created_at),) + locations.get(localbody_id, UNASSIGNED_LOCATION)]
+            entry[0] += _decimal(kg)
+            entry[1] += 1
+            entry[2] += _decimal(amount)
+        batch.clear()
+
+    for row in collections:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            flush()
+    if batch:
+        flush()
+
+    with transaction.atomic():
+        DailyCollectionRollup.objects.filter(date__gte=start, date__lte=end).delete()
+        DailyCollectionRollup.objects.bulk_create([
+            DailyCollectionRollup(
+                date=day, state_id=state_id, district_id=district_id, localbody_id=localbody_id,
+                total_kg=kg, order_count=count, total_amount=amount,
+            )
+            for (day, state_id, district_id, localbody_id), (kg, count, amount) in totals.items()
+        ], batch_size=1000)
+    return len(totals)
+
+
+def rollup_report(start_date=None, end_date=None, state_id=None, district_id=None, localbody_id=None):
+    """Report rows and totals in the shape the reports page expects"""
+    rollups = DailyCollectionRollup.objects.all()
+    if start_date:
+        rollups = rollups.filter(date__gte=start_date)
+    if end_date:
+        rollups = rollups.filter(date__lte=end_date)
+    if state_id:
+        rollups = rollups.filter(state_id=state_id)
+    if district_id:
+        rollups = rollups.filter(district_id=district_id)
+    if localbody_id:
+        rollups = rollups.filter(localbody_id=localbody_id)
+
+    rows = rollups.filter(order_count__gt=0).values(
+        "state__name", "district__name", "localbody__name", "date"
+    ).annotate(
+        total_weight=Sum("total_kg"),
+        order_count_sum=Sum("order_count"),
+        amount=Sum("total_amount"),
+    ).order_by("state__name", "district__name", "localbody__name", "date")
+
+    report_data = [
+        {
+            "customer__customer_info__state__name": r["state__name"] or UNASSIGNED,
+            "customer__customer_info__district__name": r["district__name"] or UNASSIGNED,
+            "customer__customer_info__localbody__name": r["localbody__name"] or UNASSIGNED,
+            "created_at__date": r["date"],
+            "total_weight": r["total_weight"],
+            "order_count": r["order_count_sum"],
+            "total_amount": r["amount"],
+        }
+        for r in rows
+    ]
+    totals = rollups.aggregate(kg=Sum("total_kg"), orders=Sum("order_count"), amount=Sum("total_amount"))
+    return {
+        "report_data": report_data,
+        "total_weight": totals["kg"] or 0,
+        "total_orders": totals["orders"] or 0,
+        "total_amount": totals["amount"] or 0,
+    }
@@ -0,0 +1,69 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from super_admin_dashboard.benchmarks import DEFAULT_THRESHOLD, SCENARIOS, compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the view and endpoint benchmarks against the seeded dataset (see seed_benchmark_data), "
+        "write the results as JSON and optionally fail on regressions against a baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="Write the results to this JSON file")
+        parser.add_argument("--baseline", help="Results file from an earlier run to compare against")
+        parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help="Allowed slowdown / memory growth in percent")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per scenario")
+        parser.add_argument("--scenario", action="append", dest="scenarios",
+                            help="Run only this scenario (repeatable)")
+        parser.add_argument("--list", action="store_true", help="List the scenarios and exit")
+
+    def handle(self, *args, **options):
+        if options["list"]:
+            for scenario in SCENARIOS:
+                self.stdout.write(f"{scenario.name:34} {scenario.user:9} {scenario.url_name}")
+            return
+
+        baseline = None
+        if options["baseline"]:
+            try:
+                with open(options["baseline"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline: {e}")
+
+        try:
+            results = run_benchmarks(options["scenarios"], repeat=max(options["repeat"], 1), log=self._log)
+        except LookupError as e:
+            raise CommandError(str(e))
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is None:
+            self.stdout.write(self.style.SUCCESS(f"Ran {len(results['scenarios'])} scenarios"))
+            return
+        if baseline.get("meta", {}).get("vendor") != results["meta"]["vendor"]:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline is from {baseline.get('meta', {}).get('vendor')}, this run is {results['meta']['vendor']}"
+            ))
+        regressions = compare(results, baseline, options["threshold"])
+        for name, metric, before, after in regressions:
+            self.stdout.write(self.style.ERROR(f"{name}: {metric} {before} -> {after}"))
+        if regressions:
+            raise CommandError(f"{len(regressions)} regressions over {options['threshold']}%")
+        self.stdout.write(self.style.SUCCESS(f"No regressions in {len(results['scenarios'])} scenarios"))
+
+    def _log(self, name, result):
+        if "skipped" in result:
+            self.stdout.write(self.style.WARNING(f"{name:34} skipped: {result['skipped']}"))
+            return
+        self.stdout.write(
+            f"{name:34} {result['status']} {result['wall_ms']['median']:9.1f} ms "
+            f"{result['queries']:4} queries {result['peak_kb']:10.1f} KB"
+        )
@@ -0,0 +1,89 @@
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from super_admin_dashboard.jobs import claim_next, execute_job, fail_or_retry, purge_expired, requeue_stale
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (reports, exports, calendar generation) in a pool of worker "
+        "processes. Keep one or more of these running next to the web server, e.g. under systemd."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Jobs run in parallel")
+        parser.add_argument("--poll", type=float, default=2.0, help="Seconds between queue checks when idle")
+        parser.add_argument("--once", action="store_true", help="Run the jobs that are due, then exit")
+
+    def handle(self, *args, **options):
+        workers = max(options["workers"], 1)
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+        signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+
+        # Fresh interpreters that set Django up themselves, rather than forks sharing this process's connections
+        pool = self._pool(workers)
+        running = {}
+        last_maintenance = 0.0
+        done = 0
+        try:
+            while not stopping:
+                if time.monotonic() - last_maintenance > 60:
+                    requeued = requeue_stale()
+                    purged = purge_expired()
+                    if requeued or purged:
+                        self.stdout.write(f"Requeued {requeued} stale jobs, purged {purged} expired")
+                    last_maintenance = time.monotonic()
+
+                broken = False
+                for (job_id, attempts), future in list(running.items()):
+                    if not future.done():
+                        continue
+                    del running[job_id, attempts]
+                    done += 1
+                    try:
+                        self.stdout.write(f"Job {job_id}: {future.result()}")
+                    except BrokenProcessPool:
+                        broken = True
+                        fail_or_retry(job_id, "Worker process died", attempts)
+                        self.stdout.write(self.style.ERROR(f"Job {job_id}: worker process died"))
+                    except Exception as e:
+                        # e.g. a result that could not be pickled back; the job itself did not report
+                        fail_or_retry(job_id, f"{type(e).__name__}: {e}", attempts)
+                        self.stdout.write(self.style.ERROR(f"Job {job_id}: {type(e).__name__}: {e}"))
+                if broken:
+                    # A dead worker breaks the whole pool; its other jobs count as failed attempts too
+                    for job_id, attempts in running:
+                        fail_or_retry(job_id, "Worker process died", attempts)
+                    running.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self._pool(workers)
+
+                claimed = False
+                while len(running) < workers:
+                    claim = claim_next()
+                    if claim is None:
+                        break
+                    running[claim] = pool.submit(execute_job, *claim)
+                    claimed = True
+
+                if options["once"] and not running and not claimed:
+                    break
+                connections.close_all()
+                time.sleep(0.2 if running else options["poll"])
+        finally:
+            # Jobs already handed to the pool finish; nothing new is claimed
+            pool.shutdown(wait=True)
+        self.stdout.write(self.style.SUCCESS(f"Job runner stopped after {done} jobs"))
+
+    def _pool(self, workers):
+        return ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup
+        )
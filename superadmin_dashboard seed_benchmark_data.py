@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.models import CustomUser
+from super_admin_dashboard.benchmark_data import PREFIX, SCALES, flush_dataset, generate_dataset, rebuild_derived
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the deterministic benchmark dataset (users, waste profiles, pickups, location "
+        "history, collections and calendars across 3 states / 15 districts / 120 local bodies)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="Dataset size preset")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed; same seed and scale give the same data")
+        parser.add_argument("--flush", action="store_true", help="Delete an existing benchmark dataset first")
+        parser.add_argument("--flush-only", action="store_true", help="Only delete the benchmark dataset")
+        parser.add_argument("--no-derived", action="store_true",
+                            help="Skip rebuilding rollups, indexes and counters after loading")
+
+    def handle(self, *args, **options):
+        if options["flush"] or options["flush_only"]:
+            # A dataset generated next rebuilds the derived tables itself
+            flush_dataset(log=self.stdout.write, rebuild=options["flush_only"] or options["no_derived"])
+            if options["flush_only"]:
+                self.stdout.write(self.style.SUCCESS("Benchmark dataset removed"))
+                return
+        if CustomUser.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError("A benchmark dataset already exists; use --flush to replace it")
+
+        started = time.monotonic()
+        counts = generate_dataset(options["scale"], options["seed"], log=self.stdout.write)
+        if not options["no_derived"]:
+            rebuild_derived(log=self.stdout.write)
+        for name, count in counts.items():
+            self.stdout.write(f"{name}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated the {options['scale']} benchmark dataset in {time.monotonic() - started:.0f}s"
+        ))
@@ -0,0 +1,105 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+
+from authentication.models import CustomUser
+from customer_dashboard.booking import BOOKED, WAITLISTED, reschedule_pickup
+from customer_dashboard.models import CustomerPickupDate
+from super_admin_dashboard.capacity import PickupSlot, PickupWaitlist, set_capacity
+from super_admin_dashboard.models import LocalBody, LocalBodyCalendar
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire many simultaneous bookings at one pickup date and check that it is "
+        "never oversold. Creates throwaway users and a calendar entry, removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bookings", type=int, default=300, help="Number of simultaneous bookings")
+        parser.add_argument("--capacity", type=int, default=100, help="Capacity of the test date")
+        parser.add_argument("--threads", type=int, default=32, help="Worker threads")
+        parser.add_argument("--localbody", type=int, help="LocalBody id to use (defaults to the first)")
+        parser.add_argument("--keep", action="store_true", help="Keep the generated data")
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite":
+            self.stdout.write(self.style.WARNING(
+                "SQLite serialises writers; expect 'database is locked' errors. Use PostgreSQL for throughput numbers."
+            ))
+        localbody = (
+            LocalBody.objects.filter(pk=options["localbody"]).first() if options["localbody"]
+            else LocalBody.objects.order_by("id").first()
+        )
+        if localbody is None:
+            raise CommandError("No local body to book against")
+
+        # A date far enough ahead that it cannot collide with real calendar entries
+        taken = set(LocalBodyCalendar.objects.filter(localbody=localbody).values_list("date", flat=True))
+        day = timezone.localdate() + timedelta(days=3650)
+        while day in taken:
+            day += timedelta(days=1)
+        calendar = LocalBodyCalendar.objects.create(localbody=localbody, date=day)
+        set_capacity([calendar.pk], options["capacity"])
+
+        tag = uuid.uuid4().hex[:8]
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f"stress-{tag}-{i}", role=0) for i in range(options["bookings"])
+        ])
+        users = list(CustomUser.objects.filter(username__startswith=f"stress-{tag}-"))
+
+        barrier = threading.Barrier(min(options["threads"], len(users)))
+        statuses = {BOOKED: 0, WAITLISTED: 0, "error": 0}
+        lock = threading.Lock()
+
+        def book(user):
+            try:
+                try:
+                    barrier.wait(timeout=5)
+                except threading.BrokenBarrierError:
+                    pass
+                _, status = reschedule_pickup(user, calendar)
+            except Exception:
+                status = "error"
+            finally:
+                connections.close_all()
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            list(pool.map(book, users))
+        elapsed = time.perf_counter() - started
+
+        booked = CustomerPickupDate.objects.filter(localbody_calendar=calendar).count()
+        counter = PickupSlot.objects.get(calendar=calendar).booked
+        waitlisted = PickupWaitlist.objects.filter(calendar=calendar).count()
+
+        self.stdout.write(
+            f"{len(users)} bookings in {elapsed:.2f}s ({len(users) / elapsed:.0f}/s): "
+            f"{statuses[BOOKED]} booked, {statuses[WAITLISTED]} waitlisted, {statuses['error']} errors"
+        )
+        self.stdout.write(f"rows={booked} counter={counter} capacity={options['capacity']} waitlist={waitlisted}")
+
+        if not options["keep"]:
+            PickupWaitlist.objects.filter(calendar=calendar).delete()
+            CustomerPickupDate.objects.filter(localbody_calendar=calendar).delete()
+            calendar.delete()
+            CustomUser.objects.filter(username__startswith=f"stress-{tag}-").delete()
+
+        problems = []
+        if booked > options["capacity"]:
+            problems.append(f"oversold: {booked} rows for capacity {options['capacity']}")
+        if booked != counter:
+            problems.append(f"counter drift: {counter} counted, {booked} rows")
+        if booked != statuses[BOOKED]:
+            problems.append(f"{statuses[BOOKED]} reported booked but {booked} rows exist")
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("No overselling"))
@@ -1,102 +1,25 @@
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.views.decorators.http import require_GET, etag
 from authentication.models import CustomUser
 from waste_collector_dashboard.models import WasteCollection
+from waste_collector_dashboard.photos import attach_photo_urls
 from customer_dashboard.models import CustomerWasteInfo
 from django.contrib import messages
-from django.db.models import Sum, Count
 from django.utils import timezone
 from datetime import datetime, date
 from .models import State, District, LocalBody
+from .wards import get_ward_options, get_ward_registry
+from .hierarchy import get_states
+from .pagination import page_token, paginate
+from .counters import counters_version, get_counters
+from .directory import DEFAULT_PAGE_SIZE, ROLES, directory_users, first_pages, role_counts, role_page, serialise
+from .utils import is_super_admin
 
 
 
 
-def get_ward_names():
-    """Return a dictionary mapping ward numbers to ward names"""
-    return {
-        1: "Fort Kochi",
-        2: "Kalvathy",
-        3: "Earavely",
-        4: "Karippalam",
-        5: "Cheralayi",
-        6: "Mattanchery",
-        7: "Chakkamadam",
-        8: "Karuvelippady",
-        9: "Island North",
-        10: "Ravipuram",
-        11: "Ernakulam South",
-        12: "Gandhi Nagar",
-        13: "Kathrikadavu",
-        14: "Ernakulam Central",
-        15: "Ernakulam North",
-        16: "Kaloor South",
-        17: "Kaloor North",
-        18: "Thrikkanarvattom",
-        19: "Ayyappankavu",
-        20: "Pottakuzhy",
-        21: "Elamakkara South",
-        22: "Pachalam",
-        23: "Thattazham",
-        24: "Vaduthala West",
-        25: "Vaduthala East",
-        26: "Elamakkara North",
-        27: "Puthukkalavattam",
-        28: "Kunnumpuram",
-        29: "Ponekkara",
-        30: "Edappally",
-        31: "Changampuzha",
-        32: "Dhevankulangara",
-        33: "Palarivattom",
-        34: "Stadium",
-        35: "Karanakkodam",
-        36: "Puthiyaroad",
-        37: "Padivattam",
-        38: "Vennala",
-        39: "Chakkaraparambu",
-        40: "Chalikkavattam",
-        41: "Thammanam",
-        42: "Elamkulam",
-        43: "Girinagar",
-        44: "Ponnurunni",
-        45: "Ponnurunni East",
-        46: "Vyttila",
-        47: "Poonithura",
-        48: "Vyttila Janatha",
-        49: "Kadavanthra",
-        50: "Panampilly Nagar",
-        51: "Perumanoor",
-        52: "Konthuruthy",
-        53: "Thevara",
-        54: "Island South",
-        55: "Kadebhagam",
-        56: "Palluruthy East",
-        57: "Thazhuppu",
-        58: "Eadakochi North",
-        59: "Edakochi South",
-        60: "Perumbadappu",
-        61: "Konam",
-        62: "Palluruthy Kacheripady",
-        63: "Nambyapuram",
-        64: "Palluruthy",
-        65: "Pullardesam",
-        66: "Tharebhagam",
-        67: "Thoppumpady",
-        68: "Mundamvely East",
-        69: "Mundamvely",
-        70: "Manassery",
-        71: "Moolamkuzhy",
-        72: "Chullickal",
-        73: "Nasrathu",
-        74: "Panayappilly",
-        75: "Amaravathy",
-        76: "Fortkochi Veli"
-    }
-
-def get_ward_options():
-    """Return a list of tuples (number, name) for ward options"""
-    ward_names = get_ward_names()
-    return [(i, ward_names.get(i, f'Ward {i}')) for i in range(1, 74)]
 
 
 
@@ -104,40 +27,95 @@ def get_ward_options():
 
 @login_required
 def admin_home(request):
-    return render(request, 'super_admin_dashboard.html')
+    return render(request, 'super_admin_dashboard.html', get_counters())
 
 
+def _counters_etag(request):
+    return counters_version()
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_GET
+@etag(_counters_etag)
+def dashboard_counters(request):
+    """Dashboard figures as JSON for polling; answers 304 while nothing changed"""
+    return JsonResponse(get_counters())
+
+
+def _role_page(request, role_name):
+    try:
+        page_size = int(request.GET.get("page_size") or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        page_size = DEFAULT_PAGE_SIZE
+    page = role_page(ROLES[role_name], page_token(request), page_size)
+    return page, role_counts()[role_name]
+
 
 @login_required
 def user_list_view(request):
-    customers = CustomUser.objects.filter(role=0)
-    collectors = CustomUser.objects.filter(role=1)
-    admins = CustomUser.objects.filter(role=2)
+    # First page of every role from one query, counts from one cached GROUP BY
+    pages = first_pages()
+    counts = role_counts()
 
     return render(request, 'user_list.html', {
-        'customers': customers,
-        'collectors': collectors,
-        'admins': admins,
+        'customers': pages['customers'],
+        'collectors': pages['collectors'],
+        'admins': pages['super_admins'],
+        'counts': counts,
+    })
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_GET
+def user_directory_api(request):
+    """
+    Users grouped by role, as JSON.
+    Without ?role=: role counts plus the first page of every role.
+    With ?role=customers|collectors|super_admins|admins: one page of that
+    role, continued with ?cursor= from the previous response.
+    """
+    role_name = request.GET.get('role')
+    if role_name:
+        if role_name not in ROLES:
+            return JsonResponse({'error': f"role must be one of {', '.join(ROLES)}"}, status=400)
+        page, total = _role_page(request, role_name)
+        return JsonResponse({
+            'role': role_name,
+            'total': total,
+            'results': [serialise(u) for u in page],
+            'next': page.next_token,
+            'prev': page.prev_token,
+        })
+
+    return JsonResponse({
+        'counts': role_counts(),
+        'roles': {
+            name: {'results': [serialise(u) for u in page], 'next': page.next_token}
+            for name, page in first_pages().items()
+        },
     })
+
+
 @login_required
 def view_customers(request):
-    customers = CustomUser.objects.filter(role=0)
-    return render(request, 'view_customers.html', {'customers': customers})
+    customers, total_customers = _role_page(request, 'customers')
+    return render(request, 'view_customers.html', {'customers': customers, 'total_customers': total_customers})
 
 @login_required
 def view_waste_collectors(request):
-    collectors = CustomUser.objects.filter(role=1)
-    total_collectors = collectors.count()
+    collectors, total_collectors = _role_page(request, 'collectors')
     return render(request, 'view_collectors.html', {'collectors': collectors, 'total_collectors': total_collectors})
 @login_required
 def view_super_admin(request):
-    super_admin = CustomUser.objects.filter(role=2)
-    return render(request, "view_super_admin.html", {"super_admin":super_admin})
+    super_admin, total = _role_page(request, 'super_admins')
+    return render(request, "view_super_admin.html", {"super_admin": super_admin, "total": total})
 
 @login_required
 def view_admins(request):
-    admins = CustomUser.objects.filter(role=3)
-    return render(request, "view_admins.html", {"admins":admins})
+    admins, total = _role_page(request, 'admins')
+    return render(request, "view_admins.html", {"admins": admins, "total": total})
 
 # \\\\\\\\\\\\\\\\\\\\\\\\\\\ user view //////////////////////
 
@@ -145,8 +123,10 @@ from .forms import UserForm
 
 @login_required
 def user_list(request):
-    users = CustomUser.objects.all()
-    return render(request, "users_list.html", {"users": users})
+    users, _ = paginate(request, directory_users(), page_size=50, with_total=False)
+    total_users = sum(role_counts().values())
+    users.paginator.count = total_users
+    return render(request, "users_list.html", {"users": users, "total_users": total_users})
 
 
 
@@ -209,25 +189,13 @@ from authentication.models import CustomUser
 
 @login_required
 def view_customer_wasteinfo(request):
-    # Fetch all customer waste profiles with related fields
-    waste_infos = CustomerWasteInfo.objects.select_related(
-        'state', 'district', 'localbody', 'assigned_collector', 'user'
-    ).all()
-
-    # Fetch all collectors
-    collectors = CustomUser.objects.filter(role=1)
-
-    # Map waste_info_id → pickup date
-    pickup_dates = {}
-    pickups = CustomerPickupDate.objects.select_related('localbody_calendar', 'waste_info').all()
-    for pickup in pickups:
-        if pickup.waste_info:
-            pickup_dates[pickup.waste_info.id] = pickup.localbody_calendar.date
+    # Rows are loaded page by page from waste_info_api; only filter options are rendered here
+    collectors = CustomUser.objects.filter(role=1).only('id', 'username').order_by('username')
 
     return render(request, 'view_customer_wasteinfo.html', {
-        'waste_infos': waste_infos,
         'collectors': collectors,
-        'pickup_dates': pickup_dates,
+        'states': get_states(),
+        'ward_options': get_ward_options(),
     })
 
 # Assign a waste collector to a CustomerWasteInfo entry
@@ -253,7 +221,7 @@ def assign_waste_collector(request, pk):
 @login_required
 def view_collected_data(request):
     # Get all waste collections with related customer waste info for booking/scheduled dates
-    all_data = WasteCollection.objects.select_related('customer').all()
+    all_data = attach_photo_urls(WasteCollection.objects.select_related('customer', 'collector', 'localbody'))
     return render(request, 'view_collected_data.html', {
         'all_data': all_data
     })
@@ -286,18 +254,24 @@ def map_role(request, user_id):
 
 
 import json
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponseForbidden, HttpResponseBadRequest
-from django.views.decorators.http import require_POST, require_GET
+from django.http import HttpResponse, JsonResponse, HttpResponseForbidden, HttpResponseBadRequest
+from django.views.decorators.http import require_POST, require_GET, etag
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils.dateparse import parse_date
 
 from .models import State, District, LocalBody, LocalBodyCalendar
 from .utils import is_super_admin
+from .hierarchy import get_districts, get_hierarchy, get_localbodies, get_states, hierarchy_etag
+from .calendar_generation import (
+    CalendarRuleError, expand_dates, generate_calendar, parse_month_days, parse_weekdays
+)
+from .capacity import set_capacity
 
-
+# Larger calendar generations are handed to a background job
+CALENDAR_INLINE_PAIRS = 5000
 
 
 
@@ -305,24 +279,40 @@ from .utils import is_super_admin
 @user_passes_test(is_super_admin)
 def calendar_view(request):
     """Main page where admin picks state/district/localbody and sees FullCalendar."""
-    states = State.objects.all().order_by("name")
+    states = get_states()
     return render(request, "calendar.html", {"states": states})
 
 
 @login_required
 @user_passes_test(is_super_admin)
 @require_GET
+@etag(hierarchy_etag)
 def load_districts(request, state_id):
-    districts = District.objects.filter(state_id=state_id).values("id", "name")
-    return JsonResponse(list(districts), safe=False)
+    return JsonResponse(get_districts(state_id), safe=False)
 
 
 @login_required
 @user_passes_test(is_super_admin)
 @require_GET
+@etag(hierarchy_etag)
 def load_localbodies(request, district_id):
-    lbs = LocalBody.objects.filter(district_id=district_id).values("id", "name", "body_type")
-    return JsonResponse(list(lbs), safe=False)
+    return JsonResponse(get_localbodies(district_id), safe=False)
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_GET
+def load_wards(request, localbody_id):
+    options = get_ward_registry(localbody_id).options
+    return JsonResponse([{"number": number, "name": name} for number, name in options], safe=False)
+
+
+@login_required
+@require_GET
+@etag(hierarchy_etag)
+def load_hierarchy(request):
+    """Whole State -> District -> LocalBody tree as one compact JSON document."""
+    return HttpResponse(get_hierarchy()["compact_json"], content_type="application/json")
 
 
 @login_required
@@ -349,7 +339,10 @@ def create_calendar_date(request, localbody_id):
 
     created = []
     if single:
-        d = parse_date(single)
+        try:
+            d = parse_date(single)
+        except ValueError:
+            d = None
         if not d:
             return HttpResponseBadRequest("Invalid date")
         entry, created_flag = LocalBodyCalendar.objects.get_or_create(localbody=lb, date=d)
@@ -358,21 +351,130 @@ def create_calendar_date(request, localbody_id):
         return JsonResponse({"status": "created", "created": created})
 
     if start and end:
-        s = parse_date(start)
-        e = parse_date(end)
+        try:
+            # parse_date raises for well-formed but impossible dates such as 2025-02-30
+            s = parse_date(start)
+            e = parse_date(end)
+        except ValueError:
+            s = e = None
         if not s or not e:
             return HttpResponseBadRequest("Invalid start/end")
-        cur = s
-        while cur <= e:
-            entry, created_flag = LocalBodyCalendar.objects.get_or_create(localbody=lb, date=cur)
-            if created_flag:
-                created.append({"id": entry.id, "date": entry.date.isoformat()})
-            cur += timedelta(days=1)
+        try:
+            result = generate_calendar([lb.id], expand_dates(s, e))
+        except CalendarRuleError as exc:
+            return HttpResponseBadRequest(str(exc))
+        created = [{"id": c["id"], "date": c["date"]} for c in result["created"]]
         return JsonResponse({"status": "created_range", "created": created})
 
     return HttpResponseBadRequest("Provide 'date' or 'start' and 'end'.")
 
 
+@login_required
+@user_passes_test(is_super_admin)
+@require_POST
+def generate_calendar_dates(request):
+    """
+    Bulk calendar generation from a recurrence rule for many local bodies.
+    Expects a JSON body:
+    {
+        "localbody_ids": [1, 2], "district_ids": [3],
+        "start": "2025-01-01", "end": "2025-12-31",
+        "weekdays": ["tue", "fri"], "month_days": [1, 15],
+        "exclude": ["2025-08-15"], "capacity": 120, "dry_run": true
+    }
+    District ids expand to all of their local bodies. Without weekdays or
+    month_days every day in the range is generated. The optional capacity is
+    applied to the newly created dates. Ranges over CALENDAR_INLINE_PAIRS
+    (local body, date) pairs, or "background": true, run as a background
+    job and answer 202 with its status URL.
+    """
+    try:
+        payload = json.loads(request.body or "{}")
+    except json.JSONDecodeError:
+        return HttpResponseBadRequest("Invalid JSON")
+
+    try:
+        # parse_date raises for well-formed but impossible dates such as 2025-02-30
+        s = parse_date(str(payload.get("start", "")))
+        e = parse_date(str(payload.get("end", "")))
+    except ValueError:
+        s = e = None
+    if not s or not e:
+        return HttpResponseBadRequest("Invalid start/end")
+
+    try:
+        localbody_ids = {int(i) for i in payload.get("localbody_ids", [])}
+        district_ids = [int(i) for i in payload.get("district_ids", [])]
+        exclude = {parse_date(str(d)) for d in payload.get("exclude", [])}
+        if None in exclude:
+            raise CalendarRuleError("Invalid exclusion date")
+        dates = list(expand_dates(
+            s, e,
+            weekdays=parse_weekdays(payload.get("weekdays")),
+            month_days=parse_month_days(payload.get("month_days")),
+            exclude=exclude,
+        ))
+    except (TypeError, ValueError) as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    if district_ids:
+        localbody_ids.update(
+            LocalBody.objects.filter(district_id__in=district_ids).values_list("id", flat=True)
+        )
+    # Only keep ids that actually exist
+    localbody_ids = list(LocalBody.objects.filter(id__in=localbody_ids).values_list("id", flat=True))
+    if not localbody_ids:
+        return HttpResponseBadRequest("Provide 'localbody_ids' or 'district_ids'.")
+
+    capacity = payload.get("capacity")
+    if capacity is not None and (not isinstance(capacity, int) or capacity < 0):
+        return HttpResponseBadRequest("Invalid capacity")
+
+    dry_run = bool(payload.get("dry_run"))
+    if not dry_run and (payload.get("background") or len(localbody_ids) * len(dates) > CALENDAR_INLINE_PAIRS):
+        return _job_accepted(request, jobs.enqueue("calendar", {
+            "localbody_ids": localbody_ids,
+            "dates": [d.isoformat() for d in dates],
+            "capacity": capacity,
+        }, user=request.user))
+    result = generate_calendar(localbody_ids, dates, dry_run=dry_run)
+    if capacity is not None and result["created"]:
+        set_capacity([c["id"] for c in result["created"]], capacity)
+    return JsonResponse({
+        "status": "dry_run" if dry_run else "created",
+        "localbodies": len(localbody_ids),
+        "dates": len(dates),
+        **result,
+    })
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_POST
+def set_calendar_capacity(request):
+    """
+    Set how many pickups calendar dates accept. Expects a JSON body:
+    {"calendar_ids": [1, 2], "capacity": 80, "ward": "12"}
+    capacity null removes the limit; with "ward" the limit applies to that
+    ward only.
+    """
+    try:
+        payload = json.loads(request.body or "{}")
+        calendar_ids = [int(i) for i in payload.get("calendar_ids", [])]
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return HttpResponseBadRequest("Invalid JSON")
+
+    capacity = payload.get("capacity")
+    if capacity is not None and (not isinstance(capacity, int) or capacity < 0):
+        return HttpResponseBadRequest("Invalid capacity")
+    calendar_ids = list(LocalBodyCalendar.objects.filter(pk__in=calendar_ids).values_list("id", flat=True))
+    if not calendar_ids:
+        return HttpResponseBadRequest("Provide 'calendar_ids'.")
+
+    changed = set_capacity(calendar_ids, capacity, ward=str(payload.get("ward") or "") or None)
+    return JsonResponse({"status": "updated", "updated": changed})
+
+
 @login_required
 @user_passes_test(is_super_admin)
 @require_POST
@@ -403,6 +505,130 @@ def delete_calendar_date(request, pk):
     return JsonResponse({"status": "deleted", "id": pk})
 
 
+@login_required
+@user_passes_test(is_super_admin)
+@require_GET
+def search_locations(request):
+    """
+    Spatial lookups over waste profiles for the map views.
+    ?lat=..&lng=..&radius_km=2       profiles within a radius
+    ?lat=..&lng=..&k=10              k nearest profiles
+    ?bbox=south,west,north,east      profiles in a map viewport
+    """
+    try:
+        if request.GET.get("bbox"):
+            south, west, north, east = (float(v) for v in request.GET["bbox"].split(","))
+            matches = [(pk, None) for pk in within_bbox(south, west, north, east)]
+        else:
+            lat = float(request.GET["lat"])
+            lng = float(request.GET["lng"])
+            if request.GET.get("k"):
+                matches = nearest(lat, lng, k=min(int(request.GET["k"]), 500))
+            else:
+                matches = within_radius(lat, lng, min(float(request.GET.get("radius_km", 2)), 50))
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("Provide bbox, or lat/lng with radius_km or k")
+
+    matches = matches[:5000]
+    profiles = {
+        p["id"]: p for p in CustomerWasteInfo.objects.filter(id__in=[pk for pk, _ in matches]).values(
+            "id", "full_name", "pickup_address", "latitude", "longitude",
+            "waste_type", "status", "number_of_bags", "ward", "assigned_collector_id"
+        )
+    }
+    data = []
+    for pk, distance in matches:
+        if pk in profiles:
+            row = profiles[pk]
+            if distance is not None:
+                row["distance_km"] = round(distance, 3)
+            data.append(row)
+    return JsonResponse(data, safe=False)
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_GET
+def map_clusters(request):
+    """
+    Map data for a viewport: ?zoom=12&bbox=south,west,north,east
+    Below street level zoom returns pre-aggregated clusters (count, bags and
+    waste type mix per cell); at high zoom the individual profiles.
+    """
+    try:
+        zoom = max(0, min(int(request.GET.get("zoom", 10)), 22))
+        south, west, north, east = (float(v) for v in request.GET["bbox"].split(","))
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("Provide zoom and bbox=south,west,north,east")
+    if south > north or west > east:
+        return HttpResponseBadRequest("Invalid bbox")
+    return JsonResponse(map_data(south, west, north, east, zoom))
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_GET
+def collector_route(request, collector_id):
+    """
+    Optimised visit order for a collector's assigned pickups.
+    ?date=YYYY-MM-DD (default today), optional start point ?start_lat=..&start_lng=..
+    """
+    collector = get_object_or_404(CustomUser, pk=collector_id, role=1)
+    try:
+        day = parse_date(request.GET.get("date", "")) or timezone.localdate()
+    except ValueError:
+        return HttpResponseBadRequest("Invalid date")
+
+    start = None
+    if request.GET.get("start_lat") and request.GET.get("start_lng"):
+        try:
+            start = (float(request.GET["start_lat"]), float(request.GET["start_lng"]))
+        except ValueError:
+            return HttpResponseBadRequest("Invalid start point")
+
+    return JsonResponse(plan_route(collector.id, day, start=start))
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_POST
+def auto_assign_collectors(request):
+    """
+    Plan (and optionally apply) collector assignment for all unassigned profiles of a day.
+    POST: date=YYYY-MM-DD, localbody (optional), max_stops, max_bags (optional capacity limits),
+          preview=0 to apply the plan; by default only the plan is returned, with a plan_id.
+    POST plan_id=<id> applies that previewed plan as it was shown.
+    """
+    if request.POST.get("plan_id"):
+        plan = get_plan(request.POST["plan_id"])
+        if plan is None:
+            return HttpResponseBadRequest("Plan expired, preview it again")
+        plan["applied"] = apply_assignment(plan)
+        plan["status"] = "applied"
+        discard_plan(request.POST["plan_id"])
+        return JsonResponse(plan)
+
+    try:
+        day = parse_date(request.POST.get("date", ""))
+    except ValueError:
+        day = None
+    if not day:
+        return HttpResponseBadRequest("Invalid date")
+    try:
+        localbody_id = int(request.POST["localbody"]) if request.POST.get("localbody") else None
+        max_stops = int(request.POST["max_stops"]) if request.POST.get("max_stops") else None
+        max_bags = int(request.POST["max_bags"]) if request.POST.get("max_bags") else None
+    except ValueError:
+        return HttpResponseBadRequest("localbody, max_stops and max_bags must be numbers")
+
+    plan = plan_assignment(day, localbody_id=localbody_id, max_stops=max_stops, max_bags=max_bags)
+    if request.POST.get("preview", "1") in ("0", "false"):
+        plan["applied"] = apply_assignment(plan)
+        plan["status"] = "applied"
+    else:
+        plan["status"] = "preview"
+        plan["plan_id"] = store_plan(plan)
+    return JsonResponse(plan)
+
 
 
 
@@ -414,6 +640,19 @@ from django.contrib import messages
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from customer_dashboard.models import CustomerWasteInfo, CustomerPickupDate
+from customer_dashboard.booking import INVALID, WAITLISTED, book_pickup_dates, parse_date_ids
+from customer_dashboard.geo import nearest, within_bbox, within_radius
+from customer_dashboard.map_clusters import map_data
+from customer_dashboard.geocoder import MIN_CONFIDENCE, geocode
+from customer_dashboard.search import find_customer_by_phone
+from waste_collector_dashboard.routing import plan_route
+from .assignment import apply_assignment, discard_plan, get_plan, plan_assignment, store_plan
+from .reporting import rollup_report
+from .exports import csv_response, dataset_rows, report_filters, xlsx_response
+from . import jobs
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
+from django.urls import reverse
 from authentication.models import CustomUser
 from super_admin_dashboard.models import State, District, LocalBody
 @login_required
@@ -421,10 +660,9 @@ def create_waste_profile(request):
     if request.method == "POST":
         contact_number = request.POST.get("contact_number")
 
-        # Step 1: Check if customer exists
-        try:
-            customer = CustomUser.objects.get(contact_number=contact_number, role=0)
-        except CustomUser.DoesNotExist:
+        # Step 1: Check if customer exists (formatting like +91 / spaces is ignored)
+        customer = find_customer_by_phone(contact_number)
+        if customer is None:
             messages.error(request, "No registered customer found with this contact number.")
             return redirect("super_admin_dashboard:create_waste_profile")
 
@@ -442,7 +680,12 @@ def create_waste_profile(request):
         ward = request.POST.get("ward")
         selected_date_id = request.POST.get("selected_date")  # calendar selected date
 
-        # Step 3: Create Waste Profile
+        # Step 3: Create Waste Profile, placed from the local gazetteer when it matches well
+        location = geocode(
+            " ".join(p for p in (pickup_address, landmark) if p), pincode=pincode, localbody_id=localbody_id or None
+        )
+        if location and location["confidence"] < MIN_CONFIDENCE:
+            location = None
         waste_info = CustomerWasteInfo.objects.create(
             user=customer,
             full_name=full_name,
@@ -455,28 +698,26 @@ def create_waste_profile(request):
             localbody_id=localbody_id,
             waste_type=waste_type,
             number_of_bags=number_of_bags,
-            ward=ward
+            ward=ward,
+            latitude=f"{location['latitude']:.6f}" if location else None,
+            longitude=f"{location['longitude']:.6f}" if location else None,
         )
 
         # Step 4: Save pickup date if given
         if selected_date_id:
-            try:
-                cal = LocalBodyCalendar.objects.get(pk=int(selected_date_id))
-                CustomerPickupDate.objects.create(
-                    user=customer,
-                    waste_info=waste_info,
-                    localbody_calendar=cal
-                )
-            except LocalBodyCalendar.DoesNotExist:
+            results = book_pickup_dates(customer, waste_info, parse_date_ids(selected_date_id))
+            if not results or any(r["status"] == INVALID for r in results):
                 messages.warning(request, "Invalid pickup date selected.")
+            if any(r["status"] == WAITLISTED for r in results):
+                messages.warning(request, "Some pickup dates are full; the customer was added to their waitlist.")
 
         messages.success(request, f"Waste profile created for {customer.first_name}")
         return redirect("super_admin_dashboard:view_customer_waste_info")
 
     # GET request
-    states = State.objects.all()
-    ward_range = range(1, 75)  # Wards 1–15
+    states = get_states()
     ward_options = get_ward_options()
+    ward_range = [number for number, _ in ward_options]
     bag_range = range(1, 11)   # Bags 1–10
 
     return render(request, "superadmin_waste_form.html", {
@@ -525,15 +766,13 @@ def edit_waste_profile(request, pk):
 
             selected_date_id = request.POST.get("selected_date")
             if selected_date_id:
-                try:
-                    cal = LocalBodyCalendar.objects.get(pk=int(selected_date_id))
-                    CustomerPickupDate.objects.update_or_create(
-                        waste_info=waste_info,
-                        user=waste_info.user,
-                        defaults={"localbody_calendar": cal}
-                    )
-                except LocalBodyCalendar.DoesNotExist:
+                results = book_pickup_dates(
+                    waste_info.user, waste_info, parse_date_ids(selected_date_id), replace=True
+                )
+                if not results or any(r["status"] == INVALID for r in results):
                     messages.warning(request, "⚠️ Invalid pickup date selected.")
+                if any(r["status"] == WAITLISTED for r in results):
+                    messages.warning(request, "⚠️ Some pickup dates are full; the customer was added to their waitlist.")
 
             messages.success(request, "✅ Waste profile updated successfully.")
             return redirect("super_admin_dashboard:waste_info_list")
@@ -542,7 +781,7 @@ def edit_waste_profile(request, pk):
 
     available_dates = LocalBodyCalendar.objects.filter(localbody=waste_info.localbody).order_by("date")
     districts = District.objects.all()
-    localbodies = LocalBody.objects.filter(district=waste_info.district)
+    localbodies = get_localbodies(waste_info.district_id)
 
     return render(request, "superadmin_edit_waste.html", {
         "form": form,
@@ -569,42 +808,159 @@ def delete_waste_profile(request, pk):
     })
 
 
-from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import Case, Exists, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from .pagination import KeysetPaginator
+from customer_dashboard.search import search_waste_info_ids
+
+SEARCH_RESULT_LIMIT = 500
 
 @login_required
 def waste_info_list(request):
     search_query = request.GET.get("q", "")   # search input
-    page_number = request.GET.get("page", 1)  # current page
 
     # Fetch all customer waste profiles
     waste_infos = CustomerWasteInfo.objects.select_related(
         "state", "district", "localbody", "assigned_collector", "user"
     ).prefetch_related("customerpickupdate_set__localbody_calendar")
 
-    # ✅ Search filter (name / phone / address)
+    # ✅ Search filter (name / phone / address / landmark / pincode / ward), best match first
     if search_query:
-        waste_infos = waste_infos.filter(
-            Q(user__first_name__icontains=search_query) |
-            Q(user__last_name__icontains=search_query) |
-            Q(user__contact_number__icontains=search_query) |
-            Q(pickup_address__icontains=search_query)
-        )
+        ids = search_waste_info_ids(search_query, limit=SEARCH_RESULT_LIMIT)
+        if ids:
+            waste_infos = waste_infos.filter(id__in=ids).annotate(
+                search_rank=Case(*[When(id=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+            )
+            ordering = "search_rank"
+        else:
+            waste_infos = waste_infos.none()
+            ordering = "-id"
+    else:
+        ordering = "-id"
 
-    # ✅ Pagination (10 profiles per page)
-    paginator = Paginator(waste_infos.order_by("-id"), 10)
-    page_obj = paginator.get_page(page_number)
+    # ✅ Keyset pagination (10 profiles per page, ?cursor= tokens), deep pages cost the same as page 1
+    page_obj, total_count = paginate(request, waste_infos, ordering=ordering, page_size=10)
 
     # Fetch all collectors
     collectors = CustomUser.objects.filter(role=1)
 
     return render(request, "waste_info_list.html", {
         "page_obj": page_obj,
+        "total_count": total_count,
         "collectors": collectors,
         "search_query": search_query,
     })
 
 
+WASTE_INFO_SORTS = {
+    "newest": "-id",
+    "oldest": "id",
+    "name": "name_sort",
+    "next_pickup": "next_pickup_sort",
+    "-next_pickup": "-next_pickup_sort",
+}
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_GET
+def waste_info_api(request):
+    """
+    Keyset-paginated waste profiles for the view_customer_wasteinfo page.
+    Filters: localbody, ward, status, collector (id | assigned | unassigned),
+             pickup_from, pickup_to (YYYY-MM-DD)
+    Options: sort (newest | oldest | name | next_pickup | -next_pickup), page_size, cursor
+    """
+    today = timezone.localdate()
+    next_pickup = CustomerPickupDate.objects.filter(
+        waste_info=OuterRef('pk'),
+        localbody_calendar__date__gte=today,
+    ).order_by('localbody_calendar__date').values('localbody_calendar__date')[:1]
+
+    waste_infos = CustomerWasteInfo.objects.annotate(
+        next_pickup=Subquery(next_pickup),
+    ).annotate(
+        next_pickup_sort=Coalesce('next_pickup', Value(date.max)),
+        # full_name is nullable; NULL cannot be a keyset bound and sorts differently per database
+        name_sort=Coalesce('full_name', Value('')),
+    )
+
+    params = request.GET
+    if params.get('localbody'):
+        if not params['localbody'].isdigit():
+            return HttpResponseBadRequest("Invalid localbody")
+        waste_infos = waste_infos.filter(localbody_id=params['localbody'])
+    if params.get('ward'):
+        waste_infos = waste_infos.filter(ward=params['ward'])
+    status = params.get('status')
+    if status == 'pending':
+        waste_infos = waste_infos.filter(Q(status__isnull=True) | Q(status='') | Q(status__iexact='pending'))
+    elif status:
+        waste_infos = waste_infos.filter(status__iexact=status)
+    collector = params.get('collector')
+    if collector == 'unassigned':
+        waste_infos = waste_infos.filter(assigned_collector__isnull=True)
+    elif collector == 'assigned':
+        waste_infos = waste_infos.filter(assigned_collector__isnull=False)
+    elif collector and collector.isdigit():
+        waste_infos = waste_infos.filter(assigned_collector_id=collector)
+
+    try:
+        pickup_from = parse_date(params.get('pickup_from', ''))
+        pickup_to = parse_date(params.get('pickup_to', ''))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid pickup_from/pickup_to")
+    if pickup_from or pickup_to:
+        pickups = CustomerPickupDate.objects.filter(waste_info=OuterRef('pk'))
+        if pickup_from:
+            pickups = pickups.filter(localbody_calendar__date__gte=pickup_from)
+        if pickup_to:
+            pickups = pickups.filter(localbody_calendar__date__lte=pickup_to)
+        waste_infos = waste_infos.filter(Exists(pickups))
+
+    rows = waste_infos.values(
+        'id', 'full_name', 'secondary_number', 'pickup_address', 'latitude', 'longitude',
+        'ward', 'number_of_bags', 'waste_type', 'status', 'next_pickup', 'next_pickup_sort', 'name_sort',
+        'user__contact_number', 'state__name', 'district__name', 'localbody__name',
+        'assigned_collector_id', 'assigned_collector__username',
+    )
+
+    ordering = WASTE_INFO_SORTS.get(params.get('sort'), '-id')
+    try:
+        page = KeysetPaginator(rows, ordering=ordering, page_size=params.get('page_size') or 25).get_page(
+            params.get('cursor')
+        )
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    results = []
+    for row in page:
+        row.pop('next_pickup_sort')
+        row.pop('name_sort')
+        row['next_pickup'] = row['next_pickup'].isoformat() if row['next_pickup'] else None
+        results.append(row)
+
+    return JsonResponse({
+        'results': results,
+        'next': page.next_token,
+        'prev': page.prev_token,
+    })
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_GET
+def waste_info_autocomplete(request):
+    """Top matches for the search box: ?q=name, address, pincode or phone prefix"""
+    ids = search_waste_info_ids(request.GET.get("q", ""), limit=10)
+    rows = {
+        row["id"]: row for row in CustomerWasteInfo.objects.filter(id__in=ids).values(
+            "id", "full_name", "pickup_address", "user_id", "user__contact_number", "localbody__name", "ward"
+        )
+    }
+    return JsonResponse([rows[pk] for pk in ids if pk in rows], safe=False)
+
+
 @login_required
 def generate_reports(request):
     # Get filter parameters
@@ -614,52 +970,19 @@ def generate_reports(request):
     district_id = request.GET.get('district')
     localbody_id = request.GET.get('localbody')
 
-    # Start with all waste collections
-    collections = WasteCollection.objects.all()
-
-    # Apply date filters
-    if start_date:
-        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-        collections = collections.filter(created_at__date__gte=start_date_obj)
-
-    if end_date:
-        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-        collections = collections.filter(created_at__date__lte=end_date_obj)
-
-    # Apply location filters by joining with CustomerWasteInfo
-    if state_id:
-        collections = collections.filter(customer__customer_info__state_id=state_id)
+    start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+    end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
 
-    if district_id:
-        collections = collections.filter(customer__customer_info__district_id=district_id)
-
-    if localbody_id:
-        collections = collections.filter(customer__customer_info__localbody_id=localbody_id)
-
-    # Aggregate data by local body and date
-    report_data = collections.values(
-        'customer__customer_info__state__name',
-        'customer__customer_info__district__name',
-        'customer__customer_info__localbody__name',
-        'created_at__date'
-    ).annotate(
-        total_weight=Sum('kg'),
-        order_count=Count('id')
-    ).order_by(
-        'customer__customer_info__state__name',
-        'customer__customer_info__district__name',
-        'customer__customer_info__localbody__name',
-        'created_at__date'
-    )
+    # Aggregates come from the daily rollup table instead of a live GROUP BY
+    report = rollup_report(start_date_obj, end_date_obj, state_id, district_id, localbody_id)
+    report_data = report['report_data']
+    total_weight = report['total_weight']
+    total_orders = report['total_orders']
 
     # Get filter options
-    states = State.objects.all()
-    districts = District.objects.filter(state_id=state_id) if state_id else District.objects.none()
-    localbodies = LocalBody.objects.filter(district_id=district_id) if district_id else LocalBody.objects.none()
-
-    # Calculate summary statistics
-    total_weight = collections.aggregate(Sum('kg'))['kg__sum'] or 0
-    total_orders = collections.count()
+    states = get_states()
+    districts = get_districts(state_id)
+    localbodies = get_localbodies(district_id, with_body_type=False)
 
     context = {
         'report_data': report_data,
@@ -673,20 +996,127 @@ def generate_reports(request):
         'selected_localbody': localbody_id,
         'total_weight': total_weight,
         'total_orders': total_orders,
+        'total_amount': report['total_amount'],
     }
 
     return render(request, 'reports.html', context)
 
 
 @login_required
+@etag(hierarchy_etag)
 def load_districts_for_reports(request):
     state_id = request.GET.get('state_id')
-    districts = District.objects.filter(state_id=state_id).values('id', 'name')
-    return JsonResponse(list(districts), safe=False)
+    return JsonResponse(get_districts(state_id), safe=False)
 
 
 @login_required
+@etag(hierarchy_etag)
 def load_localbodies_for_reports(request):
     district_id = request.GET.get('district_id')
-    localbodies = LocalBody.objects.filter(district_id=district_id).values('id', 'name')
-    return JsonResponse(list(localbodies), safe=False)
+    return JsonResponse(get_localbodies(district_id, with_body_type=False), safe=False)
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_GET
+def export_data(request, dataset):
+    """
+    Stream an export: dataset is reports, collections, waste_profiles or users.
+    Accepts the generate_reports filters plus ?format=csv|xlsx (and ?role= for users).
+    With ?background=1 the file is built by a background job instead; the
+    202 response carries the job's status URL.
+    """
+    role = request.GET.get("role")
+    try:
+        filters = report_filters(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    rows = dataset_rows(dataset, filters, role=int(role) if role and role.isdigit() else None)
+    if rows is None:
+        return HttpResponseBadRequest("Unknown export")
+    if request.GET.get("background"):
+        params = {key: request.GET.get(key) for key in EXPORT_PARAMS if request.GET.get(key)}
+        return _job_accepted(request, jobs.enqueue("export", {**params, "dataset": dataset}, user=request.user))
+    columns, source = rows
+    filename = f"{dataset}_{timezone.localdate().isoformat()}"
+    if request.GET.get("format") == "xlsx":
+        return xlsx_response(columns, source, filename)
+    return csv_response(columns, source, filename)
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_GET
+def export_collectors_csv(request):
+    try:
+        filters = report_filters(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    columns, source = dataset_rows("users", filters, role=1)
+    return csv_response(columns, source, f"collectors_{timezone.localdate().isoformat()}")
+
+
+# ////// Background jobs
+
+EXPORT_PARAMS = ("start_date", "end_date", "state", "district", "localbody", "format", "role")
+
+
+def _job_accepted(request, job):
+    return JsonResponse({
+        "success": True,
+        "job_id": str(job.id),
+        "status": job.status,
+        "status_url": reverse("super_admin_dashboard:job_status", args=[job.id]),
+    }, status=202)
+
+
+def _own_job_or_404(request, job_id):
+    job = get_object_or_404(jobs.BackgroundJob, pk=job_id)
+    if job.created_by_id not in (None, request.user.id) and not request.user.is_superuser:
+        raise Http404("No such job")
+    return job
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_POST
+def generate_report(request):
+    """
+    Queue a dashboard report. JSON body: {"report_type": "monthly_collection"}
+    (or "collection" with start_date / end_date / state / district / localbody).
+    Answers 202 with the job's status URL; the dashboard polls it.
+    """
+    try:
+        payload = json.loads(request.body or "{}")
+        params = jobs.report_params(payload.get("report_type"), payload)
+        report_filters(params)
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({"success": False, "error": "Invalid JSON"}, status=400)
+    except ValueError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+    return _job_accepted(request, jobs.enqueue("report", params, user=request.user))
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_GET
+def job_status(request, job_id):
+    """Status, progress and result of a background job, for polling"""
+    job = _own_job_or_404(request, job_id)
+    return JsonResponse(jobs.serialise(job, download_url=reverse("super_admin_dashboard:job_result", args=[job.id])))
+
+
+@login_required
+@user_passes_test(is_super_admin)
+@require_GET
+def job_result(request, job_id):
+    """Download the file a finished job produced"""
+    job = _own_job_or_404(request, job_id)
+    if job.status != jobs.SUCCEEDED or not job.result_file:
+        raise Http404("No result")
+    try:
+        handle = default_storage.open(job.result_file, "rb")
+    except OSError:
+        raise Http404("Result expired")
+    return FileResponse(handle, as_attachment=True, filename=jobs.result_filename(job))
+
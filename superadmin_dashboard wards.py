@@ -0,0 +1,284 @@
+"""
+Ward registry per LocalBody.
+
+Wards are stored in the Ward table and loaded into a precomputed registry
+per local body (names, form options and an optional boundary index), cached
+in process memory and in the shared cache under a version stamp that is
+bumped whenever a Ward is saved or deleted.
+
+Local bodies without registered wards get plain numbered wards
+(DEFAULT_WARD_COUNT of them, "Ward 1", "Ward 2", ...) until their table is
+added, e.g. seed_wards(localbody, KOCHI_WARD_NAMES) for Kochi Corporation.
+
+Boundaries are optional lists of [latitude, longitude] points. When a local
+body has them, the ward of a CustomerWasteInfo is resolved from its
+coordinates at save time; the assign_wards command re-resolves existing
+profiles after boundaries are added or changed.
+"""
+import time
+import uuid
+from math import floor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from customer_dashboard.models import CustomerWasteInfo
+from .models import LocalBody
+
+
+# Ward table of Kochi Corporation, for seed_wards()
+KOCHI_WARD_NAMES = {
+    1: "Fort Kochi",
+    2: "Kalvathy",
+    3: "Earavely",
+    4: "Karippalam",
+    5: "Cheralayi",
+    6: "Mattanchery",
+    7: "Chakkamadam",
+    8: "Karuvelippady",
+    9: "Island North",
+    10: "Ravipuram",
+    11: "Ernakulam South",
+    12: "Gandhi Nagar",
+    13: "Kathrikadavu",
+    14: "Ernakulam Central",
+    15: "Ernakulam North",
+    16: "Kaloor South",
+    17: "Kaloor North",
+    18: "Thrikkanarvattom",
+    19: "Ayyappankavu",
+    20: "Pottakuzhy",
+    21: "Elamakkara South",
+    22: "Pachalam",
+    23: "Thattazham",
+    24: "Vaduthala West",
+    25: "Vaduthala East",
+    26: "Elamakkara North",
+    27: "Puthukkalavattam",
+    28: "Kunnumpuram",
+    29: "Ponekkara",
+    30: "Edappally",
+    31: "Changampuzha",
+    32: "Dhevankulangara",
+    33: "Palarivattom",
+    34: "Stadium",
+    35: "Karanakkodam",
+    36: "Puthiyaroad",
+    37: "Padivattam",
+    38: "Vennala",
+    39: "Chakkaraparambu",
+    40: "Chalikkavattam",
+    41: "Thammanam",
+    42: "Elamkulam",
+    43: "Girinagar",
+    44: "Ponnurunni",
+    45: "Ponnurunni East",
+    46: "Vyttila",
+    47: "Poonithura",
+    48: "Vyttila Janatha",
+    49: "Kadavanthra",
+    50: "Panampilly Nagar",
+    51: "Perumanoor",
+    52: "Konthuruthy",
+    53: "Thevara",
+    54: "Island South",
+    55: "Kadebhagam",
+    56: "Palluruthy East",
+    57: "Thazhuppu",
+    58: "Eadakochi North",
+    59: "Edakochi South",
+    60: "Perumbadappu",
+    61: "Konam",
+    62: "Palluruthy Kacheripady",
+    63: "Nambyapuram",
+    64: "Palluruthy",
+    65: "Pullardesam",
+    66: "Tharebhagam",
+    67: "Thoppumpady",
+    68: "Mundamvely East",
+    69: "Mundamvely",
+    70: "Manassery",
+    71: "Moolamkuzhy",
+    72: "Chullickal",
+    73: "Nasrathu",
+    74: "Panayappilly",
+    75: "Amaravathy",
+    76: "Fortkochi Veli",
+}
+
+VERSION_KEY = "wards:version"
+ROWS_KEY = "wards:{version}:{localbody_id}"
+LOCAL_CHECK_SECONDS = 5
+# Grid cell size of the boundary index, in degrees (~1 km)
+CELL_SIZE = 0.01
+
+
+class Ward(models.Model):
+    localbody = models.ForeignKey(LocalBody, on_delete=models.CASCADE, related_name="wards")
+    number = models.PositiveIntegerField()
+    name = models.CharField(max_length=100)
+    boundary = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("localbody", "number")
+        ordering = ["localbody", "number"]
+
+    def __str__(self):
+        return f"{self.number} - {self.name}"
+
+
+def _cell(lat, lng):
+    return floor(lat / CELL_SIZE), floor(lng / CELL_SIZE)
+
+
+def _point_in_polygon(lat, lng, polygon):
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lng_i = polygon[i]
+        lat_j, lng_j = polygon[j]
+        if (lng_i > lng) != (lng_j > lng):
+            cross = (lat_j - lat_i) * (lng - lng_i) / (lng_j - lng_i) + lat_i
+            if lat < cross:
+                inside = not inside
+        j = i
+    return inside
+
+
+class WardRegistry:
+    """Precomputed ward lookups for one local body"""
+
+    def __init__(self, rows):
+        # rows: [(number, name, boundary or None), ...]
+        self.names = {number: name for number, name, _ in rows}
+        self.options = sorted(self.names.items())
+        self._polygons = {}
+        self._grid = {}
+        for number, _, boundary in rows:
+            if not boundary or len(boundary) < 3:
+                continue
+            polygon = [(float(lat), float(lng)) for lat, lng in boundary]
+            self._polygons[number] = polygon
+            lats = [p[0] for p in polygon]
+            lngs = [p[1] for p in polygon]
+            min_cell = _cell(min(lats), min(lngs))
+            max_cell = _cell(max(lats), max(lngs))
+            for x in range(min_cell[0], max_cell[0] + 1):
+                for y in range(min_cell[1], max_cell[1] + 1):
+                    self._grid.setdefault((x, y), []).append(number)
+
+    @property
+    def has_boundaries(self):
+        return bool(self._polygons)
+
+    def name(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return None
+        return self.names.get(number, f"Ward {number}")
+
+    def locate(self, latitude, longitude):
+        """Return the ward number containing the point, or None"""
+        if not self._polygons or latitude is None or longitude is None:
+            return None
+        lat, lng = float(latitude), float(longitude)
+        for number in self._grid.get(_cell(lat, lng), []):
+            if _point_in_polygon(lat, lng, self._polygons[number]):
+                return number
+        return None
+
+
+def _numbered_registry():
+    count = getattr(settings, "DEFAULT_WARD_COUNT", 76)
+    return WardRegistry([(n, f"Ward {n}", None) for n in range(1, count + 1)])
+
+
+DEFAULT_REGISTRY = _numbered_registry()
+
+_local = {"version": None, "checked_at": 0.0, "registries": {}}
+
+
+def _get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex[:12], None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_ward_registry(localbody_id=None):
+    """Registry for a local body, falling back to numbered wards when it has none registered"""
+    try:
+        localbody_id = int(localbody_id)
+    except (TypeError, ValueError):
+        return DEFAULT_REGISTRY
+
+    now = time.monotonic()
+    if now - _local["checked_at"] >= LOCAL_CHECK_SECONDS:
+        version = _get_version()
+        if version != _local["version"]:
+            _local.update(version=version, registries={})
+        _local["checked_at"] = now
+
+    registry = _local["registries"].get(localbody_id)
+    if registry is None:
+        key = ROWS_KEY.format(version=_local["version"], localbody_id=localbody_id)
+        rows = cache.get(key)
+        if rows is None:
+            rows = list(Ward.objects.filter(localbody_id=localbody_id).values_list("number", "name", "boundary"))
+            cache.set(key, rows, None)
+        registry = WardRegistry(rows) if rows else DEFAULT_REGISTRY
+        _local["registries"][localbody_id] = registry
+    return registry
+
+
+def get_ward_names(localbody_id=None):
+    """Return a dictionary mapping ward numbers to ward names"""
+    return get_ward_registry(localbody_id).names
+
+
+def get_ward_options(localbody_id=None):
+    """Return a list of tuples (number, name) for ward options"""
+    return get_ward_registry(localbody_id).options
+
+
+def resolve_ward(info):
+    """Set info.ward from its coordinates when the local body has boundaries. Returns True if changed."""
+    if info.latitude is None or info.longitude is None or not info.localbody_id:
+        return False
+    number = get_ward_registry(info.localbody_id).locate(info.latitude, info.longitude)
+    if number is None or str(number) == str(info.ward):
+        return False
+    info.ward = number
+    return True
+
+
+def assign_wards(infos):
+    """Resolve wards for many profiles, e.g. after boundaries changed. Returns the changed ones."""
+    return [info for info in infos if resolve_ward(info)]
+
+
+def seed_wards(localbody, names):
+    """Create missing Ward rows for a local body from a {number: name} table such as KOCHI_WARD_NAMES"""
+    existing = set(Ward.objects.filter(localbody=localbody).values_list("number", flat=True))
+    Ward.objects.bulk_create([
+        Ward(localbody=localbody, number=number, name=name)
+        for number, name in names.items() if number not in existing
+    ])
+    invalidate_wards(Ward)
+
+
+@receiver(post_save, sender=Ward)
+@receiver(post_delete, sender=Ward)
+def invalidate_wards(sender, **kwargs):
+    cache.set(VERSION_KEY, uuid.uuid4().hex[:12], None)
+    _local.update(version=None, checked_at=0.0, registries={})
+
+
+@receiver(pre_save, sender=CustomerWasteInfo)
+def set_ward_from_location(sender, instance, **kwargs):
+    resolve_ward(instance)
@@ -0,0 +1,239 @@
+"""
+Per collector, per day pickup manifest.
+
+One compact JSON document with a collector's stops for a day, grouped by
+local body and then ward, built from a single joined query over the
+pickup dates. Documents are cached per collector under a version stamp
+that is bumped (after commit) whenever something on the manifest can
+change: an assignment, a pickup date booked, moved or cancelled, a
+calendar date moved, or the customer's profile or contact details
+edited. The stamp doubles as the ETag, so a reload with nothing changed
+is a 304 without touching the database beyond the session.
+"""
+import uuid
+
+from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import etag, require_GET
+
+from authentication.models import CustomUser
+from customer_dashboard.models import CustomerPickupDate, CustomerWasteInfo
+from customer_dashboard.snapshots import old_profile
+from super_admin_dashboard.models import LocalBodyCalendar
+from super_admin_dashboard.utils import is_super_admin
+from super_admin_dashboard.wards import get_ward_registry
+
+
+VERSION_KEY = "manifest:{collector_id}:version"
+DATA_KEY = "manifest:{collector_id}:{day}:{version}"
+CACHE_SECONDS = 60 * 60 * 6
+CONTACT_FIELDS = {"first_name", "last_name", "contact_number"}
+
+MANIFEST_FIELDS = (
+    "id", "waste_info_id", "localbody_calendar_id",
+    "waste_info__full_name", "waste_info__secondary_number", "waste_info__pickup_address",
+    "waste_info__landmark", "waste_info__pincode", "waste_info__ward", "waste_info__number_of_bags",
+    "waste_info__waste_type", "waste_info__status", "waste_info__latitude", "waste_info__longitude",
+    "waste_info__localbody_id", "waste_info__localbody__name",
+    "waste_info__district__name", "waste_info__state__name",
+    "waste_info__user_id", "waste_info__user__first_name", "waste_info__user__last_name",
+    "waste_info__user__contact_number",
+)
+
+
+def _version(collector_id):
+    key = VERSION_KEY.format(collector_id=collector_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex[:12], None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_manifests(*collector_ids):
+    """Drop the cached manifests of these collectors once the current transaction commits"""
+    collector_ids = {pk for pk in collector_ids if pk}
+    if not collector_ids:
+        return
+
+    def bump():
+        for collector_id in collector_ids:
+            cache.set(VERSION_KEY.format(collector_id=collector_id), uuid.uuid4().hex[:12], None)
+
+    transaction.on_commit(bump)
+
+
+def manifest_etag(collector_id, day):
+    return f"{collector_id}-{day.isoformat()}-{_version(collector_id)}"
+
+
+def maps_url(latitude, longitude):
+    return f"https://www.google.com/maps/search/?api=1&query={latitude},{longitude}"
+
+
+def _ward_key(ward):
+    ward = str(ward or "")
+    return (0, int(ward), "") if ward.isdigit() else (1, 0, ward)
+
+
+def build_manifest(collector_id, day):
+    rows = CustomerPickupDate.objects.filter(
+        waste_info__assigned_collector_id=collector_id,
+        localbody_calendar__date=day,
+    ).order_by("waste_info__localbody__name", "waste_info_id").values_list(*MANIFEST_FIELDS)
+
+    localbodies = {}
+    seen = set()
+    total_bags = 0
+    for row in rows:
+        r = dict(zip(MANIFEST_FIELDS, row))
+        if r["waste_info_id"] in seen:
+            continue
+        seen.add(r["waste_info_id"])
+
+        localbody_id = r["waste_info__localbody_id"]
+        group = localbodies.get(localbody_id)
+        if group is None:
+            group = localbodies[localbody_id] = {
+                "id": localbody_id,
+                "name": r["waste_info__localbody__name"] or "Unassigned",
+                "district": r["waste_info__district__name"],
+                "state": r["waste_info__state__name"],
+                "stops": 0,
+                "bags": 0,
+                "wards": {},
+            }
+        ward = str(r["waste_info__ward"] or "")
+        if ward not in group["wards"]:
+            group["wards"][ward] = {
+                "ward": ward,
+                "name": get_ward_registry(localbody_id).name(ward) if ward and localbody_id else "",
+                "stops": [],
+            }
+
+        lat, lng = r["waste_info__latitude"], r["waste_info__longitude"]
+        bags = r["waste_info__number_of_bags"] or 0
+        name = f'{r["waste_info__user__first_name"] or ""} {r["waste_info__user__last_name"] or ""}'.strip()
+        group["wards"][ward]["stops"].append({
+            "id": r["waste_info_id"],
+            "pickup_id": r["id"],
+            "customer_id": r["waste_info__user_id"],
+            "code": f'SUG{r["waste_info__user_id"]}',
+            "name": name or r["waste_info__full_name"],
+            "contact": r["waste_info__user__contact_number"],
+            "secondary_contact": r["waste_info__secondary_number"],
+            "address": r["waste_info__pickup_address"],
+            "landmark": r["waste_info__landmark"],
+            "pincode": r["waste_info__pincode"],
+            "bags": bags,
+            "waste_type": r["waste_info__waste_type"],
+            "status": r["waste_info__status"] or "pending",
+            "latitude": float(lat) if lat is not None else None,
+            "longitude": float(lng) if lng is not None else None,
+            "maps_url": maps_url(lat, lng) if lat is not None and lng is not None else None,
+        })
+        group["stops"] += 1
+        group["bags"] += bags
+        total_bags += bags
+
+    groups = []
+    for group in localbodies.values():
+        group["wards"] = [group["wards"][w] for w in sorted(group["wards"], key=_ward_key)]
+        groups.append(group)
+    return {
+        "collector_id": collector_id,
+        "date": day.isoformat(),
+        "total_stops": len(seen),
+        "total_bags": total_bags,
+        "localbodies": groups,
+    }
+
+
+def get_manifest(collector_id, day):
+    key = DATA_KEY.format(collector_id=collector_id, day=day.isoformat(), version=_version(collector_id))
+    manifest = cache.get(key)
+    if manifest is None:
+        manifest = build_manifest(collector_id, day)
+        manifest["generated_at"] = timezone.now().isoformat()
+        cache.set(key, manifest, CACHE_SECONDS)
+    return manifest
+
+
+def _manifest_target(request):
+    """(collector_id, day) for a request, or None when it is not allowed / not valid"""
+    day = parse_date(request.GET.get("date", "")) if request.GET.get("date") else timezone.localdate()
+    if day is None:
+        return None
+    if request.user.role == 1:
+        return request.user.id, day
+    if is_super_admin(request.user) and str(request.GET.get("collector", "")).isdigit():
+        return int(request.GET["collector"]), day
+    return None
+
+
+def _manifest_etag(request):
+    target = _manifest_target(request) if request.user.is_authenticated else None
+    return manifest_etag(*target) if target else None
+
+
+@login_required
+@require_GET
+@etag(_manifest_etag)
+def collector_manifest(request):
+    """
+    The day's stops for the logged-in collector: ?date=YYYY-MM-DD (default today).
+    Super admins may pass ?collector=<id>. Answers 304 while nothing changed.
+    """
+    if request.user.role != 1 and not is_super_admin(request.user):
+        return HttpResponseForbidden("Forbidden")
+    target = _manifest_target(request)
+    if target is None:
+        return HttpResponseBadRequest("Provide a valid date (and collector for admins)")
+    return JsonResponse(get_manifest(*target))
+
+
+# Invalidation
+
+@receiver(post_save, sender=CustomerWasteInfo)
+def invalidate_on_profile_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        old = old_profile(instance)
+        invalidate_manifests(instance.assigned_collector_id, old and old["assigned_collector_id"])
+
+
+@receiver(post_delete, sender=CustomerWasteInfo)
+def invalidate_on_profile_delete(sender, instance, **kwargs):
+    invalidate_manifests(instance.assigned_collector_id)
+
+
+@receiver(post_save, sender=CustomerPickupDate)
+@receiver(post_delete, sender=CustomerPickupDate)
+def invalidate_on_pickup_change(sender, instance, **kwargs):
+    invalidate_manifests(
+        CustomerWasteInfo.objects.filter(pk=instance.waste_info_id).values_list("assigned_collector_id", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=LocalBodyCalendar)
+def invalidate_on_calendar_change(sender, instance, created, raw=False, **kwargs):
+    # A new date has no bookings yet; deleted dates cascade to their pickups, handled above
+    if created or raw:
+        return
+    invalidate_manifests(*CustomerWasteInfo.objects.filter(
+        customerpickupdate__localbody_calendar=instance, assigned_collector__isnull=False
+    ).values_list("assigned_collector_id", flat=True).distinct())
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_on_contact_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.role != 0 or (update_fields is not None and not CONTACT_FIELDS & set(update_fields)):
+        return
+    invalidate_manifests(*CustomerWasteInfo.objects.filter(
+        user=instance, assigned_collector__isnull=False
+    ).values_list("assigned_collector_id", flat=True).distinct())
@@ -0,0 +1,241 @@
+"""
+Background processing of WasteCollection photos.
+
+Once a collection with a new photo is committed, its id is handed to a
+small process-local thread pool. The worker reads the upload, applies the
+EXIF orientation, drops all metadata (including GPS), re-encodes it as
+JPEG and writes three renditions:
+
+    thumb   160 px   admin tables and lists
+    medium  800 px   detail views and the photo popup
+    full   2048 px   replaces the original upload
+
+Renditions are stored under the SHA-256 of the uploaded bytes
+(photo_renditions/ab/abcdef.../medium.jpg), so the same picture uploaded twice is
+processed and stored once. The collection's photo then points at the
+clean full rendition and the original upload is deleted unless
+PHOTO_KEEP_ORIGINALS is set.
+
+CollectionPhoto records the state per collection. A row stays "pending"
+if the process exits before its worker ran; process_collection_photos
+picks those up, along with photos uploaded before this pipeline existed.
+Until a photo is ready, photo_urls() falls back to the original.
+
+Settings (all optional):
+    PHOTO_WORKERS = 2
+    PHOTO_KEEP_ORIGINALS = False
+    PHOTO_JPEG_QUALITY = 82
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, models, transaction
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from django.http import HttpResponseForbidden, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+
+from super_admin_dashboard.utils import is_super_admin
+from .models import WasteCollection
+
+
+logger = logging.getLogger(__name__)
+
+PHOTO_ROOT = "photo_renditions"
+RENDITIONS = {"thumb": 160, "medium": 800, "full": 2048}
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class CollectionPhoto(models.Model):
+    collection = models.OneToOneField(WasteCollection, on_delete=models.CASCADE, primary_key=True,
+                                      related_name="processed_photo")
+    status = models.CharField(max_length=10, default=PENDING, db_index=True)
+    digest = models.CharField(max_length=64, blank=True, db_index=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.collection_id}: {self.status}"
+
+
+def rendition_path(digest, rendition):
+    return f"{PHOTO_ROOT}/{digest[:2]}/{digest}/{rendition}.jpg"
+
+
+def render_renditions(data):
+    """{rendition: jpeg bytes} and the (width, height) of the full rendition, for raw image bytes"""
+    from PIL import Image, ImageOps
+
+    quality = _setting("PHOTO_JPEG_QUALITY", 82)
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+    output = {}
+    size = None
+    # Largest first, each step resizing the previous result
+    for rendition, edge in sorted(RENDITIONS.items(), key=lambda r: -r[1]):
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        buffer = io.BytesIO()
+        # Saved without exif=..., so no metadata is carried over
+        image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+        output[rendition] = buffer.getvalue()
+        if rendition == "full":
+            size = image.size
+    return output, size
+
+
+def _store(path, content):
+    """Write a content-addressed file once; identical content may already be there"""
+    if default_storage.exists(path):
+        return
+    saved = default_storage.save(path, ContentFile(content))
+    if saved != path:
+        # Another worker wrote the same content first and the storage picked a new name
+        default_storage.delete(saved)
+
+
+def process_photo(collection_id):
+    """Process one collection's photo. Returns the resulting status, or None if there is nothing to do."""
+    collection = WasteCollection.objects.filter(pk=collection_id).only("id", "photo").first()
+    if collection is None or not collection.photo:
+        CollectionPhoto.objects.filter(collection_id=collection_id).delete()
+        return None
+    original = collection.photo.name
+    if original.startswith(f"{PHOTO_ROOT}/"):
+        # Already points at a rendition, e.g. a copied collection
+        CollectionPhoto.objects.update_or_create(
+            collection_id=collection_id, defaults={"status": READY, "digest": original.split("/")[2], "error": ""}
+        )
+        return READY
+
+    try:
+        with collection.photo.open("rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        size = None
+        paths = {rendition: rendition_path(digest, rendition) for rendition in RENDITIONS}
+        if not all(default_storage.exists(path) for path in paths.values()):
+            renditions, size = render_renditions(data)
+            for rendition, content in renditions.items():
+                _store(paths[rendition], content)
+    except Exception as e:
+        logger.warning("Processing photo of collection %s failed: %s", collection_id, e)
+        CollectionPhoto.objects.update_or_create(
+            collection_id=collection_id, defaults={"status": FAILED, "error": str(e)[:255]}
+        )
+        return FAILED
+
+    defaults = {"status": READY, "digest": digest, "error": ""}
+    if size:
+        defaults.update(width=size[0], height=size[1])
+    else:
+        # Already stored for an earlier identical upload
+        defaults.update(CollectionPhoto.objects.filter(digest=digest, status=READY).exclude(
+            collection_id=collection_id
+        ).values("width", "height").first() or {})
+    with transaction.atomic():
+        CollectionPhoto.objects.update_or_create(collection_id=collection_id, defaults=defaults)
+        # .update() so the save signals do not queue the photo again
+        WasteCollection.objects.filter(pk=collection_id, photo=original).update(photo=paths["full"])
+
+    if not _setting("PHOTO_KEEP_ORIGINALS", False) and not WasteCollection.objects.filter(photo=original).exists():
+        default_storage.delete(original)
+    return READY
+
+
+def _run(collection_id):
+    try:
+        process_photo(collection_id)
+    except Exception:
+        logger.exception("Photo worker failed for collection %s", collection_id)
+    finally:
+        # Worker threads get their own connection; do not leave it open between tasks
+        connection.close()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=_setting("PHOTO_WORKERS", 2), thread_name_prefix="photos")
+        return _pool
+
+
+def queue_photo(collection_id):
+    """Mark a collection's photo pending and process it in the background once the transaction commits"""
+    CollectionPhoto.objects.update_or_create(
+        collection_id=collection_id, defaults={"status": PENDING, "digest": "", "error": ""}
+    )
+    transaction.on_commit(lambda: _get_pool().submit(_run, collection_id))
+
+
+def photo_urls(collection, photo=None):
+    """{"thumb", "medium", "full"} URLs for a collection, the original upload until processing is done"""
+    if not collection.photo:
+        return None
+    if photo is not None and photo.status == READY and photo.digest:
+        return {rendition: default_storage.url(rendition_path(photo.digest, rendition)) for rendition in RENDITIONS}
+    url = collection.photo.url
+    return {rendition: url for rendition in RENDITIONS}
+
+
+def attach_photo_urls(collections):
+    """Set .photo_urls on each collection, reading the processing state in one query"""
+    collections = list(collections)
+    records = CollectionPhoto.objects.in_bulk([c.pk for c in collections if c.photo])
+    for collection in collections:
+        collection.photo_urls = photo_urls(collection, records.get(collection.pk))
+    return collections
+
+
+@login_required
+@require_GET
+def collection_photo(request, pk):
+    """Processing status and rendition URLs of one collection's photo, for clients polling after upload"""
+    collection = get_object_or_404(WasteCollection.objects.only("id", "photo", "collector_id"), pk=pk)
+    if collection.collector_id != request.user.id and not is_super_admin(request.user):
+        return HttpResponseForbidden("Forbidden")
+    record = CollectionPhoto.objects.filter(collection_id=pk).first()
+    return JsonResponse({
+        "id": collection.pk,
+        "status": record.status if record else (PENDING if collection.photo else None),
+        "urls": photo_urls(collection, record),
+    })
+
+
+@receiver(pre_save, sender=WasteCollection)
+def remember_old_photo(sender, instance, raw=False, **kwargs):
+    instance._photo_old = None
+    if not raw and instance.pk:
+        instance._photo_old = WasteCollection.objects.filter(pk=instance.pk).values_list("photo", flat=True).first()
+
+
+@receiver(post_save, sender=WasteCollection)
+def queue_new_photo(sender, instance, created, raw=False, **kwargs):
+    if raw or not instance.photo:
+        return
+    if created or instance.photo.name != getattr(instance, "_photo_old", None):
+        queue_photo(instance.pk)
+
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from waste_collector_dashboard.models import WasteCollection
+from waste_collector_dashboard.photos import FAILED, READY, CollectionPhoto, process_photo
+
+
+class Command(BaseCommand):
+    help = (
+        "Create renditions for collection photos that have none yet: uploads from before the photo "
+        "pipeline and photos left pending by a restart. Safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Photos processed in parallel")
+        parser.add_argument("--limit", type=int, help="Process at most this many photos")
+        parser.add_argument("--retry-failed", action="store_true", help="Also retry photos that failed before")
+
+    def handle(self, *args, **options):
+        skip = [READY] if options["retry_failed"] else [READY, FAILED]
+        done = CollectionPhoto.objects.filter(status__in=skip).values("collection_id")
+        ids = WasteCollection.objects.exclude(photo="").exclude(photo__isnull=True).exclude(
+            pk__in=done
+        ).order_by("id").values_list("id", flat=True)
+        if options["limit"]:
+            ids = ids[:options["limit"]]
+        ids = list(ids)
+
+        def run(pk):
+            try:
+                return process_photo(pk)
+            finally:
+                connection.close()
+
+        counts = {}
+        with ThreadPoolExecutor(max_workers=max(options["workers"], 1)) as pool:
+            futures = [pool.submit(run, pk) for pk in ids]
+            for n, future in enumerate(as_completed(futures), start=1):
+                status = future.result()
+                counts[status] = counts.get(status, 0) + 1
+                if n % 100 == 0:
+                    self.stdout.write(f"  {n}/{len(ids)}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {len(ids)} photos: {counts.get(READY, 0)} ready, {counts.get(FAILED, 0)} failed"
+        ))
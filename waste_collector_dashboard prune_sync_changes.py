@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from waste_collector_dashboard.sync import RETAIN_DAYS, prune_changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete sync change log entries older than --days. Devices whose token is older than "
+        "the retained log get a full snapshot on their next sync (run daily, e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=RETAIN_DAYS, help="Days of change log to keep")
+
+    def handle(self, *args, **options):
+        deleted = prune_changes(options["days"])
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} sync changes"))
@@ -0,0 +1,185 @@
+"""
+Visit-order planning for a collector's assigned pickups on one day.
+
+Stops are seeded with nearest-neighbour and improved with 2-opt and Or-opt
+moves on a NumPy haversine distance matrix until no move helps or the time
+budget runs out. Plans are cached per collector/day, keyed by a fingerprint
+of the stops so reassignments and location changes produce a fresh plan.
+"""
+import hashlib
+import time
+
+import numpy as np
+from django.core.cache import cache
+
+from customer_dashboard.models import CustomerWasteInfo
+
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_TIME_BUDGET = 0.5
+CACHE_TIMEOUT = 60 * 60 * 6
+
+
+def distance_matrix(coords):
+    """Pairwise haversine distances in km for an (n, 2) array of [lat, lng] degrees"""
+    rad = np.radians(np.asarray(coords, dtype=float))
+    lat = rad[:, 0][:, None]
+    lng = rad[:, 1][:, None]
+    dlat = lat - lat.T
+    dlng = lng - lng.T
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_neighbour(dist, start=0):
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    route = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[route[-1]])
+        nxt = int(np.argmin(row))
+        route.append(nxt)
+        visited[nxt] = True
+    return route
+
+
+def route_length(dist, route):
+    route = np.asarray(route)
+    return float(dist[route[:-1], route[1:]].sum())
+
+
+def two_opt(dist, route, deadline):
+    """Segment reversals on an open path; route[0] and route[-1] stay fixed"""
+    route = np.asarray(route)
+    n = len(route)
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in range(n - 3):
+            a, b = route[i], route[i + 1]
+            c = route[i + 2:n - 1]
+            d = route[i + 3:n]
+            delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9:
+                j += i + 2
+                route[i + 1:j + 1] = route[i + 1:j + 1][::-1].copy()
+                improved = True
+            if time.monotonic() >= deadline:
+                break
+    return route
+
+
+def or_opt(dist, route, deadline, max_segment=3):
+    """Move segments of 1..max_segment stops to their best position elsewhere in the path"""
+    route = list(route)
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for seg_len in range(1, max_segment + 1):
+            i = 1
+            while i + seg_len < len(route):
+                prev, first = route[i - 1], route[i]
+                last, nxt = route[i + seg_len - 1], route[i + seg_len]
+                removal_gain = dist[prev, first] + dist[last, nxt] - dist[prev, nxt]
+
+                rest = route[:i] + route[i + seg_len:]
+                p = np.asarray(rest[:-1])
+                q = np.asarray(rest[1:])
+                insert_cost = dist[p, first] + dist[last, q] - dist[p, q]
+                k = int(np.argmin(insert_cost))
+                if insert_cost[k] < removal_gain - 1e-9 and k != i - 1:
+                    route = rest[:k + 1] + route[i:i + seg_len] + rest[k + 1:]
+                    improved = True
+                else:
+                    i += 1
+                if time.monotonic() >= deadline:
+                    return route
+    return route
+
+
+def optimise_order(coords, start=None, time_budget=DEFAULT_TIME_BUDGET):
+    """
+    Return (order, total_km) for the given [lat, lng] stops.
+
+    With a start point (e.g. the depot) the path begins there; otherwise it
+    begins at the first stop. The path is open: it ends at the last stop.
+    """
+    n = len(coords)
+    if n == 0:
+        return [], 0.0
+    points = ([list(start)] if start is not None else []) + [list(c) for c in coords]
+    offset = 1 if start is not None else 0
+
+    dist = distance_matrix(points)
+    # A dummy end node at zero distance from everything keeps the path open
+    m = len(points)
+    padded = np.zeros((m + 1, m + 1))
+    padded[:m, :m] = dist
+
+    deadline = time.monotonic() + time_budget
+    route = nearest_neighbour(dist, start=0) + [m]
+    if m > 3:
+        route = two_opt(padded, route, deadline)
+        route = or_opt(padded, route, deadline)
+        route = two_opt(padded, route, deadline)
+
+    route = [int(r) for r in route[:-1]]
+    total = route_length(dist, route) if len(route) > 1 else 0.0
+    order = [r - offset for r in route if r >= offset]
+    return order, total
+
+
+def _fingerprint(rows, start):
+    digest = hashlib.sha1(repr((start, rows)).encode())
+    return digest.hexdigest()[:16]
+
+
+def plan_route(collector_id, day, start=None, time_budget=DEFAULT_TIME_BUDGET):
+    """Ordered stops and total distance for a collector's assigned pickups on `day`"""
+    rows = list(
+        CustomerWasteInfo.objects.filter(
+            assigned_collector_id=collector_id,
+            customerpickupdate__localbody_calendar__date=day,
+            latitude__isnull=False,
+            longitude__isnull=False,
+        ).distinct().order_by("id").values_list("id", "latitude", "longitude")
+    )
+    cache_key = f"route:{collector_id}:{day.isoformat()}:{_fingerprint(rows, start)}"
+    plan = cache.get(cache_key)
+    if plan is not None:
+        return plan
+
+    coords = [(float(lat), float(lng)) for _, lat, lng in rows]
+    order, total = optimise_order(coords, start=start, time_budget=time_budget)
+    dist = distance_matrix(([start] if start is not None else []) + coords) if coords else None
+    offset = 1 if start is not None else 0
+
+    details = CustomerWasteInfo.objects.in_bulk([rows[i][0] for i in order])
+    stops = []
+    prev = 0 if start is not None else None
+    for position, idx in enumerate(order, start=1):
+        info = details[rows[idx][0]]
+        leg = float(dist[prev, idx + offset]) if prev is not None else 0.0
+        stops.append({
+            "order": position,
+            "id": info.id,
+            "full_name": info.full_name,
+            "pickup_address": info.pickup_address,
+            "ward": info.ward,
+            "number_of_bags": info.number_of_bags,
+            "latitude": coords[idx][0],
+            "longitude": coords[idx][1],
+            "leg_km": round(leg, 3),
+        })
+        prev = idx + offset
+
+    plan = {
+        "collector_id": collector_id,
+        "date": day.isoformat(),
+        "stops": stops,
+        "total_km": round(total, 3),
+    }
+    cache.set(cache_key, plan, CACHE_TIMEOUT)
+    return plan
@@ -0,0 +1,473 @@
+"""
+Offline-first sync for collectors.
+
+Download: every change that matters to a collector is appended to the
+SyncChange log by save/delete signals (profile assigned or unassigned,
+profile or contact details edited, pickup booked or cancelled, calendar
+date added, moved or removed). The log id is the sync version. A client
+sends the token from its last sync and gets the current state of every
+object changed since then, plus the ids of the ones it should drop.
+Without a token, or with one older than the retained log, it gets a full
+snapshot ("reset": true).
+
+Ids are allocated when a row is inserted but become visible at commit, so
+the returned token only moves past changes older than SETTLE_SECONDS;
+newer ones are sent again next time, which is harmless because every
+change is an idempotent upsert or delete.
+
+Upload: a batch of queued collections in one request. Each item carries
+a client-generated idempotency key; items whose key was already accepted
+return the original collection id instead of creating a duplicate, so a
+client can simply retry a whole batch after a dropped connection. New
+rows are written with one bulk_create, and every item gets its own
+result.
+"""
+import json
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.db import models, router, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+from django.views.decorators.http import require_GET, require_POST
+
+from authentication.models import CustomUser
+from customer_dashboard.models import CustomerPickupDate, CustomerWasteInfo
+from customer_dashboard.snapshots import old_profile
+from super_admin_dashboard.models import LocalBodyCalendar
+from .models import WasteCollection
+
+
+SETTLE_SECONDS = 30
+MAX_CHANGES = 2000
+MAX_UPLOAD_ITEMS = 200
+RETAIN_DAYS = 30
+CONTACT_FIELDS = {"first_name", "last_name", "contact_number"}
+
+PROFILE = "profile"
+CALENDAR = "calendar"
+
+# Upload statuses
+CREATED = "created"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+
+PROFILE_FIELDS = (
+    "id", "user_id", "full_name", "secondary_number", "pickup_address", "landmark", "pincode",
+    "ward", "number_of_bags", "waste_type", "status", "latitude", "longitude",
+    "localbody_id", "district_id", "state_id",
+    "user__first_name", "user__last_name", "user__contact_number",
+)
+
+
+class SyncChange(models.Model):
+    """Append-only change log; the id is the sync version"""
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10)
+    object_id = models.IntegerField()
+    collector_id = models.IntegerField(null=True, blank=True, db_index=True)
+    localbody_id = models.IntegerField(null=True, blank=True, db_index=True)
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.id} {self.kind}:{self.object_id}{' (deleted)' if self.deleted else ''}"
+
+
+class SyncUpload(models.Model):
+    """Idempotency keys of accepted uploads"""
+    collector = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    key = models.CharField(max_length=64)
+    collection = models.ForeignKey(WasteCollection, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("collector", "key")
+
+
+# Change log
+
+def record_profile_changes(collector_ids_by_profile, deleted=False):
+    """{profile id: collector id} -> one log entry each"""
+    SyncChange.objects.bulk_create([
+        SyncChange(kind=PROFILE, object_id=pk, collector_id=collector_id, deleted=deleted)
+        for pk, collector_id in collector_ids_by_profile.items() if collector_id
+    ])
+
+
+def record_profiles(profile_ids):
+    """Log an upsert for assigned profiles, e.g. after bulk writes that send no signals"""
+    record_profile_changes(dict(
+        CustomerWasteInfo.objects.filter(pk__in=profile_ids, assigned_collector__isnull=False)
+        .values_list("id", "assigned_collector_id")
+    ))
+
+
+def record_calendar_changes(calendar_rows):
+    """[(calendar id, local body id)] -> one log entry each, for bulk inserts that send no signals"""
+    SyncChange.objects.bulk_create([
+        SyncChange(kind=CALENDAR, object_id=pk, localbody_id=localbody_id) for pk, localbody_id in calendar_rows
+    ], batch_size=1000)
+
+
+def prune_changes(days=RETAIN_DAYS):
+    return SyncChange.objects.filter(changed_at__lt=timezone.now() - timedelta(days=days)).delete()[0]
+
+
+def _settled_token(changes):
+    """Highest id up to which every fetched change is older than SETTLE_SECONDS"""
+    settled_before = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+    token = None
+    for change in changes:
+        if change.changed_at > settled_before:
+            break
+        token = change.id
+    return token
+
+
+def _snapshot_token():
+    settled_before = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+    return SyncChange.objects.filter(changed_at__lte=settled_before).order_by("-id").values_list(
+        "id", flat=True
+    ).first() or 0
+
+
+def parse_token(raw):
+    """Sync token as int, or None for a full sync"""
+    if raw is None or raw == "":
+        return None
+    if not str(raw).isdigit():
+        raise ValueError("Invalid sync token")
+    return int(raw)
+
+
+# Download
+
+def _profiles(collector_id, ids=None):
+    profiles = CustomerWasteInfo.objects.filter(assigned_collector_id=collector_id)
+    if ids is not None:
+        profiles = profiles.filter(pk__in=ids)
+    rows = {row[0]: dict(zip(PROFILE_FIELDS, row)) for row in profiles.values_list(*PROFILE_FIELDS)}
+
+    pickups = CustomerPickupDate.objects.filter(
+        waste_info_id__in=rows.keys(), localbody_calendar__date__gte=timezone.localdate()
+    ).values_list("waste_info_id", "id", "localbody_calendar_id", "localbody_calendar__date")
+    dates = {}
+    for waste_info_id, pk, calendar_id, day in pickups:
+        dates.setdefault(waste_info_id, []).append({"id": pk, "calendar_id": calendar_id, "date": day.isoformat()})
+
+    result = []
+    for pk, row in rows.items():
+        lat, lng = row.pop("latitude"), row.pop("longitude")
+        first, last = row.pop("user__first_name") or "", row.pop("user__last_name") or ""
+        row["contact_number"] = row.pop("user__contact_number")
+        row["name"] = f"{first} {last}".strip() or row["full_name"]
+        row["latitude"] = float(lat) if lat is not None else None
+        row["longitude"] = float(lng) if lng is not None else None
+        row["pickups"] = sorted(dates.get(pk, []), key=lambda p: p["date"])
+        result.append(row)
+    return result
+
+
+def _calendar(localbody_ids, ids=None):
+    entries = LocalBodyCalendar.objects.filter(localbody_id__in=localbody_ids, date__gte=timezone.localdate())
+    if ids is not None:
+        entries = entries.filter(pk__in=ids)
+    return [
+        {"id": pk, "localbody_id": localbody_id, "date": day.isoformat()}
+        for pk, localbody_id, day in entries.order_by("date").values_list("id", "localbody_id", "date")
+    ]
+
+
+def changes_since(collector_id, token):
+    """The sync document for a collector: a full snapshot when token is None or no longer covered by the log"""
+    localbody_ids = set(
+        CustomerWasteInfo.objects.filter(assigned_collector_id=collector_id, localbody_id__isnull=False)
+        .values_list("localbody_id", flat=True).distinct()
+    )
+    oldest = SyncChange.objects.order_by("id").values_list("id", flat=True).first()
+    if token is None or (oldest is not None and token < oldest - 1):
+        next_token = _snapshot_token()
+        return {
+            "reset": True,
+            "token": str(next_token),
+            "has_more": False,
+            "profiles": _profiles(collector_id),
+            "removed_profiles": [],
+            "calendar": _calendar(localbody_ids),
+            "removed_calendar": [],
+        }
+
+    changes = list(
+        SyncChange.objects.filter(id__gt=token).filter(
+            Q(kind=PROFILE, collector_id=collector_id) | Q(kind=CALENDAR, localbody_id__in=localbody_ids)
+        ).order_by("id")[:MAX_CHANGES + 1]
+    )
+    has_more = len(changes) > MAX_CHANGES
+    changes = changes[:MAX_CHANGES]
+    next_token = changes[-1].id if has_more else (_settled_token(changes) or token)
+
+    # The latest entry per object wins
+    latest = {}
+    for change in changes:
+        latest[(change.kind, change.object_id)] = change
+    profile_ids = {pk for (kind, pk) in latest if kind == PROFILE}
+    calendar_ids = {pk for (kind, pk) in latest if kind == CALENDAR}
+
+    profiles = _profiles(collector_id, profile_ids) if profile_ids else []
+    calendar = _calendar(localbody_ids, calendar_ids) if calendar_ids else []
+    # Anything logged but no longer present for this collector is removed on the device
+    present_profiles = {p["id"] for p in profiles}
+    present_calendar = {c["id"] for c in calendar}
+    return {
+        "reset": False,
+        "token": str(next_token),
+        "has_more": has_more,
+        "profiles": profiles,
+        "removed_profiles": sorted(profile_ids - present_profiles),
+        "calendar": calendar,
+        "removed_calendar": sorted(calendar_ids - present_calendar),
+    }
+
+
+# Upload
+
+# Foreign keys come from the collector and the assigned profile, and the photo is attached
+# after validation; skipping them saves a query per item
+UNCHECKED_FIELDS = ["customer", "collector", "localbody", "photo"]
+
+
+def _decimal(value, places="0.01"):
+    """A finite Decimal rounded to places, or None (NaN and Infinity included)"""
+    try:
+        value = Decimal(str(value))
+        return value.quantize(Decimal(places)) if value.is_finite() else None
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
+def _build_collection(collector, item, profiles, files):
+    """(WasteCollection, None) for a valid upload item, or (None, error)"""
+    info = profiles.get(item.get("customer_waste_info_id"))
+    if info is None:
+        return None, "Unknown or unassigned waste profile"
+    kg = _decimal(item.get("kg"))
+    if kg is None or kg < 0:
+        return None, "Invalid kg"
+    amount = _decimal(item.get("total_amount", 0))
+    if amount is None or amount < 0:
+        return None, "Invalid total_amount"
+    try:
+        bags = int(item.get("number_of_bags") or info.number_of_bags or 0)
+    except (TypeError, ValueError):
+        return None, "Invalid number_of_bags"
+
+    try:
+        # The parsers raise ValueError for well-formed but impossible values such as 2025-02-30
+        collected_at = parse_datetime(str(item.get("collected_at") or ""))
+        if collected_at is not None and timezone.is_naive(collected_at):
+            collected_at = timezone.make_aware(collected_at)
+        collection_time = parse_time(str(item.get("collection_time") or "")) or (
+            timezone.localtime(collected_at).time() if collected_at else None
+        )
+        booking_date = parse_date(str(item.get("booking_date") or "")) or (
+            timezone.localtime(collected_at).date() if collected_at else timezone.localdate()
+        )
+    except ValueError:
+        return None, "Invalid collected_at, collection_time or booking_date"
+
+    collection = WasteCollection(
+        customer_id=info.user_id,
+        collector=collector,
+        # Always the profile's local body; the client's copy may be stale or forged
+        localbody_id=info.localbody_id,
+        ward=str(item.get("ward") or info.ward or ""),
+        location=item.get("location") or info.pickup_address or "",
+        number_of_bags=bags,
+        building_no=item.get("building_no") or "",
+        street_name=item.get("street_name") or "",
+        kg=kg,
+        total_amount=amount,
+        payment_method=item.get("payment_method") or "",
+        booking_date=booking_date,
+        collection_time=collection_time,
+    )
+    try:
+        # Lengths, max_digits and choices, so one bad item cannot fail the whole bulk_create
+        collection.full_clean(exclude=UNCHECKED_FIELDS, validate_unique=False)
+    except ValidationError as exc:
+        return None, "; ".join(f"{field}: {' '.join(errors)}" for field, errors in exc.message_dict.items())
+    photo = files.get(f"photo:{item['key']}")
+    if photo is not None:
+        collection.photo = photo
+    return collection, None
+
+
+def upload_collections(collector, items, files=None):
+    """
+    Write a batch of queued collections. Returns one result per item, in order:
+        {"key": "...", "status": "created" | "duplicate" | "invalid", "id": 12, "error": "..."}
+    """
+    files = files or {}
+    results = [None] * len(items)
+    keyed = {}
+    for i, item in enumerate(items):
+        key = str(item.get("key") or "").strip() if isinstance(item, dict) else ""
+        if not key or len(key) > 64:
+            results[i] = {"key": key or None, "status": INVALID, "error": "Missing or invalid key"}
+        elif key in keyed:
+            results[i] = {"key": key, "status": DUPLICATE, "duplicate_of": keyed[key]}
+        else:
+            item["key"] = key
+            keyed[key] = i
+
+    with transaction.atomic():
+        # One upload per collector at a time, so two retries of a batch cannot both pass the key check
+        CustomUser.objects.select_for_update().filter(pk=collector.pk).first()
+        accepted = dict(
+            SyncUpload.objects.filter(collector=collector, key__in=keyed.keys()).values_list("key", "collection_id")
+        )
+        profile_ids = set()
+        for key, i in keyed.items():
+            if key not in accepted and str(items[i].get("customer_waste_info_id", "")).isdigit():
+                items[i]["customer_waste_info_id"] = int(items[i]["customer_waste_info_id"])
+                profile_ids.add(items[i]["customer_waste_info_id"])
+        profiles = CustomerWasteInfo.objects.filter(
+            pk__in=profile_ids, assigned_collector=collector
+        ).only("id", "user_id", "localbody_id", "ward", "pickup_address", "number_of_bags").in_bulk()
+
+        new = []
+        for key, i in keyed.items():
+            if key in accepted:
+                results[i] = {"key": key, "status": DUPLICATE, "id": accepted[key]}
+                continue
+            collection, error = _build_collection(collector, items[i], profiles, files)
+            if error:
+                results[i] = {"key": key, "status": INVALID, "error": error}
+            else:
+                new.append((key, i, collection))
+
+        if new:
+            created = WasteCollection.objects.bulk_create([c for _, _, c in new])
+            SyncUpload.objects.bulk_create([
+                SyncUpload(collector=collector, key=key, collection=c) for (key, _, _), c in zip(new, created)
+            ])
+            # bulk_create sends no signals; rollups, counters and the like listen for post_save
+            using = router.db_for_write(WasteCollection)
+            for collection in created:
+                post_save.send(sender=WasteCollection, instance=collection, created=True,
+                               update_fields=None, raw=False, using=using)
+            for (key, i, _), collection in zip(new, created):
+                results[i] = {"key": key, "status": CREATED, "id": collection.pk}
+
+    for i, result in enumerate(results):
+        if result.get("duplicate_of") is not None:
+            earlier = results[result.pop("duplicate_of")]
+            result["id"] = earlier.get("id")
+    return results
+
+
+# Views
+
+def _is_collector(user):
+    return user.is_authenticated and user.role == 1
+
+
+@login_required
+@require_GET
+def sync_changes(request):
+    """
+    Assignment and calendar changes since ?token= (omit for a full sync).
+    Keep calling with the returned token while "has_more" is true.
+    """
+    if not _is_collector(request.user):
+        return HttpResponseForbidden("Forbidden")
+    try:
+        token = parse_token(request.GET.get("token"))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid sync token")
+    return JsonResponse(changes_since(request.user.id, token))
+
+
+@login_required
+@require_POST
+def sync_upload(request):
+    """
+    Upload queued collections. Body is JSON {"collections": [...]}, or multipart
+    with that JSON in a "collections" field and photos as "photo:<key>" files.
+    Each item: {"key": "<client uuid>", "customer_waste_info_id": 1, "kg": "4.5",
+    "number_of_bags": 2, "total_amount": "90", "payment_method": "cash",
+    "collected_at": "2025-01-31T09:12:00+05:30", ...}
+    """
+    if not _is_collector(request.user):
+        return HttpResponseForbidden("Forbidden")
+    try:
+        if request.content_type == "multipart/form-data":
+            items = json.loads(request.POST.get("collections") or "[]")
+        else:
+            items = json.loads(request.body or "{}").get("collections", [])
+    except (json.JSONDecodeError, UnicodeDecodeError, AttributeError):
+        return HttpResponseBadRequest("Invalid JSON")
+    if not isinstance(items, list) or not items:
+        return HttpResponseBadRequest("Provide 'collections'.")
+    if len(items) > MAX_UPLOAD_ITEMS:
+        return HttpResponseBadRequest(f"At most {MAX_UPLOAD_ITEMS} collections per request")
+
+    try:
+        results = upload_collections(request.user, items, request.FILES)
+    except (InvalidOperation, ValueError, TypeError):
+        # Anything per-item validation missed; nothing was written
+        return HttpResponseBadRequest("Invalid collection data")
+    return JsonResponse({
+        "results": results,
+        "created": sum(1 for r in results if r["status"] == CREATED),
+        "duplicates": sum(1 for r in results if r["status"] == DUPLICATE),
+        "invalid": sum(1 for r in results if r["status"] == INVALID),
+    })
+
+
+# Change tracking
+
+@receiver(post_save, sender=CustomerWasteInfo)
+def log_profile_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = (old_profile(instance) or {}).get("assigned_collector_id")
+    record_profile_changes({instance.pk: instance.assigned_collector_id})
+    if old and old != instance.assigned_collector_id:
+        record_profile_changes({instance.pk: old}, deleted=True)
+
+
+@receiver(post_delete, sender=CustomerWasteInfo)
+def log_profile_delete(sender, instance, **kwargs):
+    record_profile_changes({instance.pk: instance.assigned_collector_id}, deleted=True)
+
+
+@receiver(post_save, sender=CustomerPickupDate)
+@receiver(post_delete, sender=CustomerPickupDate)
+def log_pickup_change(sender, instance, **kwargs):
+    record_profiles([instance.waste_info_id])
+
+
+@receiver(post_save, sender=LocalBodyCalendar)
+def log_calendar_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        SyncChange.objects.create(kind=CALENDAR, object_id=instance.pk, localbody_id=instance.localbody_id)
+
+
+@receiver(post_delete, sender=LocalBodyCalendar)
+def log_calendar_delete(sender, instance, **kwargs):
+    SyncChange.objects.create(kind=CALENDAR, object_id=instance.pk, localbody_id=instance.localbody_id, deleted=True)
+
+
+@receiver(post_save, sender=CustomUser)
+def log_contact_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.role != 0 or (update_fields is not None and not CONTACT_FIELDS & set(update_fields)):
+        return
+    record_profiles(CustomerWasteInfo.objects.filter(user=instance).values_list("id", flat=True))